@@ -0,0 +1,282 @@
+"""
+Начисление процентов по фактическим датам платежей.
+
+Проценты начисляются ежедневно (простые, без капитализации) на остаток
+основного долга с даты выдачи кредита. Каждый платеж применяется в свою
+дату payment_date: сначала гасит начисленные и неоплаченные проценты,
+затем основной долг.
+
+Конвенции расчета дней:
+    actual/365 - фактическое число дней, год 365 дней
+    actual/360 - фактическое число дней, год 360 дней
+    30/360     - европейский вариант (30E/360): месяц 30 дней, 31-е число
+                 считается 30-м, год 360 дней
+
+Номер дня в каждой конвенции - целое число, и разница номеров аддитивна,
+поэтому сохраненное состояние на дату X продлевается до любой даты до
+следующего платежа одним умножением, без пересчета истории.
+
+Пакетный расчет всех кредитов (ночной запуск):
+    python -m accrual run
+    python -m accrual run --as-of 2024-05-31 --convention 30/360
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime
+
+DAY_COUNT_CONVENTIONS = {
+    # Конвенция -> дней в году
+    'actual/365': 365,
+    'actual/360': 360,
+    '30/360': 360,
+}
+
+ACCRUAL_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS loan_accruals (
+        loan_id INTEGER PRIMARY KEY,
+        as_of TEXT NOT NULL,
+        convention TEXT NOT NULL,
+        interest_rate REAL NOT NULL,
+        principal_outstanding REAL NOT NULL,
+        interest_unpaid REAL NOT NULL,
+        interest_accrued REAL NOT NULL,
+        interest_paid REAL NOT NULL,
+        principal_paid REAL NOT NULL,
+        overpaid REAL NOT NULL,
+        next_payment_date TEXT,
+        run_id INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS accrual_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        as_of TEXT NOT NULL,
+        convention TEXT NOT NULL,
+        loans_count INTEGER NOT NULL,
+        payments_count INTEGER NOT NULL,
+        duration_ms REAL NOT NULL,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+ACCRUAL_FIELDS = ('principal_outstanding', 'interest_unpaid', 'interest_accrued', 'interest_paid',
+                  'principal_paid', 'overpaid')
+
+
+def parse_date(value):
+    """'YYYY-MM-DD' -> date или None"""
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+
+
+def day_number(day, convention):
+    """Номер дня: разность номеров - число дней между датами в конвенции"""
+    if convention == '30/360':
+        return day.year * 360 + day.month * 30 + min(day.day, 30)
+    return day.toordinal()
+
+
+class Accrual:
+    """Состояние начисления по одному кредиту"""
+
+    __slots__ = ('rate', 'basis', 'convention', 'day', 'principal_outstanding', 'interest_unpaid',
+                 'interest_accrued', 'interest_paid', 'principal_paid', 'overpaid')
+
+    def __init__(self, amount, interest_rate, start_day, convention):
+        self.convention = convention
+        self.rate = interest_rate / 100
+        self.basis = DAY_COUNT_CONVENTIONS[convention]
+        self.day = day_number(start_day, convention)
+        self.principal_outstanding = float(amount)
+        self.interest_unpaid = 0.0
+        self.interest_accrued = 0.0
+        self.interest_paid = 0.0
+        self.principal_paid = 0.0
+        self.overpaid = 0.0
+
+    def accrue_to(self, day):
+        """Начисляет проценты до даты day (платежи до даты выдачи - в дату выдачи)"""
+        number = day_number(day, self.convention)
+        if number > self.day:
+            interest = self.principal_outstanding * self.rate * (number - self.day) / self.basis
+            self.interest_unpaid += interest
+            self.interest_accrued += interest
+            self.day = number
+
+    def apply_payment(self, day, amount):
+        self.accrue_to(day)
+        to_interest = min(amount, self.interest_unpaid)
+        self.interest_unpaid -= to_interest
+        self.interest_paid += to_interest
+        to_principal = min(amount - to_interest, self.principal_outstanding)
+        self.principal_outstanding -= to_principal
+        self.principal_paid += to_principal
+        self.overpaid += amount - to_interest - to_principal
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in ACCRUAL_FIELDS}
+
+
+def accrue_loan(amount, interest_rate, start_date, payments, as_of, convention='actual/365'):
+    """Состояние кредита на дату as_of
+
+    payments - [(payment_date, amount)] в любом порядке; платежи позже
+    as_of и с неверной датой не учитываются. Возвращает словарь с полями
+    ACCRUAL_FIELDS и next_payment_date (первый платеж после as_of), или
+    None, если дата выдачи неверная.
+    """
+    start_day = parse_date(start_date)
+    if start_day is None:
+        return None
+    state = Accrual(amount, interest_rate, start_day, convention)
+    next_payment_date = None
+    dated = [(parse_date(payment_date), payment_amount) for payment_date, payment_amount in payments]
+    for payment_day, payment_amount in sorted(p for p in dated if p[0] is not None):
+        if payment_day > as_of:
+            next_payment_date = payment_day.isoformat()
+            break
+        state.apply_payment(payment_day, payment_amount)
+    state.accrue_to(as_of)
+    result = state.as_dict()
+    result['next_payment_date'] = next_payment_date
+    return result
+
+
+def extend(stored, as_of, convention):
+    """Продлевает сохраненное состояние до as_of без чтения платежей
+
+    stored - строка loan_accruals в виде словаря. Возвращает None, если
+    продлить нельзя: другая конвенция, дата раньше расчета или между ними
+    есть платеж.
+    """
+    stored_as_of = parse_date(stored['as_of'])
+    if stored['convention'] != convention or stored_as_of is None or as_of < stored_as_of:
+        return None
+    if stored['next_payment_date'] and as_of >= parse_date(stored['next_payment_date']):
+        return None
+    days = day_number(as_of, convention) - day_number(stored_as_of, convention)
+    interest = (stored['principal_outstanding'] * stored['interest_rate'] / 100
+                * days / DAY_COUNT_CONVENTIONS[convention])
+    result = {field: stored[field] for field in ACCRUAL_FIELDS}
+    result['interest_unpaid'] += interest
+    result['interest_accrued'] += interest
+    result['next_payment_date'] = stored['next_payment_date']
+    return result
+
+
+def load_stored(cursor, loan_id):
+    """Сохраненный пакетным расчетом результат по кредиту или None"""
+    cursor.execute('''
+        SELECT as_of, convention, interest_rate, principal_outstanding, interest_unpaid, interest_accrued,
+               interest_paid, principal_paid, overpaid, next_payment_date
+        FROM loan_accruals WHERE loan_id = ?
+    ''', (loan_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(('as_of', 'convention', 'interest_rate') + ACCRUAL_FIELDS + ('next_payment_date',), row))
+
+
+def invalidate(cursor, loan_id):
+    """Сбрасывает сохраненный результат после изменения платежей кредита"""
+    cursor.execute('DELETE FROM loan_accruals WHERE loan_id = ?', (loan_id,))
+
+
+def run_accruals(conn, as_of, convention='actual/365'):
+    """Пересчитывает все кредиты базы на дату as_of и сохраняет результат
+
+    Кредиты и платежи читаются двумя запросами, отсортированными по
+    loan_id, и обходятся одним проходом слиянием; результаты пишутся одним
+    executemany. Чтение, расчет и запись идут в одной транзакции BEGIN
+    IMMEDIATE: платеж, записанный во время расчета, ждет ее окончания, и
+    его invalidate не затирается результатом без этого платежа.
+    Возвращает словарь с итогами запуска.
+    """
+    started = time.perf_counter()
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        run_id, loans_count, payments_count = _store_accruals(conn, as_of, convention, started)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'run_id': run_id, 'as_of': as_of.isoformat(), 'convention': convention,
+            'loans': loans_count, 'payments': payments_count,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _store_accruals(conn, as_of, convention, started):
+    loans = conn.execute('SELECT id, amount, interest_rate, start_date FROM loans ORDER BY id').fetchall()
+    payments = conn.execute('''
+        SELECT loan_id, payment_date, amount FROM payments ORDER BY loan_id, payment_date, id
+    ''').fetchall()
+
+    rows = []
+    position = 0
+    for loan_id, amount, interest_rate, start_date in loans:
+        while position < len(payments) and payments[position][0] < loan_id:
+            position += 1
+        loan_payments = []
+        while position < len(payments) and payments[position][0] == loan_id:
+            loan_payments.append(payments[position][1:])
+            position += 1
+        result = accrue_loan(amount, interest_rate, start_date, loan_payments, as_of, convention)
+        if result is not None:
+            rows.append((loan_id, as_of.isoformat(), convention, interest_rate)
+                        + tuple(result[field] for field in ACCRUAL_FIELDS) + (result['next_payment_date'],))
+
+    duration_ms = (time.perf_counter() - started) * 1000
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO accrual_runs (as_of, convention, loans_count, payments_count, duration_ms)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (as_of.isoformat(), convention, len(rows), len(payments), duration_ms))
+    run_id = cursor.lastrowid
+    # Удаленные кредиты не должны оставлять устаревших строк
+    cursor.execute('DELETE FROM loan_accruals')
+    cursor.executemany(f'''
+        INSERT INTO loan_accruals (loan_id, as_of, convention, interest_rate, {', '.join(ACCRUAL_FIELDS)},
+                                   next_payment_date, run_id)
+        VALUES ({', '.join('?' * (len(ACCRUAL_FIELDS) + 5))}, {run_id})
+    ''', rows)
+    return run_id, len(rows), len(payments)
+
+
+def main():
+    from app import app, get_db_connection, get_shard_router
+
+    parser = argparse.ArgumentParser(description='Начисление процентов по кредитам')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help='Пересчитать все кредиты и сохранить результат')
+    run.add_argument('--as-of', help='Дата расчета YYYY-MM-DD (по умолчанию сегодня)')
+    run.add_argument('--convention', choices=sorted(DAY_COUNT_CONVENTIONS),
+                     help='Конвенция расчета дней (по умолчанию ACCRUAL_DAY_COUNT)')
+    args = parser.parse_args()
+
+    as_of = parse_date(args.as_of) if args.as_of else date.today()
+    if as_of is None:
+        parser.error('Неверная дата --as-of, ожидается YYYY-MM-DD')
+    convention = args.convention or app.config['ACCRUAL_DAY_COUNT']
+
+    connections = [('global', get_db_connection())]
+    if app.config['SHARDING_ENABLED']:
+        router = get_shard_router()
+        connections += [(f'lender_{lender_id}', router.connect(lender_id, create=False))
+                        for lender_id in router.shard_ids()]
+    result = {}
+    for name, conn in connections:
+        try:
+            result[name] = run_accruals(conn, as_of, convention)
+        finally:
+            conn.close()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,40 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
-from flask_wtf.csrf import CSRFProtect
-from flask_talisman import Talisman
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from wtforms import Form, StringField, IntegerField, FloatField, validators
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, session, send_file
 import sqlite3
+import heapq
 import json
 import re
 import os
 import hashlib
+import mimetypes
 import bcrypt
 import secrets
 import logging
+import queue
+import time
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_HALF_UP
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
+from metrics import INPUT_VALIDATION, ProfiledConnection, RATELIMIT_CHECK, REPLICA_READ_AGE, REPLICA_REFRESH, init_metrics
+from ratelimit import RateLimiter, create_store, parse_limits
+from sessions import ServerSessionInterface, create_session_store
+from events import create_broker, format_sse
+from serialization import json_response, streaming_list_response
+from sharding import ShardRouter, lender_for_id
+from replica import SnapshotReplica
+import ledger
+import accrual
+import idempotency
+import assets
+import archive
+from overview import VERSIONS_SCHEMA, OverviewCache, build_overview, bump_version, read_version
+from validation import LazySchema, coerce_int, parse_number
+from memory import init_memory, row_budget
+
+try:
+    import fcntl  # Блокировка файла инициализации (только POSIX)
+except ImportError:
+    fcntl = None
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +45,12 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'static/uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+# Предел тела JSON-запроса: больше - 413 до разбора JSON (файлы ограничены MAX_CONTENT_LENGTH)
+app.config['MAX_JSON_BODY_KB'] = int(os.environ.get('MAX_JSON_BODY_KB', 256))
+# Архив чеков погашенных кредитов (python -m archive run): каталог пакетов, возраст файлов и размер пакета
+app.config['ARCHIVE_FOLDER'] = os.environ.get('ARCHIVE_FOLDER', 'archive')
+app.config['ARCHIVE_MIN_AGE_DAYS'] = float(os.environ.get('ARCHIVE_MIN_AGE_DAYS', 30))
+app.config['ARCHIVE_PACK_SIZE_MB'] = float(os.environ.get('ARCHIVE_PACK_SIZE_MB', 256))
 
 # Session configuration
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)  # Сессия на 24 часа
@@ -33,22 +58,226 @@ app.config['SESSION_COOKIE_SECURE'] = False  # Для HTTP (не HTTPS)
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 
+# Хранилище сессий: sqlite:///, redis://, memory:// или cookie (подписанные cookie Flask, без отзыва)
+app.config['SESSION_STORAGE_URL'] = os.environ.get('SESSION_STORAGE_URL') or 'sqlite:///sessions.db'
+app.config['SESSION_CACHE_SECONDS'] = float(os.environ.get('SESSION_CACHE_SECONDS', 5))
+app.config['SESSION_SWEEP_SECONDS'] = float(os.environ.get('SESSION_SWEEP_SECONDS', 600))
+if app.config['SESSION_STORAGE_URL'] != 'cookie':
+    app.session_interface = ServerSessionInterface(create_session_store(app.config['SESSION_STORAGE_URL']),
+                                                   cache_seconds=app.config['SESSION_CACHE_SECONDS'],
+                                                   sweep_seconds=app.config['SESSION_SWEEP_SECONDS'])
+
+# Database configuration
+app.config['DATABASE_PATH'] = os.environ.get('DATABASE_URL', 'sqlite:///loans.db').replace('sqlite:///', '', 1)
+
+# Шардирование: кредиты и платежи каждого кредитодателя в отдельном файле SQLite
+app.config['SHARDING_ENABLED'] = os.environ.get('SHARDING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+app.config['SHARD_DIR'] = os.environ.get('SHARD_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(app.config['DATABASE_PATH'])), 'shards')
+
+# Снимок базы для списков и отчетов (online backup API), чтобы длинные чтения не мешали записи
+app.config['REPLICA_ENABLED'] = os.environ.get('REPLICA_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+app.config['REPLICA_PATH'] = os.environ.get('REPLICA_PATH') or app.config['DATABASE_PATH'] + '.replica'
+app.config['REPLICA_MAX_STALENESS'] = float(os.environ.get('REPLICA_MAX_STALENESS', 30))
+app.config['REPLICA_REFRESH_SECONDS'] = float(os.environ.get('REPLICA_REFRESH_SECONDS', 10))
+app.config['REPLICA_BACKUP_PAGES'] = int(os.environ.get('REPLICA_BACKUP_PAGES', 256))
+app.config['REPLICA_AUTO_REFRESH'] = os.environ.get('REPLICA_AUTO_REFRESH', 'true').lower() in ('1', 'true', 'yes')
+
+# Резервные копии (python -m backup create): каталог, порция online backup API и пауза между порциями, сколько копий хранить
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', 'backups')
+app.config['BACKUP_PAGES_PER_STEP'] = int(os.environ.get('BACKUP_PAGES_PER_STEP', 256))
+app.config['BACKUP_STEP_SLEEP'] = float(os.environ.get('BACKUP_STEP_SLEEP', 0.005))
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', 14))
+
+# Журнал изменений: контрольная точка баланса каждые N событий по кредиту
+app.config['LEDGER_CHECKPOINT_EVERY'] = int(os.environ.get('LEDGER_CHECKPOINT_EVERY', 50))
+
+# Начисление процентов по фактическим датам платежей: actual/365, actual/360 или 30/360
+app.config['ACCRUAL_DAY_COUNT'] = os.environ.get('ACCRUAL_DAY_COUNT', 'actual/365')
+if app.config['ACCRUAL_DAY_COUNT'] not in accrual.DAY_COUNT_CONVENTIONS:
+    raise ValueError(f"Неизвестная конвенция ACCRUAL_DAY_COUNT: {app.config['ACCRUAL_DAY_COUNT']}")
+
 # Logging configuration
 logging.basicConfig(
     level=os.environ.get('LOG_LEVEL', 'INFO'),
     format='%(asctime)s %(levelname)s %(name)s %(message)s'
 )
 
+# Метрики запросов и профилирование SQL
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 1000))
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')  # Общий каталог для нескольких воркеров
+init_metrics(app)
+
+# Память запросов: замеры (off, rss или tracemalloc) и доля замеряемых запросов,
+# бюджет одного запроса (больше - списки отдаются потоком) и RSS воркера (больше - перезапуск), 0 - без ограничения
+app.config['MEMORY_TRACKING'] = os.environ.get('MEMORY_TRACKING', 'off')
+app.config['MEMORY_SAMPLE_RATE'] = float(os.environ.get('MEMORY_SAMPLE_RATE', 1.0))
+app.config['MEMORY_REQUEST_BUDGET_MB'] = float(os.environ.get('MEMORY_REQUEST_BUDGET_MB', 64))
+app.config['MEMORY_WORKER_BUDGET_MB'] = float(os.environ.get('MEMORY_WORKER_BUDGET_MB', 0))
+init_memory(app)
+
+# Сжатие JSON списков в приложении с кэшем сжатых ответов (nginx не сжимает повторно)
+app.config['JSON_GZIP_MIN_SIZE'] = int(os.environ.get('JSON_GZIP_MIN_SIZE', 1024))
+app.config['JSON_GZIP_LEVEL'] = int(os.environ.get('JSON_GZIP_LEVEL', 6))
+app.config['JSON_GZIP_CACHE_SIZE'] = int(os.environ.get('JSON_GZIP_CACHE_SIZE', 256))
+
+# Rate limiting: token bucket на пользователя и IP в общем для воркеров хранилище
+app.config['RATELIMIT_ENABLED'] = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+app.config['RATELIMIT_STORAGE_URL'] = (os.environ.get('RATELIMIT_STORAGE_URL') or os.environ.get('REDIS_URL')
+                                       or 'sqlite:///ratelimit.db')
+app.config['RATELIMIT_TRUST_PROXY'] = os.environ.get('RATELIMIT_TRUST_PROXY', 'false').lower() in ('1', 'true', 'yes')
+app.config['RATELIMITS'] = {
+    'login': {
+        'ip': os.environ.get('RATELIMIT_LOGIN_IP', '20/minute'),
+        'user': os.environ.get('RATELIMIT_LOGIN_USER', '5/minute'),
+    },
+    'payments': {
+        'ip': os.environ.get('RATELIMIT_PAYMENTS_IP', '60/minute'),
+        'user': os.environ.get('RATELIMIT_PAYMENTS_USER', '20/minute'),
+    },
+    'calculate': {
+        'ip': os.environ.get('RATELIMIT_CALCULATE_IP', '120/minute'),
+        'user': os.environ.get('RATELIMIT_CALCULATE_USER', '60/minute'),
+    },
+}
+# Неверный лимит (например "0/minute") - ошибка при запуске, а не 500 на каждом запросе
+parse_limits(app.config['RATELIMITS'])
+
+# Повтор запросов с заголовком Idempotency-Key: сколько хранить ответ и когда считать запрос упавшим
+app.config['IDEMPOTENCY_TTL_HOURS'] = float(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24))
+app.config['IDEMPOTENCY_PENDING_TIMEOUT'] = float(os.environ.get('IDEMPOTENCY_PENDING_TIMEOUT', 60))
+
+# Сводка закредитованного (/api/me/overview): сколько секунд хранить в кэше процесса и сколько последних платежей отдавать
+app.config['OVERVIEW_CACHE_SECONDS'] = float(os.environ.get('OVERVIEW_CACHE_SECONDS', 10))
+app.config['OVERVIEW_RECENT_PAYMENTS'] = int(os.environ.get('OVERVIEW_RECENT_PAYMENTS', 3))
+
+# Push-уведомления (SSE) об изменениях кредитов и платежей.
+# Каждый открытый поток занимает поток воркера: включать с GUNICORN_PROFILE=gthread или asgi.
+app.config['EVENTS_ENABLED'] = os.environ.get('EVENTS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+app.config['EVENTS_BACKEND'] = os.environ.get('EVENTS_BACKEND', 'sqlite')  # sqlite, redis или memory
+app.config['EVENTS_REDIS_URL'] = os.environ.get('EVENTS_REDIS_URL') or os.environ.get('REDIS_URL')
+app.config['EVENTS_POLL_INTERVAL'] = float(os.environ.get('EVENTS_POLL_INTERVAL', 1.0))
+app.config['EVENTS_HEARTBEAT_SECONDS'] = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+app.config['EVENTS_MAX_STREAM_SECONDS'] = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS', 300))
+
+_rate_limiter = None
+
+def get_rate_limiter():
+    """Лимитер создается при первом запросе, уже внутри воркера"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(create_store(app.config['RATELIMIT_STORAGE_URL']), app.config['RATELIMITS'])
+    return _rate_limiter
+
+def client_ip():
+    """IP клиента с учетом заголовков nginx, если им доверяем"""
+    if app.config['RATELIMIT_TRUST_PROXY']:
+        forwarded = request.headers.get('X-Real-IP') or request.headers.get('X-Forwarded-For', '').split(',')[0].strip()
+        if forwarded:
+            return forwarded
+    return request.remote_addr
+
+def rate_limited(name):
+    """Декоратор ограничения частоты запросов по IP и пользователю"""
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            # Ограничиваем только изменяющие запросы
+            if not app.config['RATELIMIT_ENABLED'] or request.method == 'GET':
+                return f(*args, **kwargs)
+            
+            started = time.perf_counter()
+            ip = client_ip()
+            user = session.get('user_id')
+            if user is None and name == 'login':
+                # До входа ограничиваем попытки по имени пользователя с этого IP: корзина только
+                # по имени позволила бы любому заблокировать вход чужой учетной записи
+                data = request_json_object()[0] if request.is_json else request.form
+                username = (data or {}).get('username')
+                user = f'{username}|{ip}' if username is not None else None
+            identities = {'ip': ip, 'user': str(user) if user is not None else None}
+            allowed, retry_after, remaining = get_rate_limiter().check(name, identities)
+            RATELIMIT_CHECK.observe(time.perf_counter() - started, name, 'true' if allowed else 'false')
+            
+            if not allowed:
+                response = jsonify({'error': 'Слишком много запросов, попробуйте позже'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+                return response
+            return f(*args, **kwargs)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+_idempotency_swept_at = 0.0
+
+def idempotent(f):
+    """Декоратор: повтор запроса с тем же Idempotency-Key получает сохраненный ответ
+
+    Без заголовка запрос выполняется как обычно. Ответы 5xx и 429 не
+    сохраняются: повтор такого запроса выполняется заново.
+    """
+    def decorated_function(*args, **kwargs):
+        global _idempotency_swept_at
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return f(*args, **kwargs)
+        if not idempotency.KEY_RE.match(key):
+            return jsonify({'error': 'Idempotency-Key: от 1 до 255 печатных ASCII-символов без пробелов'}), 400
+        
+        user_id = session['user_id']
+        conn = get_db_connection()
+        try:
+            state, stored = idempotency.claim(conn, user_id, key, idempotency.fingerprint(request),
+                                              app.config['IDEMPOTENCY_PENDING_TIMEOUT'])
+            if state == idempotency.MISMATCH:
+                return jsonify({'error': 'Idempotency-Key уже использован для запроса с другими параметрами'}), 422
+            if state == idempotency.IN_PROGRESS:
+                response = jsonify({'error': 'Запрос с этим Idempotency-Key еще выполняется'})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            if state == idempotency.REPLAY:
+                status_code, mimetype, body = stored
+                response = Response(body, status=status_code, mimetype=mimetype)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            
+            try:
+                response = app.make_response(f(*args, **kwargs))
+            except Exception:
+                idempotency.release(conn, user_id, key)
+                raise
+            if response.status_code >= 500 or response.status_code == 429:
+                idempotency.release(conn, user_id, key)
+            else:
+                idempotency.store_response(conn, user_id, key, response.status_code, response.mimetype,
+                                           response.get_data())
+            
+            # Устаревшие ключи удаляет первый запрос после интервала в каждом воркере
+            if time.time() - _idempotency_swept_at > 600:
+                _idempotency_swept_at = time.time()
+                idempotency.sweep(conn, time.time() - app.config['IDEMPOTENCY_TTL_HOURS'] * 3600)
+            return response
+        finally:
+            conn.close()
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
 # Временно отключаем CSRF защиту для отладки
+# from flask_wtf.csrf import CSRFProtect
 # csrf = CSRFProtect(app)
 
 # API эндпоинт для входа
 @app.route('/api/login', methods=['POST'])
+@rate_limited('login')
 def api_login():
     """API для входа в систему"""
     # Проверяем, это JSON или форма
     if request.is_json:
-        data = request.get_json()
+        data, error = request_json_object()
+        if error is not None:
+            return error
         username = data.get('username')
         password = data.get('password')
     else:
@@ -56,12 +285,7 @@ def api_login():
         username = request.form.get('username')
         password = request.form.get('password')
     
-    conn = sqlite3.connect('loans.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT id, username, password_hash, role FROM users WHERE username = ?', (username,))
-    user = cursor.fetchone()
-    conn.close()
-    
+    user = find_login_user(username, password)
     if user and verify_password(password, user[2]):
         session['user_id'] = user[0]
         session['username'] = user[1]
@@ -81,30 +305,88 @@ def api_login():
             return render_template('login.html', error='Неверное имя пользователя или пароль')
 
 # Временно отключаем security headers для отладки
+# from flask_talisman import Talisman
 # Talisman(app, force_https=False)  # force_https=False для разработки
 
 # Временно отключаем rate limiting для отладки
+# from flask_limiter import Limiter
+# from flask_limiter.util import get_remote_address
 # limiter = Limiter(
 #     key_func=get_remote_address,
 #     default_limits=["200 per day", "50 per hour"]
 # )
 # limiter.init_app(app)
 
-# Формы валидации
-class LoginForm(Form):
-    username = StringField('Username', [validators.Length(min=3, max=20), validators.Regexp(r'^[a-zA-Z0-9_]+$', message='Только буквы, цифры и подчеркивания')])
-    password = StringField('Password', [validators.Length(min=4, max=100)])
+# Формы валидации описаны в forms.py и компилируются в схемы при первой проверке
+# (validation.py): WTForms не импортируется вместе с app.py, проверка запроса не создает его объекты
+LOGIN_SCHEMA = LazySchema('LoginForm')
+CREATE_BORROWER_SCHEMA = LazySchema('CreateBorrowerForm')
+LOAN_SCHEMA = LazySchema('LoanForm')
+CALCULATE_SCHEMA = LazySchema('CalculateForm')
+PAYMENT_SCHEMA = LazySchema('PaymentForm')
 
-class CreateBorrowerForm(Form):
-    username = StringField('Username', [validators.Length(min=3, max=20), validators.Regexp(r'^[a-zA-Z0-9_]+$', message='Только буквы, цифры и подчеркивания')])
-    password = StringField('Password', [validators.Length(min=4, max=100)])
-    full_name = StringField('Full Name', [validators.Length(min=2, max=100), validators.Regexp(r'^[а-яА-Яa-zA-Z\s]+$', message='Только буквы и пробелы')])
+FORM_MIMETYPES = ('multipart/form-data', 'application/x-www-form-urlencoded')
 
-class LoanForm(Form):
-    amount = IntegerField('Amount', [validators.NumberRange(min=1000, max=10000000, message='Сумма от 1,000 до 10,000,000')])
-    interest_rate = FloatField('Interest Rate', [validators.NumberRange(min=0, max=50, message='Процентная ставка от 0 до 50')])
-    term_months = IntegerField('Term Months', [validators.NumberRange(min=1, max=600, message='Срок от 1 до 600 месяцев')])
-    borrower_id = IntegerField('Borrower ID', [validators.NumberRange(min=1, message='Неверный ID закредитованного')])
+def request_json_object():
+    """Тело JSON-запроса как словарь: (данные, None) или (None, ответ 413/400)
+
+    Размер проверяется по Content-Length до чтения тела. Пустое тело - пустой словарь.
+    """
+    limit = app.config['MAX_JSON_BODY_KB'] * 1024
+    if request.content_length is not None and request.content_length > limit:
+        return None, (jsonify({'error': f'Тело запроса больше {app.config["MAX_JSON_BODY_KB"]} КБ'}), 413)
+    if not request.get_data(cache=True):
+        return {}, None
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify({'error': 'Тело запроса должно быть JSON-объектом'}), 400)
+    return data, None
+
+def validated_input(schema=None):
+    """Декоратор: проверка тела запроса до обращения к базе и расчетов
+
+    JSON больше MAX_JSON_BODY_KB - 413, не объект - 400; поля формы
+    (multipart с файлом) проверяются по той же схеме. Значения схемы,
+    приведенные к типам, передаются обработчику в g.input; без схемы
+    в g.input - разобранный объект как есть.
+    """
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            if request.mimetype in FORM_MIMETYPES:
+                data = request.form
+            else:
+                data, error = request_json_object()
+                if error is not None:
+                    return error
+            if schema is None:
+                g.input = data
+            else:
+                started = time.perf_counter()
+                g.input, error = schema.validate(data)
+                INPUT_VALIDATION.observe(time.perf_counter() - started, f.__name__,
+                                         'true' if error is None else 'false')
+                if error is not None:
+                    field, message = error
+                    return jsonify({'error': message, 'field': field}), 400
+            return f(*args, **kwargs)
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+def find_login_user(username, password):
+    """Пользователь для входа или None
+
+    Имя и пароль вне границ формы входа не могут быть верными: такой
+    запрос не доходит до базы и bcrypt.
+    """
+    if LOGIN_SCHEMA.validate({'username': username, 'password': password})[1] is not None:
+        return None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, username, password_hash, role FROM users WHERE username = ?', (username,))
+    user = cursor.fetchone()
+    conn.close()
+    return user
 
 # Настройки для загрузки файлов
 UPLOAD_FOLDER = 'static/uploads'
@@ -171,9 +453,112 @@ def verify_password(password, hashed):
     """Проверяет пароль против хеша"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def get_db_connection():
+    """Открывает соединение с базой данных с профилированием запросов"""
+    return sqlite3.connect(app.config['DATABASE_PATH'], factory=ProfiledConnection)
+
+_shard_router = None
+
+def get_shard_router():
+    global _shard_router
+    if _shard_router is None:
+        _shard_router = ShardRouter(app.config['DATABASE_PATH'], app.config['SHARD_DIR'],
+                                    [LOANS_TABLE_SQL, PAYMENTS_TABLE_SQL, PAYMENTS_INDEX_SQL, LOANS_BORROWER_INDEX_SQL, VERSIONS_SCHEMA] + ledger.LEDGER_SCHEMA + accrual.ACCRUAL_SCHEMA,
+                                    factory=ProfiledConnection)
+    return _shard_router
+
+_replica = None
+
+def get_replica(start_refresh=True):
+    """Снимок базы для чтения или None, если он отключен
+
+    В режиме шардирования снимок не используется: записи кредитодателей
+    уже разнесены по файлам и не мешают чтению других.
+    """
+    global _replica
+    if not app.config['REPLICA_ENABLED'] or app.config['SHARDING_ENABLED']:
+        return None
+    if _replica is None:
+        _replica = SnapshotReplica(app.config['DATABASE_PATH'], app.config['REPLICA_PATH'],
+                                   max_staleness=app.config['REPLICA_MAX_STALENESS'],
+                                   refresh_interval=app.config['REPLICA_REFRESH_SECONDS'],
+                                   pages_per_step=app.config['REPLICA_BACKUP_PAGES'],
+                                   factory=ProfiledConnection,
+                                   on_refresh=REPLICA_REFRESH.observe)
+    if start_refresh and app.config['REPLICA_AUTO_REFRESH']:
+        _replica.ensure_refreshing()
+    return _replica
+
+def get_read_connection():
+    """Соединение для списков и отчетов: снимок, если он достаточно свежий
+
+    Снимок должен быть сделан после последней записи пользователя
+    (session['last_write_at']), чтобы пользователь видел свои изменения.
+    """
+    replica = get_replica()
+    if replica is not None:
+        conn = replica.connect(min_snapshot_at=session.get('last_write_at', 0))
+        if conn is not None:
+            g.read_source = 'replica'
+            REPLICA_READ_AGE.observe(replica.age() or 0.0, 'replica')
+            return conn
+        g.read_source = 'primary'
+        REPLICA_READ_AGE.observe(replica.age() or 0.0, 'primary')
+    return get_db_connection()
+
+def writes_data(f):
+    """Декоратор изменяющих эндпоинтов: запоминает время успешной записи для read-your-writes
+
+    Только на настоящих записях: вход, расчеты и моделирование не меняют
+    данные и не должны переводить чтение на основную базу и менять сессию.
+    """
+    def decorated_function(*args, **kwargs):
+        response = app.make_response(f(*args, **kwargs))
+        if app.config['REPLICA_ENABLED'] and response.status_code < 400 and 'user_id' in session:
+            session['last_write_at'] = time.time()
+        return response
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+@app.after_request
+def add_read_source(response):
+    if 'read_source' in g:
+        response.headers['X-Read-Source'] = g.read_source
+    return response
+
+def get_shard_connection(lender_id, read_only=False):
+    """Соединение с базой кредитов кредитодателя (создает шард при необходимости)"""
+    if not app.config['SHARDING_ENABLED']:
+        return get_read_connection() if read_only else get_db_connection()
+    return get_shard_router().connect(lender_id)
+
+def get_loan_connection(record_id, read_only=False):
+    """Соединение с базой, где хранится кредит или платеж с этим id"""
+    if not app.config['SHARDING_ENABLED']:
+        return get_read_connection() if read_only else get_db_connection()
+    conn = get_shard_router().connect(lender_for_id(record_id), create=False)
+    # Для id без шарда запросы к пустым таблицам общей базы вернут "не найдено"
+    return conn if conn is not None else get_db_connection()
+
+def get_borrower_connections(borrower_id, read_only=False):
+    """Соединения со всеми базами, где могут быть кредиты закредитованного"""
+    if not app.config['SHARDING_ENABLED']:
+        return [get_read_connection() if read_only else get_db_connection()]
+    conn = get_db_connection()
+    lender_ids = [row[0] for row in conn.execute(
+        'SELECT lender_id FROM borrower_lenders WHERE borrower_id = ?', (borrower_id,))]
+    conn.close()
+    router = get_shard_router()
+    return [c for c in (router.connect(lender_id, create=False) for lender_id in lender_ids) if c is not None]
+
+def record_ledger_event(cursor, event_type, loan_id, lender_id, borrower_id, **fields):
+    """Пишет событие в журнал в транзакции изменения (до commit)"""
+    return ledger.append_event(cursor, event_type, loan_id, lender_id, borrower_id,
+                               checkpoint_every=app.config['LEDGER_CHECKPOINT_EVERY'], **fields)
+
 def create_default_users():
     """Создает пользователей по умолчанию"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Проверяем, есть ли уже пользователи
@@ -217,7 +602,7 @@ def role_required(required_role):
 
 def get_borrowers():
     """Получить список всех закредитованных пользователей"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT id, username, full_name FROM users WHERE role = "borrower"')
     borrowers = cursor.fetchall()
@@ -227,7 +612,7 @@ def get_borrowers():
 
 def get_borrower_credentials(borrower_id):
     """Получить учетные данные закредитованного пользователя"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT username FROM users WHERE id = ? AND role = "borrower"', (borrower_id,))
     result = cursor.fetchone()
@@ -239,7 +624,7 @@ def get_borrower_credentials(borrower_id):
 
 def create_borrower(username, password, full_name):
     """Создать нового закредитованного пользователя"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Проверяем, не существует ли уже пользователь с таким именем
@@ -263,7 +648,7 @@ def create_borrower(username, password, full_name):
 
 def delete_borrower(borrower_id):
     """Удалить закредитованного пользователя с каскадным удалением"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Проверяем, что пользователь существует и является закредитованным
@@ -276,24 +661,41 @@ def delete_borrower(borrower_id):
     
     username = borrower[0]
     
-    # Получаем все кредиты этого закредитованного
-    cursor.execute('SELECT id FROM loans WHERE borrower_id = ?', (borrower_id,))
-    loan_ids = [row[0] for row in cursor.fetchall()]
-    
-    # Удаляем все платежи по кредитам этого закредитованного
-    if loan_ids:
-        placeholders = ','.join(['?' for _ in loan_ids])
-        cursor.execute(f'DELETE FROM payments WHERE loan_id IN ({placeholders})', loan_ids)
-    
-    # Удаляем все кредиты этого закредитованного
-    cursor.execute('DELETE FROM loans WHERE borrower_id = ?', (borrower_id,))
+    loan_ids = []
+    for loans_conn in get_borrower_connections(borrower_id):
+        loans_cursor = loans_conn.cursor()
+        
+        # Получаем все кредиты этого закредитованного
+        loans_cursor.execute('SELECT id, lender_id FROM loans WHERE borrower_id = ?', (borrower_id,))
+        conn_loans = loans_cursor.fetchall()
+        conn_loan_ids = [row[0] for row in conn_loans]
+        for loan_id, lender_id in conn_loans:
+            record_ledger_event(loans_cursor, 'loan_deleted', loan_id, lender_id, borrower_id)
+            accrual.invalidate(loans_cursor, loan_id)
+        
+        # Удаляем все платежи по кредитам этого закредитованного
+        if conn_loan_ids:
+            placeholders = ','.join(['?' for _ in conn_loan_ids])
+            loans_cursor.execute(f'DELETE FROM payments WHERE loan_id IN ({placeholders})', conn_loan_ids)
+        
+        # Удаляем все кредиты этого закредитованного
+        loans_cursor.execute('DELETE FROM loans WHERE borrower_id = ?', (borrower_id,))
+        loans_conn.commit()
+        loans_conn.close()
+        loan_ids.extend(conn_loan_ids)
     
     # Удаляем самого пользователя
+    cursor.execute('DELETE FROM borrower_lenders WHERE borrower_id = ?', (borrower_id,))
     cursor.execute('DELETE FROM users WHERE id = ?', (borrower_id,))
     
     conn.commit()
     conn.close()
     
+    # Завершаем сессии удаленного пользователя (с подписанными cookie это невозможно)
+    revoke_user_sessions = getattr(app.session_interface, 'revoke_user', None)
+    if revoke_user_sessions is not None:
+        revoke_user_sessions(borrower_id)
+    
     return {
         'success': True, 
         'message': f'Закредитованный пользователь "{username}" и все связанные данные удалены',
@@ -333,9 +735,44 @@ def calculate_last_payment_date(start_date_str, term_months):
     except (ValueError, TypeError):
         return "Неизвестно"
 
+# Таблицы кредитов и платежей: в общей базе и в шардах кредитодателей
+LOANS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS loans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lender_id INTEGER NOT NULL,
+        borrower_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        interest_rate REAL NOT NULL,
+        start_date TEXT NOT NULL,
+        term_months INTEGER NOT NULL,
+        monthly_payment REAL NOT NULL,
+        total_payment REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (lender_id) REFERENCES users (id),
+        FOREIGN KEY (borrower_id) REFERENCES users (id)
+    )
+'''
+PAYMENTS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS payments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        loan_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        payment_date TEXT NOT NULL,
+        document_path TEXT,
+        document_name TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (loan_id) REFERENCES loans (id)
+    )
+'''
+
+# Платежи кредита в порядке дат: списки, прогресс и начисление процентов
+PAYMENTS_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_payments_loan_date ON payments (loan_id, payment_date)'
+# Кредиты закредитованного: список и сводка без полного просмотра таблицы
+LOANS_BORROWER_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_loans_borrower ON loans (borrower_id)'
+
 def init_db():
     """Инициализация базы данных"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Таблица пользователей
@@ -349,34 +786,9 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS loans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            lender_id INTEGER NOT NULL,
-            borrower_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            interest_rate REAL NOT NULL,
-            start_date TEXT NOT NULL,
-            term_months INTEGER NOT NULL,
-            monthly_payment REAL NOT NULL,
-            total_payment REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (lender_id) REFERENCES users (id),
-            FOREIGN KEY (borrower_id) REFERENCES users (id)
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            loan_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            payment_date TEXT NOT NULL,
-            document_path TEXT,
-            document_name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (loan_id) REFERENCES loans (id)
-        )
-    ''')
+    cursor.execute(LOANS_TABLE_SQL)
+    cursor.execute(PAYMENTS_TABLE_SQL)
+    cursor.execute(PAYMENTS_INDEX_SQL)
     
     # Миграция: добавляем колонки document_path и document_name если их нет
     try:
@@ -419,6 +831,9 @@ def init_db():
         cursor.execute("UPDATE loans SET lender_id = ?, borrower_id = ? WHERE lender_id IS NULL OR borrower_id IS NULL", 
                       (lender_id, borrower_id))
     
+    # Индекс создается после миграции: в старых базах колонки borrower_id до нее нет
+    cursor.execute(LOANS_BORROWER_INDEX_SQL)
+    
     # Миграция: добавляем поле full_name для пользователей
     try:
         cursor.execute("ALTER TABLE users ADD COLUMN full_name TEXT")
@@ -434,12 +849,108 @@ def init_db():
     except sqlite3.OperationalError:
         pass  # Колонка уже удалена или не существует
     
+    # Журнал событий для SSE: через него воркеры передают друг другу уведомления
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            event_type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_events_user ON change_events (user_id, id)')
+    
+    # Версии сводок закредитованных (и в каждом шарде): запись увеличивает версию в своей транзакции,
+    # кэш сводки в каждом воркере сверяется с ней
+    cursor.execute(VERSIONS_SCHEMA)
+    
+    # Журнал изменений кредитов и платежей; для старых кредитов заполняется из текущих данных
+    for statement in ledger.LEDGER_SCHEMA:
+        cursor.execute(statement)
+    ledger.backfill(cursor, app.config['LEDGER_CHECKPOINT_EVERY'])
+    
+    # Результаты пакетного начисления процентов (python -m accrual run)
+    for statement in accrual.ACCRUAL_SCHEMA:
+        cursor.execute(statement)
+    
+    # Ответы на запросы с Idempotency-Key для повторов
+    for statement in idempotency.IDEMPOTENCY_SCHEMA:
+        cursor.execute(statement)
+    
+    # Индекс чеков, перенесенных в архив (python -m archive run), и итоги запусков
+    for statement in archive.ARCHIVE_SCHEMA:
+        cursor.execute(statement)
+    
+    # Шарды кредитодателей, в которых есть кредиты закредитованного (режим SHARDING_ENABLED)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS borrower_lenders (
+            borrower_id INTEGER NOT NULL,
+            lender_id INTEGER NOT NULL,
+            PRIMARY KEY (borrower_id, lender_id)
+        ) WITHOUT ROWID
+    ''')
+    
     conn.commit()
     conn.close()
     
     # Создаем пользователей по умолчанию
     create_default_users()
 
+# Версия схемы, записывается в PRAGMA user_version после миграций.
+# Увеличивается при каждом изменении init_db.
+SCHEMA_VERSION = 9
+
+_db_initialized = False
+
+def init_db_once():
+    """Однократная инициализация базы данных для всех воркеров
+
+    Миграции выполняются под файловой блокировкой только если версия схемы
+    в базе отстает от SCHEMA_VERSION. Остальные воркеры (и мастер-процесс
+    gunicorn при --preload) видят актуальную версию одним PRAGMA-запросом.
+    """
+    global _db_initialized
+    if _db_initialized:
+        return False
+
+    lock_path = app.config['DATABASE_PATH'] + '.init.lock'
+    with open(lock_path, 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            conn = get_db_connection()
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            conn.close()
+            migrated = version < SCHEMA_VERSION
+            if migrated:
+                init_db()
+                conn = get_db_connection()
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                conn.commit()
+                conn.close()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    _db_initialized = True
+    return migrated
+
+def create_app():
+    """Подготавливает базу и возвращает приложение модуля
+
+    Это не фабрика: app, конфигурация, сессии, метрики и маршруты
+    создаются при импорте модуля, create_app только выполняет миграции
+    под блокировкой (init_db_once). Безопасна для gunicorn --preload: при
+    вызове в мастер-процессе миграции выполняются один раз до fork,
+    воркеры их не повторяют.
+    """
+    started = time.perf_counter()
+    migrated = init_db_once()
+    app.logger.info('Приложение готово за %.1f мс (миграции: %s)',
+                    (time.perf_counter() - started) * 1000, 'да' if migrated else 'нет')
+    return app
+
 def calculate_loan(amount, interest_rate, term_months):
     """Расчет кредитных выплат"""
     monthly_rate = interest_rate / 100 / 12
@@ -458,7 +969,7 @@ def calculate_loan(amount, interest_rate, term_months):
 
 def recalculate_loan_after_payment(loan_id):
     """Перерасчет кредита после внесения платежа"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_loan_connection(loan_id)
     cursor = conn.cursor()
     
     # Получаем данные кредита
@@ -547,6 +1058,270 @@ def recalculate_loan_after_payment(loan_id):
         'payment_breakdown': payment_breakdown
     }
 
+# Стратегии перерасчета после досрочного платежа
+SIMULATION_STRATEGIES = ('reduce_term', 'reduce_payment')
+MAX_SIMULATION_SCENARIOS = 50
+MAX_EXTRA_PAYMENTS_PER_SCENARIO = 120
+
+def annuity_payment(principal, monthly_rate, months):
+    """Аннуитетный платеж для остатка долга на заданное число месяцев"""
+    if months <= 0:
+        return principal
+    if monthly_rate == 0:
+        return principal / months
+    growth = (1 + monthly_rate) ** months
+    return principal * monthly_rate * growth / (growth - 1)
+
+def amortization_step(balance, payment, monthly_rate, month, term_months):
+    """Основной долг и проценты регулярного платежа месяца month"""
+    interest = balance * monthly_rate
+    if month == term_months:
+        # Последний месяц закрывает остаток с учетом округлений
+        return balance, interest
+    return min(payment - interest, balance), interest
+
+def schedule_row(month, principal, interest, extra, balance):
+    return {
+        'month': month,
+        'payment': round(principal + interest),
+        'principal': round(principal),
+        'interest': round(interest),
+        'extra_payment': round(extra),
+        'balance': round(max(balance, 0))
+    }
+
+def build_amortization_schedules(amount, interest_rate, term_months, runs, include_schedule=True):
+    """Строит графики погашения для нескольких наборов досрочных платежей
+
+    runs - список (extra_payments, strategy), extra_payments - словарь
+    {номер месяца: сумма}, досрочный платеж вносится после регулярного
+    платежа этого месяца. При стратегии reduce_term платеж остается
+    прежним и сокращается срок, при reduce_payment срок сохраняется,
+    а платеж пересчитывается на оставшийся долг.
+
+    До первого досрочного платежа все графики совпадают с графиком без
+    досрочных платежей: он считается один раз, и каждый график начинается
+    с его состояния на этот месяц. Дальше все графики продвигаются вместе,
+    по месяцу за проход.
+    """
+    monthly_rate = interest_rate / 100 / 12
+    first_payment = annuity_payment(amount, monthly_rate, term_months)
+    first_extra = [min(extra, default=term_months + 1) for extra, _ in runs]
+
+    # Общий префикс: (остаток, проценты, выплачено) после каждого месяца без досрочных платежей
+    prefix = [(float(amount), 0.0, 0.0)]
+    prefix_rows = []
+    balance, total_interest, total_paid = prefix[0]
+    month = 0
+    prefix_months = min(max(first_extra, default=1) - 1, term_months)
+    while balance > 0.005 and month < prefix_months:
+        month += 1
+        principal, interest = amortization_step(balance, first_payment, monthly_rate, month, term_months)
+        balance -= principal
+        total_interest += interest
+        total_paid += principal + interest
+        prefix.append((balance, total_interest, total_paid))
+        if include_schedule:
+            prefix_rows.append(schedule_row(month, principal, interest, 0, balance))
+
+    # Состояние графика: остаток, платеж, проценты, выплачено, месяц, строки графика, досрочные платежи, стратегия
+    states = []
+    for (extra_payments, strategy), start in zip(runs, first_extra):
+        month = min(start - 1, len(prefix) - 1)
+        balance, total_interest, total_paid = prefix[month]
+        states.append([balance, first_payment, total_interest, total_paid, month,
+                       prefix_rows[:month] if include_schedule else None, extra_payments, strategy])
+
+    active = [state for state in states if state[0] > 0.005 and state[4] < term_months]
+    while active:
+        for state in active:
+            balance, payment, total_interest, total_paid, month, schedule, extra_payments, strategy = state
+            month += 1
+            principal, interest = amortization_step(balance, payment, monthly_rate, month, term_months)
+            balance -= principal
+            total_interest += interest
+            total_paid += principal + interest
+
+            extra = min(extra_payments.get(month, 0), balance)
+            if extra > 0:
+                balance -= extra
+                total_paid += extra
+                if strategy == 'reduce_payment' and balance > 0.005:
+                    payment = annuity_payment(balance, monthly_rate, term_months - month)
+
+            if schedule is not None:
+                schedule.append(schedule_row(month, principal, interest, extra, balance))
+            state[:6] = (balance, payment, total_interest, total_paid, month, schedule)
+        active = [state for state in active if state[0] > 0.005 and state[4] < term_months]
+
+    results = []
+    for _, payment, total_interest, total_paid, month, schedule, _, strategy in states:
+        result = {
+            'strategy': strategy,
+            'months': month,
+            'first_monthly_payment': round(first_payment),
+            'last_monthly_payment': round(payment),
+            'total_interest': round(total_interest),
+            'total_paid': round(total_paid)
+        }
+        if schedule is not None:
+            result['schedule'] = schedule
+        results.append(result)
+    return results
+
+def build_amortization_schedule(amount, interest_rate, term_months, extra_payments=None,
+                                strategy='reduce_term', include_schedule=True):
+    """График погашения для одного набора досрочных платежей (см. build_amortization_schedules)"""
+    return build_amortization_schedules(amount, interest_rate, term_months,
+                                        [(extra_payments or {}, strategy)], include_schedule)[0]
+
+def parse_extra_payments(items, start_date_str, term_months):
+    """Приводит список досрочных платежей к словарю {месяц: сумма}
+
+    Месяц можно указать номером (month, с 1) или датой платежа (date).
+    """
+    if not isinstance(items, list):
+        raise ValueError('extra_payments должен быть списком')
+    if len(items) > MAX_EXTRA_PAYMENTS_PER_SCENARIO:
+        raise ValueError(f'Не более {MAX_EXTRA_PAYMENTS_PER_SCENARIO} досрочных платежей в сценарии')
+
+    start_date = None
+    extra = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError('Досрочный платеж должен быть объектом')
+        # parse_number отбрасывает bool, NaN и бесконечность (1e400 в JSON)
+        amount = coerce_int(item.get('amount', 0))
+        if amount is None or amount <= 0:
+            raise ValueError('Сумма досрочного платежа должна быть положительным числом')
+
+        if item.get('month') is not None:
+            month = parse_number(item['month'])
+            if month is None or month != int(month):
+                raise ValueError('Месяц досрочного платежа должен быть целым числом')
+            month = int(month)
+        elif item.get('date'):
+            if start_date is None:
+                start_date = datetime.strptime(str(start_date_str), '%Y-%m-%d')
+            payment_date = datetime.strptime(str(item['date']), '%Y-%m-%d')
+            month = (payment_date.year - start_date.year) * 12 + (payment_date.month - start_date.month)
+        else:
+            raise ValueError('Для досрочного платежа нужно указать month или date')
+
+        if month < 1 or month > term_months:
+            raise ValueError(f'Месяц досрочного платежа должен быть от 1 до {term_months}')
+        extra[month] = extra.get(month, 0) + amount
+    return extra
+
+def simulate_prepayments(loan, scenarios, include_schedule=True):
+    """Сравнивает сценарии досрочного погашения с исходным графиком
+
+    Исходный график и все сценарии со всеми стратегиями считаются одним
+    вызовом build_amortization_schedules: общий префикс до первого
+    досрочного платежа считается один раз. Работа ограничена
+    MAX_SIMULATION_SCENARIOS x 2 стратегии x срок (до 600 месяцев).
+    """
+    amount, interest_rate, start_date, term_months = loan
+    # Первый график - исходный, без досрочных платежей
+    runs = [({}, 'reduce_term')]
+    parsed = []
+    for scenario in scenarios:
+        if not isinstance(scenario, dict):
+            raise ValueError('Сценарий должен быть объектом')
+        extra = parse_extra_payments(scenario.get('extra_payments', []), start_date, term_months)
+        strategy = scenario.get('strategy', 'both')
+        if strategy == 'both':
+            strategies = SIMULATION_STRATEGIES
+        elif strategy in SIMULATION_STRATEGIES:
+            strategies = (strategy,)
+        else:
+            raise ValueError('Стратегия должна быть reduce_term, reduce_payment или both')
+        parsed.append((scenario.get('name'), extra, strategies))
+        runs.extend((extra, name) for name in strategies)
+
+    schedules = build_amortization_schedules(amount, interest_rate, term_months, runs, include_schedule)
+    baseline = schedules[0]
+    baseline.pop('strategy')
+
+    results = []
+    position = 1
+    for name, extra, strategies in parsed:
+        outcomes = {}
+        for strategy in strategies:
+            outcome = schedules[position]
+            position += 1
+            outcome['interest_saved'] = baseline['total_interest'] - outcome['total_interest']
+            outcome['months_saved'] = baseline['months'] - outcome['months']
+            outcomes[strategy] = outcome
+
+        results.append({
+            'name': name,
+            'extra_payments_total': round(sum(extra.values())),
+            'results': outcomes
+        })
+
+    return {'baseline': baseline, 'scenarios': results}
+
+_asset_manifest = None
+
+@app.template_global()
+def asset_url(name):
+    """Ссылка на собранный файл с хэшем в имени (python -m assets build) или на исходный"""
+    global _asset_manifest
+    if _asset_manifest is None or app.debug:
+        _asset_manifest = assets.load_manifest(app.static_folder)
+    return url_for('static', filename=_asset_manifest.get(name, name))
+
+@app.route('/static/dist/<path:filename>')
+def built_asset(filename):
+    """Собранный файл: сжатая копия, если клиент ее принимает, и кэш на год"""
+    dist = os.path.join(app.static_folder, assets.DIST_DIR)
+    path = os.path.abspath(os.path.join(dist, filename))
+    if not path.startswith(os.path.abspath(dist) + os.sep) or not os.path.isfile(path):
+        return jsonify({'error': 'Файл не найден'}), 404
+    
+    variant = assets.compressed_variant(path, request.accept_encodings)
+    if variant is None:
+        response = send_file(path, conditional=True)
+    else:
+        # Тип содержимого - исходного файла, а не архива
+        response = send_file(variant[0], mimetype=mimetypes.guess_type(path)[0], conditional=True)
+        response.headers['Content-Encoding'] = variant[1]
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@app.route('/static/uploads/<path:filename>')
+def uploaded_document(filename):
+    """Чек платежа из каталога загрузок или, если его перенесли, из архива
+
+    Ссылки в платежах не меняются после переноса в архив: файл читается
+    из пакета по смещению из индекса и отдается по частям.
+    """
+    upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    path = os.path.abspath(os.path.join(upload_folder, filename))
+    if not path.startswith(upload_folder + os.sep):
+        return jsonify({'error': 'Файл не найден'}), 404
+    if os.path.isfile(path):
+        return send_file(path, conditional=True)
+    
+    conn = get_db_connection()
+    entry = archive.lookup(conn, f'static/uploads/{filename}')
+    conn.close()
+    if entry is None:
+        return jsonify({'error': 'Файл не найден'}), 404
+    
+    response = Response(archive.read_chunks(app.config['ARCHIVE_FOLDER'], entry),
+                        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.content_length = entry['size']
+    # Содержимое в архиве не меняется: CRC и размер подходят как ETag
+    response.set_etag(f'{entry["crc32"]:08x}-{entry["size"]}')
+    response.headers['X-Archived'] = 'true'
+    return response.make_conditional(request)
+
+# Отрисованная главная страница по роли: шаблон не зависит от других данных сессии
+_index_html_cache = {}
+
 @app.route('/')
 def index():
     """Главная страница"""
@@ -556,22 +1331,30 @@ def index():
     user_role = session.get('user_role', 'unknown')
     role_display = 'Кредитодатель' if user_role == 'lender' else 'Закредитованный'
     
-    return render_template('index.html', user_role=role_display)
+    cache_key = (role_display, app.config['EVENTS_ENABLED'])
+    cached = _index_html_cache.get(cache_key)
+    if cached is None or app.debug:
+        html = render_template('index.html', user_role=role_display, events_enabled=app.config['EVENTS_ENABLED'])
+        cached = (html, hashlib.blake2b(html.encode('utf-8'), digest_size=16).hexdigest())
+        _index_html_cache[cache_key] = cached
+    
+    response = Response(cached[0], mimetype='text/html')
+    response.set_etag(cached[1])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limited('login')
 def login():
     """Страница входа"""
     if request.method == 'POST':
-        data = request.get_json()
+        data, error = request_json_object()
+        if error is not None:
+            return error
         username = data.get('username')
         password = data.get('password')
         
-        conn = sqlite3.connect('loans.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, username, password_hash, role FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
-        conn.close()
-        
+        user = find_login_user(username, password)
         if user and verify_password(password, user[2]):
             session['user_id'] = user[0]
             session['username'] = user[1]
@@ -610,25 +1393,13 @@ def get_borrower_credentials_api(borrower_id):
 @app.route('/api/borrowers', methods=['POST'])
 @login_required
 @role_required('lender')
+@writes_data
+@validated_input(CREATE_BORROWER_SCHEMA)
 def create_borrower_api():
     """Создать нового закредитованного пользователя"""
-    data = request.get_json()
-    
-    username = data.get('username', '').strip()
-    password = data.get('password', '').strip()
-    full_name = data.get('full_name', '').strip()
-    
-    if not username or not password or not full_name:
-        return jsonify({'error': 'Имя пользователя, пароль и ФИО обязательны'}), 400
-    
-    if len(username) < 3:
-        return jsonify({'error': 'Имя пользователя должно содержать минимум 3 символа'}), 400
-    
-    if len(password) < 4:
-        return jsonify({'error': 'Пароль должен содержать минимум 4 символа'}), 400
-    
-    if len(full_name) < 2:
-        return jsonify({'error': 'ФИО должно содержать минимум 2 символа'}), 400
+    username = g.input['username']
+    password = g.input['password']
+    full_name = g.input['full_name']
     
     result = create_borrower(username, password, full_name)
     
@@ -648,6 +1419,7 @@ def create_borrower_api():
 @app.route('/api/borrowers/<int:borrower_id>', methods=['DELETE'])
 @login_required
 @role_required('lender')
+@writes_data
 def delete_borrower_api(borrower_id):
     """Удалить закредитованного пользователя"""
     result = delete_borrower(borrower_id)
@@ -661,9 +1433,15 @@ def delete_borrower_api(borrower_id):
     else:
         return jsonify({'error': result['error']}), 400
 
-def get_loan_progress(loan_id):
-    """Получить прогресс погашения кредита"""
-    conn = sqlite3.connect('loans.db')
+def get_loan_progress(loan_id, conn=None):
+    """Получить прогресс погашения кредита
+
+    conn - уже открытое соединение (например, со снимком при выводе
+    списка); если не передано, открывается и закрывается свое.
+    """
+    own_connection = conn is None
+    if own_connection:
+        conn = get_loan_connection(loan_id)
     cursor = conn.cursor()
     
     # Получаем данные кредита
@@ -671,86 +1449,198 @@ def get_loan_progress(loan_id):
     loan = cursor.fetchone()
     
     if not loan:
-        conn.close()
+        if own_connection:
+            conn.close()
         return None
     
-    # Получаем все платежи по кредиту
-    cursor.execute('SELECT amount, payment_date FROM payments WHERE loan_id = ? ORDER BY payment_date', (loan_id,))
-    payments = cursor.fetchall()
+    # Итоги платежей считает база: память не зависит от числа платежей кредита
+    cursor.execute('SELECT COALESCE(SUM(amount), 0), COUNT(*), MAX(payment_date) FROM payments WHERE loan_id = ?',
+                   (loan_id,))
+    total_paid, payments_count, last_payment_date = cursor.fetchone()
     
-    total_paid = sum(payment[0] for payment in payments)
     remaining_amount = loan[8] - total_paid  # total_payment - total_paid (индекс 8)
     progress_percent = (total_paid / loan[8]) * 100 if loan[8] > 0 else 0
     
-    # Получаем дату последнего платежа
-    last_payment_date = payments[-1][1] if payments else None
-    
     # Рассчитываем дату последнего запланированного платежа
     planned_last_payment_date = calculate_last_payment_date(loan[5], loan[6])  # start_date (5), term_months (6)
     
-    conn.close()
+    if own_connection:
+        conn.close()
     
     return {
         'total_paid': round(total_paid),
         'remaining_amount': round(remaining_amount),
         'progress_percent': round(progress_percent, 1),
-        'payments_count': len(payments),
+        'payments_count': payments_count,
         'last_payment_date': last_payment_date,
         'planned_last_payment_date': planned_last_payment_date
     }
 
+# Поля ответов списочных эндпоинтов (порядок колонок в ?format=columns)
+LOAN_FIELDS = (
+    'id', 'amount', 'interest_rate', 'start_date', 'term_months', 'monthly_payment',
+    'total_payment', 'created_at', 'lender_id', 'borrower_id', 'user_name', 'user_role_display',
+    'total_paid', 'remaining_amount', 'progress_percent', 'payments_count',
+    'last_payment_date', 'planned_last_payment_date',
+)
+PAYMENT_FIELDS = ('id', 'amount', 'payment_date', 'document_path', 'document_name', 'created_at')
+
+# Пик памяти на строку обычного (не потокового) списочного ответа: строка из базы,
+# словарь, JSON и сжатая копия (замер tracemalloc, см. README)
+LOAN_ROW_BYTES = 4 * 1024
+PAYMENT_ROW_BYTES = 1024
+LEDGER_ROW_BYTES = 1024
+
+# Безопасное извлечение данных с проверкой типов
+def safe_int(value):
+    try:
+        return int(float(value)) if value is not None else 0
+    except (ValueError, TypeError):
+        return 0
+
+def safe_float(value):
+    try:
+        return float(value) if value is not None else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+def safe_str(value):
+    return str(value) if value is not None else ''
+
+_event_broker = None
+
+def get_event_broker():
+    """Брокер событий создается при первом обращении, уже внутри воркера"""
+    global _event_broker
+    if _event_broker is None:
+        _event_broker = create_broker(app.config['EVENTS_BACKEND'],
+                                      db_path=app.config['DATABASE_PATH'],
+                                      redis_url=app.config['EVENTS_REDIS_URL'],
+                                      poll_interval=app.config['EVENTS_POLL_INTERVAL'])
+    return _event_broker
+
+def publish_loan_event(event_type, loan_id, lender_id, borrower_id, payment=None):
+    """Уведомляет кредитодателя и закредитованного об изменении кредита
+
+    В событии только новый баланс и сводка платежа, клиент обновляет
+    строку кредита без повторной загрузки всего списка.
+    """
+    if not app.config['EVENTS_ENABLED']:
+        return
+
+    data = {'type': event_type, 'loan_id': loan_id}
+    if event_type != 'loan_deleted':
+        progress = get_loan_progress(loan_id)
+        if progress:
+            data.update({
+                'total_paid': progress['total_paid'],
+                'remaining_amount': progress['remaining_amount'],
+                'progress_percent': progress['progress_percent'],
+                'payments_count': progress['payments_count'],
+                'last_payment_date': progress['last_payment_date'],
+            })
+    if payment is not None:
+        data['payment'] = payment
+
+    try:
+        get_event_broker().publish((lender_id, borrower_id), 'loan_update', data)
+    except Exception as e:
+        # Сбой доставки уведомлений не должен отменять уже сохраненное изменение
+        app.logger.warning('Не удалось опубликовать событие %s для кредита %s: %s', event_type, loan_id, e)
+
+@app.route('/api/events', methods=['GET'])
+@login_required
+def stream_events():
+    """Поток Server-Sent Events с изменениями кредитов пользователя"""
+    if not app.config['EVENTS_ENABLED']:
+        return jsonify({'error': 'Push-уведомления отключены'}), 404
+
+    user_id = session['user_id']
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+    heartbeat = app.config['EVENTS_HEARTBEAT_SECONDS']
+    max_seconds = app.config['EVENTS_MAX_STREAM_SECONDS']
+    broker = get_event_broker()
+
+    def generate():
+        subscriber = broker.subscribe(user_id)
+        try:
+            # Ограниченная длина потока освобождает поток воркера;
+            # браузер переподключится сам и получит пропущенное по Last-Event-ID
+            yield 'retry: 3000\n\n'
+            for event_id, event_type, data in broker.replay(user_id, last_event_id):
+                yield format_sse(event_id, event_type, data)
+
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                try:
+                    event_id, event_type, data = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event_id, event_type, data)
+        finally:
+            broker.unsubscribe(user_id, subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx не должен буферизовать поток
+    })
+
 @app.route('/api/loans', methods=['GET'])
 @login_required
 def get_loans():
-    """Получить все кредиты"""
-    conn = sqlite3.connect('loans.db')
-    cursor = conn.cursor()
-    
+    """Получить все кредиты (?format=columns - массивы по полям)"""
     # Фильтруем кредиты в зависимости от роли пользователя
     user_id = session['user_id']
     user_role = session['user_role']
     
     if user_role == 'lender':
         # Для кредитодателя получаем кредиты с ФИО закредитованных
-        cursor.execute('''
+        connections = [get_shard_connection(user_id, read_only=True)]
+        query = '''
             SELECT l.*, COALESCE(u.full_name, u.username) as borrower_name 
             FROM loans l 
             JOIN users u ON l.borrower_id = u.id 
             WHERE l.lender_id = ? 
             ORDER BY l.created_at DESC
-        ''', (user_id,))
+        '''
     else:  # borrower
-        # Для закредитованного получаем кредиты с ФИО кредитодателей
-        cursor.execute('''
+        # Для закредитованного получаем кредиты с ФИО кредитодателей (из всех шардов)
+        connections = get_borrower_connections(user_id, read_only=True)
+        query = '''
             SELECT l.*, COALESCE(u.full_name, u.username) as lender_name 
             FROM loans l 
             JOIN users u ON l.lender_id = u.id 
             WHERE l.borrower_id = ? 
             ORDER BY l.created_at DESC
-        ''', (user_id,))
+        '''
     
-    loans = cursor.fetchall()
-    conn.close()
+    def loans_with_connection(conn):
+        for loan in conn.execute(query, (user_id,)):
+            yield loan, conn
     
-    result = []
-    for loan in loans:
-        progress = get_loan_progress(loan[0])
-        
-        # Безопасное извлечение данных с проверкой типов
-        def safe_int(value):
-            try:
-                return int(float(value)) if value is not None else 0
-            except (ValueError, TypeError):
-                return 0
-        
-        def safe_float(value):
-            try:
-                return float(value) if value is not None else 0.0
-            except (ValueError, TypeError):
-                return 0.0
-        
-        def safe_str(value):
-            return str(value) if value is not None else ''
+    def close_connections():
+        for conn in connections:
+            conn.close()
+    
+    # Кредиты из нескольких баз сливаются по created_at без списка в памяти:
+    # каждая база уже отдает их в порядке убывания
+    loans = heapq.merge(*(loans_with_connection(conn) for conn in connections),
+                        key=lambda item: item[0][9] or '', reverse=True)
+    
+    return streaming_list_response(loan_rows(loans, user_role), LOAN_FIELDS, row_budget(LOAN_ROW_BYTES),
+                                   close_connections)
+
+def loan_rows(loans, user_role):
+    """Словари списка кредитов из пар (строка loans, соединение)
+
+    Прогресс считается через то же соединение, из которого прочитан кредит.
+    """
+    for loan, conn in loans:
+        progress = get_loan_progress(loan[0], conn)
         
         # Определяем имя пользователя в зависимости от роли
         if user_role == 'lender':
@@ -760,7 +1650,7 @@ def get_loans():
             user_name = safe_str(loan[10])  # lender_name
             user_role_display = 'Кредитодатель'
         
-        result.append({
+        yield {
             'id': safe_int(loan[0]),           # id
             'amount': safe_int(loan[3]),        # amount
             'interest_rate': safe_float(loan[4]), # interest_rate
@@ -779,32 +1669,55 @@ def get_loans():
             'payments_count': progress['payments_count'],
             'last_payment_date': progress['last_payment_date'],
             'planned_last_payment_date': progress['planned_last_payment_date']
-        })
-    
-    return jsonify(result)
+        }
+
+_overview_cache = OverviewCache(app.config['OVERVIEW_CACHE_SECONDS'])
+
+@app.route('/api/me/overview', methods=['GET'])
+@login_required
+@role_required('borrower')
+def get_my_overview():
+    """Сводка закредитованного: остаток, ближайший платеж, просрочка и последние платежи по каждому кредиту
+
+    Два запроса на базу вместо прогресса и списка платежей по каждому
+    кредиту; результат кэшируется в процессе на OVERVIEW_CACHE_SECONDS.
+    Запись платежа или кредита в любом воркере увеличивает версию сводки
+    в той же транзакции и в той же базе (общей или шарде), и
+    закэшированная сводка с прежними версиями баз не отдается.
+    """
+    user_id = session['user_id']
+    connections = get_borrower_connections(user_id, read_only=True)
+    try:
+        version = tuple(read_version(conn, user_id) for conn in connections)
+        overview = _overview_cache.get(user_id, version)
+        if overview is None:
+            overview = build_overview(connections, user_id, datetime.now().date(),
+                                      recent_limit=app.config['OVERVIEW_RECENT_PAYMENTS'])
+            _overview_cache.put(user_id, overview, version)
+    finally:
+        for conn in connections:
+            conn.close()
+    return json_response(overview)
 
 @app.route('/api/loans', methods=['POST'])
 @login_required
 @role_required('lender')
+@writes_data
+@validated_input(LOAN_SCHEMA)
+@idempotent
 def create_loan():
     """Создать новый кредит"""
-    data = request.get_json()
-    
-    amount = clean_amount(data['amount'])
-    interest_rate = float(data['interest_rate'])
-    start_date = data['start_date']
-    term_months = int(data['term_months'])
+    amount = g.input['amount']
+    interest_rate = g.input['interest_rate']
+    start_date = g.input['start_date']
+    term_months = g.input['term_months']
+    borrower_id = g.input['borrower_id']
     
     # Расчет выплат
     calculations = calculate_loan(amount, interest_rate, term_months)
     
-    # Получаем ID закредитованного пользователя
-    borrower_id = data.get('borrower_id')
-    if not borrower_id:
-        return jsonify({'error': 'Необходимо выбрать закредитованного пользователя'}), 400
-    
     # Проверяем, что закредитованный существует
-    conn = sqlite3.connect('loans.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('SELECT id FROM users WHERE id = ? AND role = "borrower"', (borrower_id,))
     borrower = cursor.fetchone()
@@ -815,15 +1728,27 @@ def create_loan():
     
     # Сохранение в базу данных
     lender_id = session['user_id']
+    if app.config['SHARDING_ENABLED']:
+        cursor.execute('INSERT OR IGNORE INTO borrower_lenders (borrower_id, lender_id) VALUES (?, ?)',
+                       (borrower[0], lender_id))
+        conn.commit()
+        conn.close()
+        conn = get_shard_connection(lender_id)
+        cursor = conn.cursor()
     cursor.execute('''
         INSERT INTO loans (lender_id, borrower_id, amount, interest_rate, start_date, term_months, monthly_payment, total_payment)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (lender_id, borrower_id, amount, interest_rate, start_date, term_months, 
+    ''', (lender_id, borrower[0], amount, interest_rate, start_date, term_months, 
           calculations['monthly_payment'], calculations['total_payment']))
-    conn.commit()
     loan_id = cursor.lastrowid
+    record_ledger_event(cursor, 'loan_created', loan_id, lender_id, borrower[0],
+                        total_payment=calculations['total_payment'], effective_date=start_date)
+    bump_version(cursor, borrower[0])
+    conn.commit()
     conn.close()
     
+    publish_loan_event('loan_created', loan_id, lender_id, borrower[0])
+    
     return jsonify({
         'id': loan_id,
         'amount': amount,
@@ -836,34 +1761,44 @@ def create_loan():
     })
 
 @app.route('/api/calculate', methods=['POST'])
+@rate_limited('calculate')
+@validated_input(CALCULATE_SCHEMA)
 def calculate():
     """Расчет кредита без сохранения"""
-    data = request.get_json()
-    
-    amount = clean_amount(data['amount'])
-    interest_rate = float(data['interest_rate'])
-    term_months = int(data['term_months'])
-    
-    calculations = calculate_loan(amount, interest_rate, term_months)
+    calculations = calculate_loan(g.input['amount'], g.input['interest_rate'], g.input['term_months'])
     
     return jsonify(calculations)
 
 @app.route('/api/loans/<int:loan_id>', methods=['DELETE'])
 @login_required
 @role_required('lender')
+@writes_data
 def delete_loan(loan_id):
     """Удалить кредит"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_loan_connection(loan_id)
     cursor = conn.cursor()
+    cursor.execute('SELECT lender_id, borrower_id FROM loans WHERE id = ?', (loan_id,))
+    participants = cursor.fetchone()
     cursor.execute('DELETE FROM payments WHERE loan_id = ?', (loan_id,))
     cursor.execute('DELETE FROM loans WHERE id = ?', (loan_id,))
+    accrual.invalidate(cursor, loan_id)
+    if participants:
+        record_ledger_event(cursor, 'loan_deleted', loan_id, participants[0], participants[1])
+        bump_version(cursor, participants[1])
     conn.commit()
     conn.close()
     
+    if participants:
+        publish_loan_event('loan_deleted', loan_id, participants[0], participants[1])
+    
     return jsonify({'success': True})
 
 @app.route('/api/payments', methods=['POST'])
 @login_required
+@rate_limited('payments')
+@writes_data
+@validated_input(PAYMENT_SCHEMA)
+@idempotent
 def add_payment():
     """Добавить платеж по кредиту"""
     # Убеждаемся, что папка uploads существует
@@ -874,9 +1809,9 @@ def add_payment():
     if 'file' in request.files:
         # Обработка с файлом
         file = request.files['file']
-        loan_id = int(request.form.get('loan_id'))
-        amount = clean_amount(request.form.get('amount'))
-        payment_date = request.form.get('payment_date')
+        loan_id = g.input['loan_id']
+        amount = g.input['amount']
+        payment_date = g.input['payment_date']
         
         # Проверяем обязательность файла
         if not file or not file.filename:
@@ -914,18 +1849,19 @@ def add_payment():
         return jsonify({'error': 'Необходимо прикрепить документ (чек) для сохранения платежа'}), 400
     
     # Проверяем, существует ли кредит и есть ли права доступа
-    conn = sqlite3.connect('loans.db')
+    conn = get_loan_connection(loan_id)
     cursor = conn.cursor()
     user_id = session['user_id']
     user_role = session['user_role']
     
     # Проверяем права доступа к кредиту
     if user_role == 'lender':
-        cursor.execute('SELECT id FROM loans WHERE id = ? AND lender_id = ?', (loan_id, user_id))
+        cursor.execute('SELECT id, lender_id, borrower_id FROM loans WHERE id = ? AND lender_id = ?', (loan_id, user_id))
     else:  # borrower
-        cursor.execute('SELECT id FROM loans WHERE id = ? AND borrower_id = ?', (loan_id, user_id))
+        cursor.execute('SELECT id, lender_id, borrower_id FROM loans WHERE id = ? AND borrower_id = ?', (loan_id, user_id))
     
-    if not cursor.fetchone():
+    loan = cursor.fetchone()
+    if not loan:
         conn.close()
         return jsonify({'error': 'Кредит не найден или нет прав доступа'}), 404
     
@@ -934,13 +1870,23 @@ def add_payment():
         INSERT INTO payments (loan_id, amount, payment_date, document_path, document_name)
         VALUES (?, ?, ?, ?, ?)
     ''', (loan_id, amount, payment_date, document_path, document_name))
-    conn.commit()
     payment_id = cursor.lastrowid
+    record_ledger_event(cursor, 'payment_added', loan_id, loan[1], loan[2], paid_delta=amount, count_delta=1,
+                        payment_id=payment_id, effective_date=payment_date)
+    accrual.invalidate(cursor, loan_id)
+    bump_version(cursor, loan[2])
+    conn.commit()
     conn.close()
     
     # Пересчитываем кредит после внесения платежа
     recalculation = recalculate_loan_after_payment(loan_id)
     
+    publish_loan_event('payment_added', loan_id, loan[1], loan[2], payment={
+        'id': payment_id,
+        'amount': round(amount),
+        'payment_date': payment_date,
+    })
+    
     return jsonify({
         'id': payment_id,
         'loan_id': loan_id,
@@ -953,8 +1899,8 @@ def add_payment():
 
 @app.route('/api/loans/<int:loan_id>/payments', methods=['GET'])
 def get_loan_payments(loan_id):
-    """Получить все платежи по кредиту"""
-    conn = sqlite3.connect('loans.db')
+    """Получить все платежи по кредиту (?format=columns - массивы по полям)"""
+    conn = get_loan_connection(loan_id, read_only=True)
     cursor = conn.cursor()
     cursor.execute('''
         SELECT id, amount, payment_date, document_path, document_name, created_at 
@@ -962,44 +1908,32 @@ def get_loan_payments(loan_id):
         WHERE loan_id = ? 
         ORDER BY payment_date DESC
     ''', (loan_id,))
-    payments = cursor.fetchall()
-    conn.close()
-    
-    result = []
-    for payment in payments:
-        # Безопасное извлечение данных для платежей
-        def safe_int(value):
-            try:
-                return int(float(value)) if value is not None else 0
-            except (ValueError, TypeError):
-                return 0
-        
-        def safe_str(value):
-            return str(value) if value is not None else ''
-        
-        result.append({
-            'id': safe_int(payment[0]),
-            'amount': safe_int(payment[1]),
-            'payment_date': safe_str(payment[2]),
-            'document_path': safe_str(payment[3]),
-            'document_name': safe_str(payment[4]),
-            'created_at': safe_str(payment[5])
-        })
     
-    return jsonify(result)
+    # Строки читаются из курсора по мере сериализации
+    result = ({
+        'id': safe_int(payment[0]),
+        'amount': safe_int(payment[1]),
+        'payment_date': safe_str(payment[2]),
+        'document_path': safe_str(payment[3]),
+        'document_name': safe_str(payment[4]),
+        'created_at': safe_str(payment[5])
+    } for payment in cursor)
+    
+    return streaming_list_response(result, PAYMENT_FIELDS, row_budget(PAYMENT_ROW_BYTES), conn.close)
 
 @app.route('/api/payments/<int:payment_id>', methods=['DELETE'])
 @login_required
+@writes_data
 def delete_payment(payment_id):
     """Удалить платеж"""
-    conn = sqlite3.connect('loans.db')
+    conn = get_loan_connection(payment_id)
     cursor = conn.cursor()
     user_id = session['user_id']
     user_role = session['user_role']
     
     # Получаем loan_id и проверяем права доступа
     cursor.execute('''
-        SELECT p.loan_id, l.lender_id, l.borrower_id 
+        SELECT p.loan_id, l.lender_id, l.borrower_id, p.amount, p.payment_date 
         FROM payments p 
         JOIN loans l ON p.loan_id = l.id 
         WHERE p.id = ?
@@ -1010,7 +1944,7 @@ def delete_payment(payment_id):
         conn.close()
         return jsonify({'error': 'Платеж не найден'}), 404
     
-    loan_id, lender_id, borrower_id = result
+    loan_id, lender_id, borrower_id, payment_amount, payment_date = result
     
     # Проверяем права доступа
     if user_role == 'lender' and user_id != lender_id:
@@ -1022,12 +1956,18 @@ def delete_payment(payment_id):
     
     # Удаляем платеж
     cursor.execute('DELETE FROM payments WHERE id = ?', (payment_id,))
+    record_ledger_event(cursor, 'payment_deleted', loan_id, lender_id, borrower_id, paid_delta=-payment_amount,
+                        count_delta=-1, payment_id=payment_id, effective_date=payment_date)
+    accrual.invalidate(cursor, loan_id)
+    bump_version(cursor, borrower_id)
     conn.commit()
     conn.close()
     
     # Пересчитываем кредит после удаления платежа
     recalculation = recalculate_loan_after_payment(loan_id)
     
+    publish_loan_event('payment_deleted', loan_id, lender_id, borrower_id, payment={'id': payment_id})
+    
     return jsonify({
         'success': True,
         'recalculation': recalculation
@@ -1043,6 +1983,172 @@ def get_loan_recalculation(loan_id):
     
     return jsonify(recalculation)
 
+LEDGER_FIELDS = ('seq', 'event_type', 'payment_id', 'paid_delta', 'count_delta', 'total_payment',
+                 'effective_date', 'recorded_at')
+
+def ledger_access_allowed(cursor, loan_id):
+    """Есть ли у пользователя доступ к журналу кредита (в том числе удаленного)"""
+    loan_participants = ledger.participants(cursor, loan_id)
+    if not loan_participants:
+        return False
+    lender_id, borrower_id = loan_participants
+    if session['user_role'] == 'lender':
+        return session['user_id'] == lender_id
+    return session['user_id'] == borrower_id
+
+@app.route('/api/loans/<int:loan_id>/balance', methods=['GET'])
+@login_required
+def get_loan_balance(loan_id):
+    """Баланс кредита на дату по журналу (?as_of=YYYY-MM-DD[ HH:MM[:SS]], UTC)"""
+    as_of = request.args.get('as_of')
+    if as_of is not None:
+        as_of = ledger.normalize_as_of(as_of)
+        if as_of is None:
+            return jsonify({'error': 'Неверный формат даты as_of, ожидается YYYY-MM-DD или YYYY-MM-DD HH:MM:SS'}), 400
+    
+    conn = get_loan_connection(loan_id, read_only=True)
+    cursor = conn.cursor()
+    if not ledger_access_allowed(cursor, loan_id):
+        conn.close()
+        return jsonify({'error': 'Кредит не найден или нет прав доступа'}), 404
+    
+    state = ledger.replay(cursor, loan_id, as_of)
+    conn.close()
+    
+    if state is None:
+        return jsonify({'error': 'На эту дату кредита еще не было'}), 404
+    
+    return jsonify({
+        'loan_id': loan_id,
+        'as_of': as_of,
+        'seq': state['seq'],
+        'recorded_at': state['recorded_at'],
+        'total_payment': round(state['total_payment']),
+        'total_paid': round(state['total_paid']),
+        'remaining_amount': round(state['total_payment'] - state['total_paid']),
+        'payments_count': state['payments_count'],
+        'deleted': state['deleted'],
+        'checkpoint_seq': state['checkpoint_seq'],
+        'events_replayed': state['events_replayed']
+    })
+
+@app.route('/api/loans/<int:loan_id>/ledger', methods=['GET'])
+@login_required
+def get_loan_ledger(loan_id):
+    """История изменений кредита из журнала (?format=columns - массивы по полям)"""
+    conn = get_loan_connection(loan_id, read_only=True)
+    cursor = conn.cursor()
+    if not ledger_access_allowed(cursor, loan_id):
+        conn.close()
+        return jsonify({'error': 'Кредит не найден или нет прав доступа'}), 404
+    
+    cursor.execute(f'''
+        SELECT {', '.join(LEDGER_FIELDS)} FROM ledger_events WHERE loan_id = ? ORDER BY seq
+    ''', (loan_id,))
+    result = (dict(zip(LEDGER_FIELDS, row)) for row in cursor)
+    
+    return streaming_list_response(result, LEDGER_FIELDS, row_budget(LEDGER_ROW_BYTES), conn.close)
+
+ACCRUAL_RESPONSE_FIELDS = accrual.ACCRUAL_FIELDS + ('balance',)
+
+@app.route('/api/loans/<int:loan_id>/accrual', methods=['GET'])
+@login_required
+def get_loan_accrual(loan_id):
+    """Начисленные проценты и остаток долга на дату по фактическим платежам
+
+    ?as_of=YYYY-MM-DD (по умолчанию сегодня), ?convention=actual/365|actual/360|30/360.
+    Если есть результат ночного расчета и после него не было платежей,
+    он продлевается до as_of без чтения платежей; иначе кредит
+    пересчитывается по своим платежам.
+    """
+    as_of = accrual.parse_date(request.args['as_of']) if request.args.get('as_of') else datetime.now().date()
+    if as_of is None:
+        return jsonify({'error': 'Неверный формат даты as_of, ожидается YYYY-MM-DD'}), 400
+    convention = request.args.get('convention', app.config['ACCRUAL_DAY_COUNT'])
+    if convention not in accrual.DAY_COUNT_CONVENTIONS:
+        return jsonify({'error': f'Неизвестная конвенция: {convention}. Допустимо: '
+                                 + ', '.join(accrual.DAY_COUNT_CONVENTIONS)}), 400
+    
+    conn = get_loan_connection(loan_id, read_only=True)
+    cursor = conn.cursor()
+    user_id = session['user_id']
+    owner_column = 'lender_id' if session['user_role'] == 'lender' else 'borrower_id'
+    cursor.execute(f'SELECT amount, interest_rate, start_date FROM loans WHERE id = ? AND {owner_column} = ?',
+                   (loan_id, user_id))
+    loan = cursor.fetchone()
+    if not loan:
+        conn.close()
+        return jsonify({'error': 'Кредит не найден или нет прав доступа'}), 404
+    
+    stored = accrual.load_stored(cursor, loan_id)
+    result = accrual.extend(stored, as_of, convention) if stored else None
+    source = 'stored'
+    if result is None:
+        source = 'computed'
+        cursor.execute('SELECT payment_date, amount FROM payments WHERE loan_id = ?', (loan_id,))
+        result = accrual.accrue_loan(loan[0], loan[1], loan[2], cursor.fetchall(), as_of, convention)
+    conn.close()
+    
+    if result is None:
+        return jsonify({'error': 'Неверная дата выдачи кредита'}), 400
+    
+    result['balance'] = result['principal_outstanding'] + result['interest_unpaid']
+    response = {field: round(result[field], 2) for field in ACCRUAL_RESPONSE_FIELDS}
+    response.update({
+        'loan_id': loan_id,
+        'as_of': as_of.isoformat(),
+        'convention': convention,
+        'next_payment_date': result['next_payment_date'],
+        'source': source,
+        'calculated_as_of': stored['as_of'] if source == 'stored' else as_of.isoformat()
+    })
+    return jsonify(response)
+
+@app.route('/api/loans/<int:loan_id>/simulate', methods=['POST'])
+@login_required
+@validated_input()
+def simulate_loan(loan_id):
+    """Смоделировать досрочные платежи по кредиту без сохранения"""
+    data = g.input
+
+    # Один сценарий можно передать без обертки scenarios
+    scenarios = data.get('scenarios')
+    if scenarios is None:
+        scenarios = [{'extra_payments': data.get('extra_payments', []),
+                      'strategy': data.get('strategy', 'both')}]
+    if not isinstance(scenarios, list) or not scenarios:
+        return jsonify({'error': 'Необходимо указать хотя бы один сценарий'}), 400
+    if len(scenarios) > MAX_SIMULATION_SCENARIOS:
+        return jsonify({'error': f'Не более {MAX_SIMULATION_SCENARIOS} сценариев за один запрос'}), 400
+    for scenario in scenarios:
+        extra_payments = scenario.get('extra_payments') if isinstance(scenario, dict) else None
+        if isinstance(extra_payments, list) and len(extra_payments) > MAX_EXTRA_PAYMENTS_PER_SCENARIO:
+            return jsonify({'error': f'Не более {MAX_EXTRA_PAYMENTS_PER_SCENARIO} досрочных платежей в сценарии'}), 400
+
+    conn = get_loan_connection(loan_id)
+    cursor = conn.cursor()
+    user_id = session['user_id']
+    user_role = session['user_role']
+
+    # Проверяем права доступа к кредиту
+    if user_role == 'lender':
+        cursor.execute('SELECT amount, interest_rate, start_date, term_months FROM loans WHERE id = ? AND lender_id = ?', (loan_id, user_id))
+    else:  # borrower
+        cursor.execute('SELECT amount, interest_rate, start_date, term_months FROM loans WHERE id = ? AND borrower_id = ?', (loan_id, user_id))
+    loan = cursor.fetchone()
+    conn.close()
+
+    if not loan:
+        return jsonify({'error': 'Кредит не найден или нет прав доступа'}), 404
+
+    try:
+        simulation = simulate_prepayments(loan, scenarios, bool(data.get('include_schedule', True)))
+    except (ValueError, TypeError, OverflowError) as e:
+        return jsonify({'error': f'Ошибка в параметрах сценария: {str(e)}'}), 400
+
+    simulation['loan_id'] = loan_id
+    return jsonify(simulation)
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for load balancers"""
@@ -1053,7 +2159,7 @@ def health_check():
     }), 200
 
 if __name__ == '__main__':
-    init_db()
+    create_app()
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
     debug = os.environ.get('FLASK_ENV') != 'production'
@@ -0,0 +1,325 @@
+"""
+Архив чеков погашенных кредитов.
+
+    python -m archive run
+    python -m archive run --min-age-days 0 --dry-run
+    python -m archive stats
+
+Чеки платежей по полностью погашенным кредитам (остаток, как в
+get_loan_progress, округляется до нуля) переносятся из UPLOAD_FOLDER в
+zip-пакеты ARCHIVE_FOLDER/pack-<время>-<n>.zip, и каталог загрузок
+содержит только чеки действующих кредитов. Файлы, которые deflate почти
+не сжимает (большинство PDF и изображений, DOCX), хранятся без сжатия.
+
+Для каждого чека в таблице archived_documents записаны пакет, смещение
+данных в нем, размеры и CRC32: чтение одного чека - seek и чтение подряд,
+без разбора центрального каталога пакета. Пакеты - обычные zip-файлы и
+открываются любым архиватором; после записи они не меняются, поэтому
+резервная копия архива может быть инкрементальной.
+
+Порядок переноса: пакет пишется во временный файл, проверяется по CRC,
+сбрасывается на диск и переименовывается; затем индекс записывается
+одной транзакцией, и только после commit удаляются исходные файлы.
+Прерванный запуск оставляет лишний пакет или неудаленные исходники -
+следующий запуск удаляет исходники, уже записанные в индекс.
+"""
+import argparse
+import json
+import os
+import struct
+import time
+import zipfile
+import zlib
+from datetime import datetime
+
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS archived_documents (
+        document_path TEXT PRIMARY KEY,
+        pack TEXT NOT NULL,
+        data_offset INTEGER NOT NULL,
+        compressed_size INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        method INTEGER NOT NULL,
+        crc32 INTEGER NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS archive_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        documents_count INTEGER NOT NULL,
+        packs_count INTEGER NOT NULL,
+        original_bytes INTEGER NOT NULL,
+        archived_bytes INTEGER NOT NULL,
+        reclaimed_bytes INTEGER NOT NULL,
+        duration_ms REAL NOT NULL,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+]
+
+# Остаток меньше 0.5 округляется get_loan_progress до нуля: кредит погашен
+PAID_OFF_SQL = '''
+    SELECT DISTINCT p.document_path FROM payments p
+    WHERE p.document_path IS NOT NULL AND p.loan_id IN (
+        SELECT l.id FROM loans l JOIN payments lp ON lp.loan_id = l.id
+        GROUP BY l.id HAVING l.total_payment - SUM(lp.amount) {} 0.5
+    )
+'''
+
+# Сжимаются только файлы, у которых первые SAMPLE_SIZE байт ужимаются хотя бы до MIN_RATIO
+SAMPLE_SIZE = 256 * 1024
+MIN_RATIO = 0.9
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+CHUNK_SIZE = 64 * 1024
+
+
+def paid_off_documents(conn):
+    """document_path чеков погашенных и непогашенных кредитов: (paid, active)
+
+    Один файл может быть приложен к нескольким платежам: если среди них
+    есть платеж непогашенного кредита, файл остается в каталоге загрузок.
+    """
+    paid = {row[0] for row in conn.execute(PAID_OFF_SQL.format('<'))}
+    active = {row[0] for row in conn.execute(PAID_OFF_SQL.format('>='))}
+    return paid, active
+
+
+def compress_type(data):
+    """ZIP_DEFLATED, если начало файла заметно сжимается, иначе ZIP_STORED"""
+    sample = data[:SAMPLE_SIZE]
+    if sample and len(zlib.compress(sample, 1)) < len(sample) * MIN_RATIO:
+        return zipfile.ZIP_DEFLATED
+    return zipfile.ZIP_STORED
+
+
+def write_pack(path, files):
+    """Пишет пакет и возвращает строки индекса для каждого файла
+
+    files - [(document_path, путь к файлу)]. Пакет создается во временном
+    файле и публикуется переименованием после проверки CRC и fsync.
+    """
+    tmp_path = path + '.tmp'
+    members = {}
+    with zipfile.ZipFile(tmp_path, 'w', compresslevel=6) as pack:
+        for document_path, source in files:
+            with open(source, 'rb') as f:
+                data = f.read()
+            info = zipfile.ZipInfo(os.path.basename(source),
+                                   date_time=time.localtime(os.path.getmtime(source))[:6])
+            info.compress_type = compress_type(data)
+            pack.writestr(info, data)
+            members[info.filename] = document_path
+
+    rows = []
+    with zipfile.ZipFile(tmp_path) as pack, open(tmp_path, 'rb') as raw:
+        bad = pack.testzip()
+        if bad is not None:
+            raise ValueError(f'Ошибка CRC в {bad} при записи пакета {path}')
+        for info in pack.infolist():
+            # Смещение данных берется из локального заголовка: его extra может отличаться от центрального
+            raw.seek(info.header_offset)
+            header = ZIP_LOCAL_HEADER.unpack(raw.read(ZIP_LOCAL_HEADER.size))
+            data_offset = info.header_offset + ZIP_LOCAL_HEADER.size + header[9] + header[10]
+            rows.append((members[info.filename], os.path.basename(path), data_offset,
+                         info.compress_size, info.file_size, info.compress_type, info.CRC))
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return rows
+
+
+def lookup(conn, document_path):
+    """Строка индекса архивированного чека (словарь) или None"""
+    row = conn.execute('''
+        SELECT pack, data_offset, compressed_size, size, method, crc32
+        FROM archived_documents WHERE document_path = ?
+    ''', (document_path,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(('pack', 'data_offset', 'compressed_size', 'size', 'method', 'crc32'), row))
+
+
+def read_chunks(archive_folder, entry, chunk_size=CHUNK_SIZE):
+    """Содержимое чека из пакета по частям, с проверкой CRC в конце"""
+    decompressor = zlib.decompressobj(-15) if entry['method'] == zipfile.ZIP_DEFLATED else None
+    crc = 0
+    with open(os.path.join(archive_folder, entry['pack']), 'rb') as f:
+        f.seek(entry['data_offset'])
+        left = entry['compressed_size']
+        while left > 0:
+            chunk = f.read(min(chunk_size, left))
+            if not chunk:
+                break
+            left -= len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            crc = zlib.crc32(chunk, crc)
+            yield chunk
+        if decompressor is not None:
+            tail = decompressor.flush()
+            crc = zlib.crc32(tail, crc)
+            if tail:
+                yield tail
+    if left or crc != entry['crc32']:
+        raise ValueError(f'Поврежден чек в пакете {entry["pack"]} (смещение {entry["data_offset"]})')
+
+
+def directory_size(path):
+    """Число файлов и их общий размер в каталоге (без подкаталогов)"""
+    count = size = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                count += 1
+                size += entry.stat().st_size
+    return count, size
+
+
+def run_archive(global_conn, connections, upload_folder, archive_folder, min_age_days=30,
+                pack_size=256 * 1024 * 1024, dry_run=False):
+    """Переносит чеки погашенных кредитов в пакеты, возвращает итоги запуска
+
+    connections - соединения с базами кредитов (общая база и шарды),
+    индекс пишется в global_conn. Файлы моложе min_age_days дней не
+    переносятся: недавно погашенный кредит еще могут открывать.
+    """
+    started = time.perf_counter()
+    paid, active = set(), set()
+    for conn in connections:
+        conn_paid, conn_active = paid_off_documents(conn)
+        paid |= conn_paid
+        active |= conn_active
+    archived = {row[0] for row in global_conn.execute('SELECT document_path FROM archived_documents')}
+
+    cutoff = time.time() - min_age_days * 86400
+    candidates = []
+    leftovers = []
+    for document_path in sorted(paid - active):
+        source = os.path.join(upload_folder, os.path.basename(document_path))
+        try:
+            stat = os.stat(source)
+        except FileNotFoundError:
+            continue
+        if document_path in archived:
+            leftovers.append((source, stat.st_size))
+        elif stat.st_mtime < cutoff:
+            candidates.append((document_path, source, stat.st_size))
+
+    # Пакеты не больше pack_size (файл больше лимита занимает пакет целиком)
+    batches = []
+    batch_size = 0
+    for candidate in candidates:
+        if not batches or batch_size + candidate[2] > pack_size:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append(candidate)
+        batch_size += candidate[2]
+
+    original_bytes = sum(candidate[2] for candidate in candidates)
+    archived_bytes = 0
+    if not dry_run:
+        os.makedirs(archive_folder, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        for number, batch in enumerate(batches, 1):
+            path = os.path.join(archive_folder, f'pack-{stamp}-{number}.zip')
+            rows = write_pack(path, [(document_path, source) for document_path, source, _ in batch])
+            global_conn.executemany('''
+                INSERT OR REPLACE INTO archived_documents
+                    (document_path, pack, data_offset, compressed_size, size, method, crc32)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            global_conn.commit()
+            archived_bytes += os.path.getsize(path)
+            for _, source, _ in batch:
+                os.unlink(source)
+        for source, _ in leftovers:
+            os.unlink(source)
+
+    leftover_bytes = sum(size for _, size in leftovers)
+    result = {
+        'documents': len(candidates),
+        'packs': len(batches),
+        'original_bytes': original_bytes,
+        'archived_bytes': archived_bytes,
+        'reclaimed_bytes': original_bytes - archived_bytes + leftover_bytes,
+        'leftovers_removed': len(leftovers),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'dry_run': dry_run,
+    }
+    if not dry_run:
+        global_conn.execute('''
+            INSERT INTO archive_runs (documents_count, packs_count, original_bytes, archived_bytes,
+                                      reclaimed_bytes, duration_ms)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (result['documents'], result['packs'], original_bytes, archived_bytes,
+              result['reclaimed_bytes'], result['duration_ms']))
+        global_conn.commit()
+    if os.path.isdir(upload_folder):
+        result['hot_files'], result['hot_bytes'] = directory_size(upload_folder)
+    return result
+
+
+def archive_stats(conn, upload_folder, archive_folder):
+    """Размер горячего каталога и архива, сэкономленное место за все запуски"""
+    documents, original_bytes, stored_bytes = conn.execute('''
+        SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(compressed_size), 0) FROM archived_documents
+    ''').fetchone()
+    reclaimed_bytes, runs = conn.execute(
+        'SELECT COALESCE(SUM(reclaimed_bytes), 0), COUNT(*) FROM archive_runs').fetchone()
+    hot_files, hot_bytes = directory_size(upload_folder) if os.path.isdir(upload_folder) else (0, 0)
+    packs, pack_bytes = (directory_size(archive_folder) if os.path.isdir(archive_folder) else (0, 0))
+    return {
+        'hot_files': hot_files,
+        'hot_bytes': hot_bytes,
+        'archived_documents': documents,
+        'archived_original_bytes': original_bytes,
+        'archived_stored_bytes': stored_bytes,
+        'packs': packs,
+        'pack_bytes': pack_bytes,
+        'reclaimed_bytes': reclaimed_bytes,
+        'runs': runs,
+    }
+
+
+def main():
+    from app import app, get_db_connection, get_shard_router
+
+    parser = argparse.ArgumentParser(description='Архив чеков погашенных кредитов')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help='Перенести чеки погашенных кредитов в пакеты')
+    run.add_argument('--min-age-days', type=float, default=app.config['ARCHIVE_MIN_AGE_DAYS'],
+                     help='Не переносить файлы моложе стольких дней (по умолчанию ARCHIVE_MIN_AGE_DAYS)')
+    run.add_argument('--pack-size-mb', type=float, default=app.config['ARCHIVE_PACK_SIZE_MB'],
+                     help='Размер пакета в МБ (по умолчанию ARCHIVE_PACK_SIZE_MB)')
+    run.add_argument('--dry-run', action='store_true', help='Только подсчитать, ничего не переносить')
+    sub.add_parser('stats', help='Размер каталога загрузок и архива')
+    args = parser.parse_args()
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    archive_folder = app.config['ARCHIVE_FOLDER']
+    global_conn = get_db_connection()
+    try:
+        if args.command == 'run':
+            connections = [global_conn]
+            if app.config['SHARDING_ENABLED']:
+                router = get_shard_router()
+                connections += [conn for conn in (router.connect(lender_id, create=False)
+                                                  for lender_id in router.shard_ids()) if conn is not None]
+            try:
+                result = run_archive(global_conn, connections, upload_folder, archive_folder,
+                                     min_age_days=args.min_age_days,
+                                     pack_size=int(args.pack_size_mb * 1024 * 1024), dry_run=args.dry_run)
+            finally:
+                for conn in connections[1:]:
+                    conn.close()
+        else:
+            result = archive_stats(global_conn, upload_folder, archive_folder)
+    finally:
+        global_conn.close()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+ASGI entry point for the async serving mode
+
+Run with uvicorn:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+or under gunicorn:
+    GUNICORN_PROFILE=asgi gunicorn -c gunicorn.conf.py asgi:app
+
+The event loop receives request bodies without blocking, so slow clients
+uploading receipts do not hold a thread. Only once the whole body has
+arrived does the Flask view (including SQLite access) run in a bounded
+thread pool.
+"""
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+BOOT_STARTED = time.perf_counter()
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Set environment
+os.environ.setdefault('FLASK_ENV', 'production')
+
+from app import create_app
+
+
+class ThreadPoolWsgiAdapter:
+    """Runs a WSGI application behind ASGI using a thread pool
+
+    Request bodies are read on the event loop into a spooled temporary file
+    (memory up to spool_max_size, disk above it) and rejected with 413 as
+    soon as they exceed max_body_size. The WSGI call itself runs in a pool
+    of max_threads threads per worker process.
+    """
+
+    def __init__(self, wsgi_app, max_threads=16, spool_max_size=512 * 1024, max_body_size=None):
+        self.wsgi_app = wsgi_app
+        self.max_threads = max_threads
+        self.spool_max_size = spool_max_size
+        self.max_body_size = max_body_size
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self):
+        # Thread pools do not survive fork, create one per worker process
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix='wsgi')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        body = SpooledTemporaryFile(max_size=self.spool_max_size)
+        try:
+            size = 0
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                if self.max_body_size and size > self.max_body_size:
+                    await self._send_simple(send, 413, b'Request Entity Too Large')
+                    return
+                body.write(chunk)
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._get_executor(), self._run_wsgi, loop, scope, body, send)
+        finally:
+            body.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _send_simple(send, status, text):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(text)).encode())]})
+        await send({'type': 'http.response.body', 'body': text})
+
+    @staticmethod
+    def build_environ(scope, body):
+        script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+        path_info = scope['path'].encode('utf8').decode('latin1')
+        if script_name and path_info.startswith(script_name):
+            path_info = path_info[len(script_name):]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': script_name,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin1')
+            value = value.decode('latin1')
+            if name == 'content-length':
+                key = 'CONTENT_LENGTH'
+            elif name == 'content-type':
+                key = 'CONTENT_TYPE'
+            else:
+                key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def _run_wsgi(self, loop, scope, body, send):
+        """Calls the WSGI app in a pool thread and forwards its response"""
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        state = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['status'] = int(status.split(' ', 1)[0])
+            state['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+        def ensure_started():
+            if not state.get('started'):
+                state['started'] = True
+                send_sync({'type': 'http.response.start', 'status': state['status'], 'headers': state['headers']})
+
+        result = self.wsgi_app(self.build_environ(scope, body), start_response)
+        try:
+            for chunk in result:
+                if chunk:
+                    ensure_started()
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            ensure_started()
+            send_sync({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+# Initialize database once (safe with gunicorn --preload)
+flask_app = create_app()
+
+app = ThreadPoolWsgiAdapter(
+    flask_app,
+    max_threads=int(os.environ.get('ASGI_THREADS', 16)),
+    spool_max_size=int(os.environ.get('ASGI_SPOOL_MAX_SIZE', 512 * 1024)),
+    max_body_size=flask_app.config.get('MAX_CONTENT_LENGTH'),
+)
+
+BOOT_SECONDS = time.perf_counter() - BOOT_STARTED
+flask_app.logger.info('ASGI app loaded in %.1f ms', BOOT_SECONDS * 1000)
@@ -0,0 +1,144 @@
+"""
+Сборка статических файлов: минификация, хэш в имени и предсжатие.
+
+    python -m assets build
+
+Каждый файл из ASSETS минифицируется и записывается в static/dist под
+именем с хэшем содержимого (js/app.3f2a9c1b7e.js) вместе со сжатыми
+копиями .gz и .br (brotli, если установлен пакет Brotli). Соответствие
+исходных имен собранным хранится в static/dist/manifest.json; шаблоны
+получают ссылки через asset_url('js/app.js'). Такие файлы не меняются и
+кэшируются браузером на год, а после правки исходника получают новое имя.
+
+Без сборки asset_url отдает ссылки на исходные файлы.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli  # Необязательная зависимость, без нее собираются только .gz
+except ImportError:
+    brotli = None
+
+# Исходные файлы относительно static/
+ASSETS = ('style.css', 'js/app.js')
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Сжатые копии, которые отдаются вместо файла: (Content-Encoding, расширение)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+CSS_SPACE_RE = re.compile(r'\s+')
+CSS_PUNCT_RE = re.compile(r'\s*([{};,>])\s*')
+
+
+def minify_css(source):
+    """Удаляет комментарии и лишние пробелы, не трогая значения свойств"""
+    source = CSS_COMMENT_RE.sub('', source)
+    source = CSS_SPACE_RE.sub(' ', source)
+    source = CSS_PUNCT_RE.sub(r'\1', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    """Консервативная минификация: отступы, пустые строки и строчные комментарии
+
+    Строки внутри шаблонных строк (`...`) остаются как есть, переводы строк
+    сохраняются, поэтому автоматическая расстановка точек с запятой не
+    меняется.
+    """
+    lines = []
+    in_template = False
+    for line in source.split('\n'):
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        # Незакрытая обратная кавычка переводит в шаблонную строку и обратно
+        if (line.count('`') - line.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def fingerprinted_name(name, content):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.blake2b(content, digest_size=5).hexdigest()}{ext}'
+
+
+def build(static_folder, names=ASSETS):
+    """Собирает файлы в static/dist, возвращает манифест {исходное имя: собранное}"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for name in names:
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            source = f.read()
+        minify = MINIFIERS.get(os.path.splitext(name)[1])
+        content = (minify(source) if minify else source).encode('utf-8')
+
+        built = fingerprinted_name(name, content)
+        path = os.path.join(dist, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+        manifest[name] = f'{DIST_DIR}/{built}'
+
+    tmp_path = os.path.join(dist, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, os.path.join(dist, MANIFEST_NAME))
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Манифест последней сборки или пустой словарь, если сборки не было"""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def compressed_variant(path, accept_encodings):
+    """Сжатая копия файла, которую принимает клиент: (путь, Content-Encoding) или None"""
+    for encoding, suffix in ENCODINGS:
+        if encoding in accept_encodings and os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сборка статических файлов')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Минифицировать, добавить хэш в имена и сжать')
+    args = parser.parse_args()
+
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    if args.command == 'build':
+        manifest = build(static_folder)
+        for name, built in manifest.items():
+            sizes = [os.path.getsize(os.path.join(static_folder, name))]
+            sizes += [os.path.getsize(os.path.join(static_folder, built) + suffix)
+                      for suffix in ('', '.gz', '.br') if os.path.exists(os.path.join(static_folder, built) + suffix)]
+            print(f'{name} -> {built} ({" / ".join(f"{size / 1024:.1f} КБ" for size in sizes)})')
+        if brotli is None:
+            print('Пакет Brotli не установлен: собраны только .gz')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,444 @@
+"""
+Резервные копии базы, шардов и чеков с восстановлением на момент времени.
+
+    python -m backup create                  # новая копия, проверка, удаление старых сверх BACKUP_KEEP
+    python -m backup list
+    python -m backup verify [имя]            # по умолчанию последняя копия
+    python -m backup restore --at "2024-05-31 18:00" [--dry-run]
+
+Каждая копия - каталог BACKUP_DIR/<YYYYMMDD-HHMMSS>:
+    loans.db, shards/lender_<id>.db   - online backup API SQLite порциями по
+                                        BACKUP_PAGES_PER_STEP страниц с паузой,
+                                        запись в базу не ждет окончания копии
+    uploads/, archive/                - чеки и пакеты архива; файлы, которые не
+                                        изменились с прошлой копии, - жесткие
+                                        ссылки на нее, а не новые копии
+    manifest.json                     - время, размеры и sha256 баз, список
+                                        файлов, длительность и результат проверки
+
+Копия собирается во временном каталоге и публикуется переименованием, так
+что незавершенная копия не видна restore. Сразу после создания копия
+проверяется восстановлением: каждая база копируется во временный файл,
+проходит PRAGMA integrity_check, а все чеки, на которые ссылаются платежи,
+должны найтись в uploads/ или в пакете archive/.
+
+Базы в режиме WAL (шарды) копируются из снимка транзакции чтения: запись
+продолжается и не перезапускает копию. В режиме журнала отката запись
+проходит между шагами, но любая запись заставляет SQLite начать копию
+заново; после max_restarts перезапусков база копируется за один шаг, и
+запись ждет его окончания (десятки миллисекунд на базу в десятки МБ, см.
+benchmarks/backup.py). Сессии и счетчики rate limiting не копируются:
+после восстановления пользователи входят заново.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+MANIFEST_NAME = 'manifest.json'
+NAME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+class BackupRestarted(Exception):
+    """Источник изменился во время копирования, и SQLite начал копию заново"""
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backup_database(source_path, target_path, pages=256, sleep=0.005, max_restarts=3):
+    """Копирует базу через online backup API, возвращает (шагов, перезапусков)
+
+    Используется и для снимка чтения в replica.py.
+    """
+    restarts = 0
+    steps = 0
+    while True:
+        state = {'remaining': None}
+
+        def progress(status, remaining, total):
+            nonlocal steps
+            steps += 1
+            if state['remaining'] is not None and remaining > state['remaining']:
+                raise BackupRestarted()
+            state['remaining'] = remaining
+
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+                # Транзакция чтения фиксирует снимок WAL: копия не перезапускается, запись не ждет
+                source.execute('BEGIN')
+                source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                source.backup(target, pages=pages, progress=progress, sleep=sleep)
+            elif restarts < max_restarts:
+                source.backup(target, pages=pages, progress=progress, sleep=sleep)
+            else:
+                source.backup(target)
+            break
+        except BackupRestarted:
+            restarts += 1
+        finally:
+            target.close()
+            source.close()
+    return steps, restarts
+
+
+def copy_database(source_path, target_path, pages=256, sleep=0.005, max_restarts=3):
+    """Копирует базу через online backup API, возвращает сведения для манифеста"""
+    started = time.perf_counter()
+    steps, restarts = backup_database(source_path, target_path, pages, sleep, max_restarts)
+    return {
+        'size': os.path.getsize(target_path),
+        'sha256': sha256_file(target_path),
+        'steps': steps,
+        'restarts': restarts,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def link_or_copy(source, target):
+    """Жесткая ссылка, если файловая система позволяет, иначе копия"""
+    try:
+        os.link(source, target)
+        return True
+    except OSError:
+        shutil.copy2(source, target)
+        return False
+
+
+def snapshot_files(source_dir, target_dir, previous_dir=None):
+    """Копирует файлы каталога; неизмененные с прошлой копии - жесткими ссылками на нее
+
+    Файл считается неизмененным, если в прошлой копии есть файл с тем же
+    именем, размером и mtime. Возвращает {имя: размер} и счетчики.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    files = {}
+    linked = copied = copied_bytes = 0
+    if not os.path.isdir(source_dir):
+        return files, {'files': 0, 'bytes': 0, 'linked': 0, 'copied': 0, 'copied_bytes': 0}
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            stat = entry.stat()
+            target = os.path.join(target_dir, entry.name)
+            previous = os.path.join(previous_dir, entry.name) if previous_dir else None
+            if previous:
+                try:
+                    previous_stat = os.stat(previous)
+                except FileNotFoundError:
+                    previous_stat = None
+                if (previous_stat is not None and previous_stat.st_size == stat.st_size
+                        and previous_stat.st_mtime_ns == stat.st_mtime_ns):
+                    # Другое устройство или файловая система без жестких ссылок - обычная копия
+                    if link_or_copy(previous, target):
+                        linked += 1
+                    else:
+                        copied += 1
+                        copied_bytes += stat.st_size
+                    files[entry.name] = stat.st_size
+                    continue
+            shutil.copy2(entry.path, target)
+            copied += 1
+            copied_bytes += stat.st_size
+            files[entry.name] = stat.st_size
+    return files, {'files': len(files), 'bytes': sum(files.values()), 'linked': linked, 'copied': copied,
+                   'copied_bytes': copied_bytes}
+
+
+def list_backups(backup_dir):
+    """Имена завершенных копий по возрастанию времени"""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = []
+    for name in os.listdir(backup_dir):
+        if os.path.isfile(os.path.join(backup_dir, name, MANIFEST_NAME)):
+            try:
+                datetime.strptime(name, NAME_FORMAT)
+            except ValueError:
+                continue
+            names.append(name)
+    return sorted(names)
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(path, manifest):
+    tmp_path = os.path.join(path, MANIFEST_NAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_NAME))
+
+
+def create_backup(backup_dir, database_path, shard_dir, upload_folder, archive_folder,
+                  pages=256, sleep=0.005, verify=True):
+    """Создает копию, проверяет ее и возвращает манифест"""
+    started = time.perf_counter()
+    created_at = time.time()
+    name = datetime.fromtimestamp(created_at).strftime(NAME_FORMAT)
+    existing = list_backups(backup_dir)
+    if name in existing:
+        raise ValueError(f'Копия {name} уже существует')
+    previous = os.path.join(backup_dir, existing[-1]) if existing else None
+
+    path = os.path.join(backup_dir, name)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, 'shards'))
+
+    # Сначала базы, затем файлы: чеки сохраняются до вставки платежа, поэтому
+    # все, на что ссылается скопированная база, уже лежит на диске
+    databases = {'loans.db': copy_database(database_path, os.path.join(tmp_path, 'loans.db'), pages, sleep)}
+    if os.path.isdir(shard_dir):
+        for shard in sorted(os.listdir(shard_dir)):
+            if shard.startswith('lender_') and shard.endswith('.db'):
+                databases[f'shards/{shard}'] = copy_database(
+                    os.path.join(shard_dir, shard), os.path.join(tmp_path, 'shards', shard), pages, sleep)
+
+    uploads, upload_stats = snapshot_files(upload_folder, os.path.join(tmp_path, 'uploads'),
+                                           previous and os.path.join(previous, 'uploads'))
+    packs, archive_stats = snapshot_files(archive_folder, os.path.join(tmp_path, 'archive'),
+                                          previous and os.path.join(previous, 'archive'))
+    manifest = {
+        'name': name,
+        'created_at': created_at,
+        'created': datetime.fromtimestamp(created_at).isoformat(timespec='seconds'),
+        'previous': os.path.basename(previous) if previous else None,
+        'databases': databases,
+        'uploads': upload_stats,
+        'archive': archive_stats,
+        'files': {'uploads': uploads, 'archive': packs},
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+    write_manifest(tmp_path, manifest)
+    os.replace(tmp_path, path)
+
+    if verify:
+        manifest['verification'] = verify_backup(path)
+        write_manifest(path, manifest)
+    return manifest
+
+
+def verify_backup(path):
+    """Проверяет копию восстановлением во временный каталог
+
+    Возвращает {'ok': bool, 'errors': [...], 'duration_ms': ...}.
+    """
+    started = time.perf_counter()
+    manifest = load_manifest(path)
+    errors = []
+    referenced = set()
+    archived = {}
+    with tempfile.TemporaryDirectory(prefix='friendly_loan_restore_') as workdir:
+        for name, info in manifest['databases'].items():
+            source = os.path.join(path, name)
+            if not os.path.isfile(source):
+                errors.append(f'{name}: файла нет')
+                continue
+            if sha256_file(source) != info['sha256']:
+                errors.append(f'{name}: sha256 не совпадает с манифестом')
+                continue
+            restored = os.path.join(workdir, os.path.basename(name))
+            copy_database(source, restored, pages=-1)
+            conn = sqlite3.connect(restored)
+            try:
+                result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+                if result != 'ok':
+                    errors.append(f'{name}: integrity_check: {result}')
+                    continue
+                referenced.update(row[0] for row in conn.execute(
+                    'SELECT DISTINCT document_path FROM payments WHERE document_path IS NOT NULL'))
+                if name == 'loans.db' and conn.execute(
+                        "SELECT 1 FROM sqlite_master WHERE name = 'archived_documents'").fetchone():
+                    archived = dict(conn.execute('SELECT document_path, pack FROM archived_documents'))
+            except sqlite3.Error as e:
+                errors.append(f'{name}: {e}')
+            finally:
+                conn.close()
+
+    uploads = manifest['files']['uploads']
+    packs = manifest['files']['archive']
+    for kind, files in (('uploads', uploads), ('archive', packs)):
+        for file_name, size in files.items():
+            try:
+                if os.path.getsize(os.path.join(path, kind, file_name)) != size:
+                    errors.append(f'{kind}/{file_name}: размер не совпадает с манифестом')
+            except FileNotFoundError:
+                errors.append(f'{kind}/{file_name}: файла нет')
+
+    missing = [document_path for document_path in sorted(referenced)
+               if os.path.basename(document_path) not in uploads and archived.get(document_path) not in packs]
+    if missing:
+        errors.append(f'Нет {len(missing)} чеков, на которые ссылаются платежи: {", ".join(missing[:5])}')
+    return {
+        'ok': not errors,
+        'errors': errors,
+        'documents_checked': len(referenced),
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def find_backup(backup_dir, at):
+    """Последняя копия, сделанная не позже момента at (datetime), или None"""
+    candidates = [name for name in list_backups(backup_dir) if datetime.strptime(name, NAME_FORMAT) <= at]
+    return candidates[-1] if candidates else None
+
+
+def restore_backup(path, database_path, shard_dir, upload_folder, archive_folder, dry_run=False):
+    """Восстанавливает базы и файлы из копии, возвращает список действий
+
+    Выполнять при остановленном приложении. Текущие базы сохраняются рядом
+    с суффиксом .pre-restore-<время>; шарды, которых не было в копии,
+    сохраняются так же и убираются. Чеки и пакеты, которых нет на месте,
+    возвращаются жесткими ссылками из копии (файлы после записи не
+    меняются); лишние файлы не удаляются.
+    """
+    manifest = load_manifest(path)
+    suffix = '.pre-restore-' + datetime.now().strftime(NAME_FORMAT)
+    actions = []
+
+    targets = {'loans.db': database_path}
+    targets.update({name: os.path.join(shard_dir, os.path.basename(name))
+                    for name in manifest['databases'] if name.startswith('shards/')})
+    stale_shards = []
+    if os.path.isdir(shard_dir):
+        stale_shards = [os.path.join(shard_dir, shard) for shard in sorted(os.listdir(shard_dir))
+                        if shard.startswith('lender_') and shard.endswith('.db')
+                        and f'shards/{shard}' not in manifest['databases']]
+
+    for name, target in targets.items():
+        if os.path.exists(target):
+            actions.append(f'сохранить {target} -> {target}{suffix}')
+            if not dry_run:
+                copy_database(target, target + suffix, pages=-1)
+        actions.append(f'восстановить {target} из {name}')
+        if not dry_run:
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            # Через backup API, а не копированием файла: журнал и WAL текущей базы остаются согласованными
+            copy_database(os.path.join(path, name), target, pages=-1)
+    for shard in stale_shards:
+        actions.append(f'убрать шард {shard} -> {shard}{suffix}')
+        if not dry_run:
+            copy_database(shard, shard + suffix, pages=-1)
+            for leftover in (shard, shard + '-wal', shard + '-shm'):
+                if os.path.exists(leftover):
+                    os.unlink(leftover)
+
+    for kind, folder in (('uploads', upload_folder), ('archive', archive_folder)):
+        missing = [file_name for file_name in manifest['files'][kind]
+                   if not os.path.exists(os.path.join(folder, file_name))]
+        if missing:
+            actions.append(f'вернуть {len(missing)} файлов в {folder}')
+        if not dry_run and missing:
+            os.makedirs(folder, exist_ok=True)
+            for file_name in missing:
+                link_or_copy(os.path.join(path, kind, file_name), os.path.join(folder, file_name))
+    return actions
+
+
+def prune_backups(backup_dir, keep):
+    """Удаляет копии сверх последних keep, возвращает их имена
+
+    Жесткие ссылки делают удаление безопасным: файл остается на диске,
+    пока на него ссылается хотя бы одна копия.
+    """
+    names = list_backups(backup_dir)
+    removed = names[:-keep] if keep > 0 else []
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name))
+    return removed
+
+
+def parse_moment(value):
+    """'YYYY-MM-DD', 'YYYY-MM-DD HH:MM[:SS]' или имя копии -> datetime"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', NAME_FORMAT):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    # Дата без времени - конец этого дня
+    return datetime.strptime(value, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+
+
+def main():
+    from app import app
+
+    parser = argparse.ArgumentParser(description='Резервные копии и восстановление')
+    sub = parser.add_subparsers(dest='command', required=True)
+    create = sub.add_parser('create', help='Создать и проверить копию')
+    create.add_argument('--keep', type=int, default=app.config['BACKUP_KEEP'],
+                        help='Сколько последних копий оставить (по умолчанию BACKUP_KEEP, 0 - все)')
+    create.add_argument('--no-verify', action='store_true', help='Не проверять копию восстановлением')
+    sub.add_parser('list', help='Список копий')
+    verify = sub.add_parser('verify', help='Проверить копию восстановлением во временный каталог')
+    verify.add_argument('name', nargs='?', help='Имя копии (по умолчанию последняя)')
+    restore = sub.add_parser('restore', help='Восстановить последнюю копию не позже момента --at')
+    restore.add_argument('--at', required=True, help='YYYY-MM-DD [HH:MM[:SS]] или имя копии')
+    restore.add_argument('--dry-run', action='store_true', help='Только показать действия')
+    restore.add_argument('--force', action='store_true', help='Восстановить, даже если проверка не прошла')
+    args = parser.parse_args()
+
+    backup_dir = app.config['BACKUP_DIR']
+    locations = (app.config['DATABASE_PATH'], app.config['SHARD_DIR'], app.config['UPLOAD_FOLDER'],
+                 app.config['ARCHIVE_FOLDER'])
+    if args.command == 'create':
+        os.makedirs(backup_dir, exist_ok=True)
+        manifest = create_backup(backup_dir, *locations, pages=app.config['BACKUP_PAGES_PER_STEP'],
+                                 sleep=app.config['BACKUP_STEP_SLEEP'], verify=not args.no_verify)
+        manifest.pop('files')
+        manifest['pruned'] = prune_backups(backup_dir, args.keep)
+        print(json.dumps(manifest, indent=2, ensure_ascii=False))
+        if not manifest.get('verification', {'ok': True})['ok']:
+            raise SystemExit(1)
+    elif args.command == 'list':
+        for name in list_backups(backup_dir):
+            manifest = load_manifest(os.path.join(backup_dir, name))
+            verification = manifest.get('verification')
+            status = 'не проверена' if verification is None else ('ok' if verification['ok'] else 'ОШИБКА')
+            size = sum(info['size'] for info in manifest['databases'].values())
+            print(f"{name}  базы {size / 1024 / 1024:.1f} МБ, чеков {manifest['uploads']['files']} "
+                  f"(новых {manifest['uploads']['copied']}), {manifest['duration_ms'] / 1000:.1f} с, {status}")
+    elif args.command == 'verify':
+        names = list_backups(backup_dir)
+        name = args.name or (names[-1] if names else None)
+        if name not in names:
+            parser.error(f'Копия не найдена: {args.name or backup_dir}')
+        result = verify_backup(os.path.join(backup_dir, name))
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        if not result['ok']:
+            raise SystemExit(1)
+    else:
+        try:
+            at = parse_moment(args.at)
+        except ValueError:
+            parser.error('Неверный --at, ожидается YYYY-MM-DD [HH:MM[:SS]]')
+        name = find_backup(backup_dir, at)
+        if name is None:
+            parser.error(f'Нет копий, сделанных не позже {at}')
+        path = os.path.join(backup_dir, name)
+        result = verify_backup(path)
+        if not result['ok'] and not args.force:
+            print(json.dumps(result, indent=2, ensure_ascii=False))
+            parser.error(f'Копия {name} не прошла проверку, восстановление отменено (--force - восстановить)')
+        print(f'Копия {name}' + (' (пробный запуск)' if args.dry_run else ''))
+        for action in restore_backup(path, *locations, dry_run=args.dry_run):
+            print(f'  {action}')
+
+
+if __name__ == '__main__':
+    main()
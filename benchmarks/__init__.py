@@ -0,0 +1,8 @@
+"""
+Нагрузочные тесты и бенчмарки Friendly Loan.
+
+generate_data - генератор синтетического портфеля (пользователи, кредиты,
+платежи и файлы чеков), harness - прогон основных сценариев через тестовый
+клиент Flask или живой сервер с отчетом p50/p95/p99 и сравнением с базовой
+линией.
+"""
@@ -0,0 +1,124 @@
+"""
+Длительность резервной копии и ее влияние на задержку запросов.
+
+Сценарии list_loans и add_payment (как в harness) выполняются в нескольких
+потоках сначала без копии, затем во время непрерывного создания копий с
+каждым значением --pages (-1 - вся база за один шаг). Для каждого прогона
+выводятся p50/p95/p99/max запросов и длительность копий.
+
+Пример:
+    python -m benchmarks.backup --payments 200000 --duration 10 --pages -1 64 256 1024
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+
+from benchmarks.harness import FlaskClientDriver, Scenario, percentile, prepare_local_app
+
+FLOWS = ('list_loans', 'add_payment')
+
+
+def measure(make_scenario, duration, threads, background=None):
+    """Гоняет сценарии duration секунд, пока выполняется background()"""
+    latencies = {flow: [] for flow in FLOWS}
+    lock = threading.Lock()
+    stop = threading.Event()
+    scenarios = [make_scenario() for _ in range(threads)]
+
+    def worker(scenario, flow):
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            scenario.run(flow)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies[flow].extend(local)
+
+    workers = [threading.Thread(target=worker, args=(scenario, FLOWS[i % len(FLOWS)]))
+               for i, scenario in enumerate(scenarios)]
+    background_results = []
+
+    def run_background():
+        while not stop.is_set():
+            background_results.append(background())
+
+    if background is not None:
+        workers.append(threading.Thread(target=run_background))
+    for thread in workers:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in workers:
+        thread.join()
+
+    report = {}
+    for flow, values in latencies.items():
+        values.sort()
+        report[flow] = {
+            'requests': len(values),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p95_ms': round(percentile(values, 95) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+        }
+    return report, background_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Влияние резервного копирования на задержку запросов')
+    parser.add_argument('--duration', type=float, default=10, help='Секунд на каждый прогон')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--pages', type=int, nargs='+', default=[-1, 256],
+                        help='Страниц за шаг online backup API (-1 - за один шаг)')
+    parser.add_argument('--sleep', type=float, default=0.005, help='Пауза между шагами, с')
+    parser.add_argument('--lenders', type=int, default=5)
+    parser.add_argument('--borrowers', type=int, default=50)
+    parser.add_argument('--loans', type=int, default=2000)
+    parser.add_argument('--payments', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    flask_app, username, password, workdir = prepare_local_app(args)
+    import backup
+
+    def make_scenario():
+        scenario = Scenario(FlaskClientDriver(flask_app), username, password)
+        scenario.prepare()
+        return scenario
+
+    config = flask_app.config
+    backup_dir = os.path.join(workdir, 'backups')
+
+    def create():
+        try:
+            manifest = backup.create_backup(backup_dir, config['DATABASE_PATH'], config['SHARD_DIR'],
+                                            config['UPLOAD_FOLDER'], config['ARCHIVE_FOLDER'],
+                                            pages=pages, sleep=args.sleep, verify=False)
+        except ValueError:
+            # Копия с таким именем (время с точностью до секунды) уже есть
+            time.sleep(0.05)
+            return None
+        backup.prune_backups(backup_dir, 1)
+        return manifest['databases']['loans.db']
+
+    results = {'database_mb': round(os.path.getsize(config['DATABASE_PATH']) / 1024 / 1024, 1)}
+    results['no_backup'], _ = measure(make_scenario, args.duration, args.threads)
+    for pages in args.pages:
+        latency, copies = measure(make_scenario, args.duration, args.threads, background=create)
+        copies = [copy for copy in copies if copy is not None]
+        durations = sorted(copy['duration_ms'] for copy in copies)
+        results[f'pages_{pages}'] = dict(latency, backup={
+            'copies': len(copies),
+            'p50_ms': percentile(durations, 50),
+            'max_ms': durations[-1] if durations else 0.0,
+            'restarts': sum(copy['restarts'] for copy in copies),
+        })
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
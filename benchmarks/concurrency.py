@@ -0,0 +1,149 @@
+"""
+Бенчмарк конкурентных загрузок: медленные клиенты отправляют чеки в
+POST /api/payments, пока читатели опрашивают GET /api/loans.
+
+Сравнивает режимы запуска (GUNICORN_PROFILE=sync/gthread/asgi) по
+пропускной способности загрузок и хвостовым задержкам чтения.
+
+Пример:
+    python -m benchmarks.concurrency --url http://127.0.0.1:8000 \\
+        --username bench_lender_0_... --uploads 8 --upload-size 4194304 \\
+        --upload-rate 1048576 --readers 4 --duration 20
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import urllib.parse
+
+from benchmarks.harness import HttpDriver, encode_multipart, percentile
+
+
+def session_cookie(driver):
+    """Cookie сессии в виде строки заголовка Cookie"""
+    return '; '.join(f'{c.name}={c.value}' for c in driver.cookiejar)
+
+
+def slow_upload(base_url, cookie, loan_id, size, rate, chunk_size=64 * 1024):
+    """Отправляет платеж с файлом размера size со скоростью rate байт/с
+
+    Возвращает (HTTP-статус или None, длительность в секундах).
+    """
+    parsed = urllib.parse.urlsplit(base_url)
+    content = b'%PDF-1.4\n' + os.urandom(max(size - 15, 0)) + b'\n%%EOF'
+    body, content_type = encode_multipart(
+        {'loan_id': loan_id, 'amount': 1000, 'payment_date': time.strftime('%Y-%m-%d')},
+        ('file', 'slow_receipt.pdf', content))
+    head = (
+        f'POST /api/payments HTTP/1.1\r\n'
+        f'Host: {parsed.netloc}\r\n'
+        f'Cookie: {cookie}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Length: {len(body)}\r\n'
+        f'Connection: close\r\n\r\n'
+    ).encode('latin1')
+
+    started = time.perf_counter()
+    try:
+        with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=120) as sock:
+            sock.sendall(head)
+            delay = chunk_size / rate if rate else 0
+            for offset in range(0, len(body), chunk_size):
+                sock.sendall(body[offset:offset + chunk_size])
+                if delay:
+                    time.sleep(delay)
+            response = b''
+            while b'\r\n' not in response:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                response += data
+        status = int(response.split(b' ', 2)[1]) if response.startswith(b'HTTP/') else None
+    except OSError:
+        status = None
+    return status, time.perf_counter() - started
+
+
+def run(url, username, password, uploads, upload_size, upload_rate, readers, duration, read_path):
+    driver = HttpDriver(url)
+    status, _ = driver.request('POST', '/api/login', json_body={'username': username, 'password': password})
+    if status != 200:
+        raise RuntimeError(f'Не удалось войти как {username}')
+    status, body = driver.request('GET', '/api/loans')
+    loan_ids = [loan['id'] for loan in json.loads(body)]
+    if not loan_ids:
+        raise RuntimeError(f'У пользователя {username} нет кредитов')
+    cookie = session_cookie(driver)
+
+    stop = threading.Event()
+    upload_results = []
+    read_latencies = []
+    read_errors = [0]
+    lock = threading.Lock()
+
+    def uploader(index):
+        while not stop.is_set():
+            result = slow_upload(url, cookie, loan_ids[index % len(loan_ids)], upload_size, upload_rate)
+            with lock:
+                upload_results.append(result)
+
+    def reader():
+        reader_driver = HttpDriver(url)
+        reader_driver.request('POST', '/api/login', json_body={'username': username, 'password': password})
+        while not stop.is_set():
+            started = time.perf_counter()
+            status, _ = reader_driver.request('GET', read_path)
+            elapsed = time.perf_counter() - started
+            with lock:
+                read_latencies.append(elapsed)
+                if status != 200:
+                    read_errors[0] += 1
+
+    threads = [threading.Thread(target=uploader, args=(i,), daemon=True) for i in range(uploads)]
+    threads += [threading.Thread(target=reader, daemon=True) for _ in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=120)
+    wall = time.perf_counter() - started
+
+    completed = [seconds for status, seconds in upload_results if status == 200]
+    read_latencies.sort()
+    return {
+        'uploads_completed': len(completed),
+        'uploads_failed': len(upload_results) - len(completed),
+        'upload_throughput_mb_s': round(len(completed) * upload_size / wall / 1024 / 1024, 2),
+        'reads': len(read_latencies),
+        'read_errors': read_errors[0],
+        'read_p50_ms': round(percentile(read_latencies, 50) * 1000, 1),
+        'read_p95_ms': round(percentile(read_latencies, 95) * 1000, 1),
+        'read_p99_ms': round(percentile(read_latencies, 99) * 1000, 1),
+        'reads_per_s': round(len(read_latencies) / wall, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Конкурентные медленные загрузки и задержка чтения')
+    parser.add_argument('--url', required=True)
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', default='bench123')
+    parser.add_argument('--uploads', type=int, default=8, help='Одновременных медленных загрузок')
+    parser.add_argument('--upload-size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--upload-rate', type=int, default=1024 * 1024, help='Скорость клиента, байт/с')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--read-path', default='/api/loans')
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+
+    result = run(args.url, args.username, args.password, args.uploads, args.upload_size,
+                 args.upload_rate, args.readers, args.duration, args.read_path)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
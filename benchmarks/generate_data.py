@@ -0,0 +1,150 @@
+"""
+Генератор синтетического портфеля для бенчмарков.
+
+Пример:
+    python -m benchmarks.generate_data --db /tmp/bench/loans.db \\
+        --uploads /tmp/bench/static/uploads \\
+        --lenders 10 --borrowers 200 --loans 1000 --payments 20000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import bcrypt
+
+# Все синтетические пользователи получают один пароль
+DEFAULT_PASSWORD = 'bench123'
+
+FIRST_NAMES = ['Иван', 'Петр', 'Анна', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга']
+LAST_NAMES = ['Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Волков']
+
+
+def init_schema(db_path):
+    """Создает схему базы данных тем же кодом, что и приложение"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    import app as friendly_loan
+    friendly_loan.app.config['DATABASE_PATH'] = db_path
+    friendly_loan.init_db()
+    return friendly_loan
+
+
+def make_pdf_blob(rng, size):
+    """Псевдо-PDF заданного размера с корректной сигнатурой"""
+    header = b'%PDF-1.4\n% synthetic receipt\n'
+    body = rng.randbytes(max(size - len(header) - 6, 0))
+    return header + body + b'\n%%EOF'
+
+
+def write_upload_blobs(rng, uploads_dir, count, min_size, max_size):
+    """Записывает набор файлов чеков, которые затем делят между собой платежи"""
+    os.makedirs(uploads_dir, exist_ok=True)
+    blobs = []
+    for i in range(count):
+        name = f'receipt_{i:05d}.pdf'
+        with open(os.path.join(uploads_dir, name), 'wb') as f:
+            f.write(make_pdf_blob(rng, rng.randint(min_size, max_size)))
+        blobs.append(name)
+    return blobs
+
+
+def generate(db_path, uploads_dir, lenders, borrowers, loans, payments,
+             blobs=50, min_blob_size=50 * 1024, max_blob_size=400 * 1024, seed=42):
+    """Заполняет базу синтетическими данными и возвращает статистику"""
+    rng = random.Random(seed)
+    init_schema(db_path)
+
+    # Один bcrypt-хеш со стандартной стоимостью: логин в бенчмарке
+    # стоит столько же, сколько в продакшене, а генерация остается быстрой
+    password_hash = bcrypt.hashpw(DEFAULT_PASSWORD.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    suffix = f'{int(time.time())}_{seed}'
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+
+    lender_ids = []
+    for i in range(lenders):
+        cursor.execute('INSERT INTO users (username, password_hash, role, full_name) VALUES (?, ?, ?, ?)',
+                       (f'bench_lender_{i}_{suffix}', password_hash, 'lender', f'Кредитодатель {i}'))
+        lender_ids.append(cursor.lastrowid)
+
+    borrower_ids = []
+    for i in range(borrowers):
+        full_name = f'{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)}'
+        cursor.execute('INSERT INTO users (username, password_hash, role, full_name) VALUES (?, ?, ?, ?)',
+                       (f'bench_borrower_{i}_{suffix}', password_hash, 'borrower', full_name))
+        borrower_ids.append(cursor.lastrowid)
+
+    loan_rows = []
+    today = date.today()
+    for _ in range(loans):
+        amount = rng.randrange(10_000, 2_000_000, 1_000)
+        interest_rate = rng.choice([0, 5, 7.5, 10, 12, 15, 20])
+        term_months = rng.choice([6, 12, 24, 36, 60, 120])
+        start_date = today - timedelta(days=rng.randint(0, 30 * term_months))
+        monthly_rate = interest_rate / 100 / 12
+        if monthly_rate == 0:
+            monthly_payment = amount / term_months
+        else:
+            growth = (1 + monthly_rate) ** term_months
+            monthly_payment = amount * monthly_rate * growth / (growth - 1)
+        cursor.execute('''
+            INSERT INTO loans (lender_id, borrower_id, amount, interest_rate, start_date, term_months, monthly_payment, total_payment)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (rng.choice(lender_ids), rng.choice(borrower_ids), amount, interest_rate,
+              start_date.isoformat(), term_months, round(monthly_payment), round(monthly_payment * term_months)))
+        loan_rows.append((cursor.lastrowid, start_date, round(monthly_payment)))
+
+    blob_names = write_upload_blobs(rng, uploads_dir, blobs, min_blob_size, max_blob_size) if blobs else []
+
+    payment_rows = []
+    for _ in range(payments):
+        loan_id, start_date, monthly_payment = rng.choice(loan_rows)
+        payment_date = start_date + timedelta(days=rng.randint(0, max((today - start_date).days, 0)))
+        blob = rng.choice(blob_names) if blob_names else None
+        payment_rows.append((
+            loan_id, monthly_payment, payment_date.isoformat(),
+            f'static/uploads/{blob}' if blob else None, blob
+        ))
+    cursor.executemany('''
+        INSERT INTO payments (loan_id, amount, payment_date, document_path, document_name)
+        VALUES (?, ?, ?, ?, ?)
+    ''', payment_rows)
+
+    conn.commit()
+    conn.close()
+
+    return {
+        'lenders': lender_ids,
+        'borrowers': borrower_ids,
+        'loans': len(loan_rows),
+        'payments': len(payment_rows),
+        'blobs': len(blob_names),
+        'password': DEFAULT_PASSWORD,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор синтетического портфеля кредитов')
+    parser.add_argument('--db', default='loans.db', help='Путь к базе данных SQLite')
+    parser.add_argument('--uploads', default='static/uploads', help='Каталог для файлов чеков')
+    parser.add_argument('--lenders', type=int, default=5)
+    parser.add_argument('--borrowers', type=int, default=50)
+    parser.add_argument('--loans', type=int, default=200)
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--blobs', type=int, default=50, help='Количество различных файлов чеков')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = generate(os.path.abspath(args.db), args.uploads, args.lenders, args.borrowers,
+                     args.loans, args.payments, args.blobs, seed=args.seed)
+    print(f"Создано: кредитодателей {len(stats['lenders'])}, закредитованных {len(stats['borrowers'])}, "
+          f"кредитов {stats['loans']}, платежей {stats['payments']}, файлов {stats['blobs']} "
+          f"за {time.perf_counter() - started:.1f} с (пароль: {stats['password']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+Прогон основных сценариев приложения с замером задержек.
+
+Сценарии: логин, список кредитов, платеж с файлом, перерасчет кредита и
+удаление закредитованного. Для каждого считаются p50/p95/p99 и пропускная
+способность, результат можно сохранить как базовую линию и сравнивать с ней
+последующие прогоны - регрессия завершает процесс с кодом 1.
+
+Примеры:
+    # Тестовый клиент Flask на синтетических данных во временном каталоге
+    python -m benchmarks.harness --iterations 200 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.harness --iterations 200 --baseline benchmarks/baseline.json
+
+    # Живой сервер (gunicorn), данные заранее созданы generate_data
+    python -m benchmarks.harness --url http://127.0.0.1:8000 \\
+        --username bench_lender_0_... --password bench123 --concurrency 8
+"""
+import argparse
+import http.cookiejar
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+FLOWS = ('login', 'list_loans', 'add_payment', 'recalculate', 'delete_borrower')
+
+# Размер чека, отправляемого в сценарии add_payment
+RECEIPT_SIZE = 100 * 1024
+
+
+class FlaskClientDriver:
+    """Запросы через тестовый клиент Flask внутри процесса"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, json_body=None, form=None, file=None):
+        kwargs = {}
+        if json_body is not None:
+            kwargs['json'] = json_body
+        if form is not None:
+            data = dict(form)
+            if file is not None:
+                field, filename, content = file
+                data[field] = (io.BytesIO(content), filename)
+            kwargs['data'] = data
+            kwargs['content_type'] = 'multipart/form-data'
+        response = self.client.open(path, method=method, **kwargs)
+        return response.status_code, response.get_data()
+
+
+class HttpDriver:
+    """Запросы к живому серверу через urllib с сохранением cookie сессии"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookiejar = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookiejar))
+
+    def request(self, method, path, json_body=None, form=None, file=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body, headers['Content-Type'] = encode_multipart(form, file)
+
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def encode_multipart(form, file=None):
+    """Кодирует поля формы и файл в multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in form.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    if file is not None:
+        field, filename, content = file
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8') + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def percentile(sorted_values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Scenario:
+    """Выполнение одного сценария от имени залогиненного кредитодателя"""
+
+    def __init__(self, driver, username, password):
+        self.driver = driver
+        self.username = username
+        self.password = password
+        self.rng = random.Random()
+        self.receipt = b'%PDF-1.4\n' + os.urandom(RECEIPT_SIZE) + b'\n%%EOF'
+        self.loan_ids = []
+
+    def login(self):
+        status, _ = self.driver.request('POST', '/api/login',
+                                        json_body={'username': self.username, 'password': self.password})
+        return status == 200
+
+    def prepare(self):
+        if not self.login():
+            raise RuntimeError(f'Не удалось войти как {self.username}')
+        status, body = self.driver.request('GET', '/api/loans')
+        self.loan_ids = [loan['id'] for loan in json.loads(body)] if status == 200 else []
+        if not self.loan_ids:
+            raise RuntimeError(f'У пользователя {self.username} нет кредитов для бенчмарка')
+
+    def setup_delete_borrower(self):
+        """Создает закредитованного, которого затем удалит замеряемый запрос"""
+        username = f'bench_del_{uuid.uuid4().hex[:10]}'  # CreateBorrowerForm: до 20 символов
+        status, _ = self.driver.request('POST', '/api/borrowers', json_body={
+            'username': username, 'password': 'bench123', 'full_name': 'Удаляемый Пользователь'
+        })
+        if status != 200:
+            return None
+        status, body = self.driver.request('GET', '/api/borrowers')
+        for borrower in json.loads(body) if status == 200 else []:
+            if borrower['username'] == username:
+                return borrower['id']
+        return None
+
+    def run(self, flow, context=None):
+        """Выполняет сценарий, возвращает True при успешном ответе"""
+        if flow == 'login':
+            return self.login()
+        if flow == 'list_loans':
+            status, _ = self.driver.request('GET', '/api/loans')
+            return status == 200
+        if flow == 'add_payment':
+            status, _ = self.driver.request('POST', '/api/payments', form={
+                'loan_id': self.rng.choice(self.loan_ids),
+                'amount': self.rng.randrange(1000, 50000),
+                'payment_date': time.strftime('%Y-%m-%d'),
+            }, file=('file', 'bench_receipt.pdf', self.receipt))
+            return status == 200
+        if flow == 'recalculate':
+            status, _ = self.driver.request('GET', f'/api/loans/{self.rng.choice(self.loan_ids)}/recalculate')
+            return status == 200
+        if flow == 'delete_borrower':
+            status, _ = self.driver.request('DELETE', f'/api/borrowers/{context}')
+            return status == 200
+        raise ValueError(f'Неизвестный сценарий: {flow}')
+
+
+def run_flow(make_scenario, flow, iterations, concurrency, warmup):
+    """Прогоняет сценарий в нескольких потоках и возвращает статистику"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_thread = [iterations // concurrency + (1 if i < iterations % concurrency else 0)
+                  for i in range(concurrency)]
+    scenarios = [make_scenario() for _ in range(concurrency)]
+
+    def worker(scenario, count):
+        local = []
+        local_errors = 0
+        for i in range(warmup + count):
+            context = scenario.setup_delete_borrower() if flow == 'delete_borrower' else None
+            started = time.perf_counter()
+            ok = scenario.run(flow, context)
+            elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            local.append(elapsed)
+            if not ok:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker, args=(scenario, count))
+               for scenario, count in zip(scenarios, per_thread)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    if flow == 'delete_borrower':
+        # Подготовка (создание пользователя с bcrypt) не входит в пропускную способность
+        wall = sum(latencies) / concurrency
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Возвращает список регрессий относительно базовой линии"""
+    regressions = []
+    for flow, current in results.items():
+        base = baseline.get('flows', {}).get(flow)
+        if not base:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if base[metric] > 0 and current[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f'{flow}: {metric} {current[metric]} > {base[metric]} (+{tolerance:.0%})')
+        if base['throughput_rps'] > 0 and current['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{flow}: throughput_rps {current['throughput_rps']} < "
+                               f"{base['throughput_rps']} (-{tolerance:.0%})")
+        if current['errors'] > base.get('errors', 0):
+            regressions.append(f"{flow}: errors {current['errors']} > {base.get('errors', 0)}")
+    return regressions
+
+
+def prepare_local_app(args):
+    """Создает временный каталог с синтетическими данными и возвращает приложение"""
+    from benchmarks import generate_data
+
+    # Лимиты запросов отключаем: иначе сценарии упрутся в 429, а не в производительность
+    os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+    workdir = tempfile.mkdtemp(prefix='friendly_loan_bench_')
+    os.chdir(workdir)
+    db_path = os.path.join(workdir, 'loans.db')
+    stats = generate_data.generate(
+        db_path, os.path.join(workdir, 'static', 'uploads'),
+        args.lenders, args.borrowers, args.loans, args.payments, seed=args.seed)
+
+    import app as friendly_loan
+    conn = friendly_loan.get_db_connection()
+    username = conn.execute('SELECT username FROM users WHERE id = ?', (stats['lenders'][0],)).fetchone()[0]
+    conn.close()
+    return friendly_loan.app, username, stats['password'], workdir
+
+
+def print_report(results):
+    header = f"{'flow':<16}{'req':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}"
+    print(header)
+    print('-' * len(header))
+    for flow, r in results.items():
+        print(f"{flow:<16}{r['requests']:>7}{r['errors']:>6}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['throughput_rps']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк основных сценариев Friendly Loan')
+    parser.add_argument('--url', help='Адрес живого сервера; без него используется тестовый клиент Flask')
+    parser.add_argument('--username', help='Кредитодатель для режима --url')
+    parser.add_argument('--password', default='bench123')
+    parser.add_argument('--flows', default=','.join(FLOWS), help='Список сценариев через запятую')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--lenders', type=int, default=5)
+    parser.add_argument('--borrowers', type=int, default=50)
+    parser.add_argument('--loans', type=int, default=200)
+    parser.add_argument('--payments', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help='JSON базовой линии для сравнения')
+    parser.add_argument('--save-baseline', help='Сохранить результаты как базовую линию')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое ухудшение (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    flows = [flow.strip() for flow in args.flows.split(',') if flow.strip()]
+    unknown = set(flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    if args.url:
+        if not args.username:
+            parser.error('Для режима --url нужен --username')
+        username, password = args.username, args.password
+        make_driver = lambda: HttpDriver(args.url)  # noqa: E731
+        target = args.url
+    else:
+        flask_app, username, password, target = prepare_local_app(args)
+        make_driver = lambda: FlaskClientDriver(flask_app)  # noqa: E731
+
+    def make_scenario():
+        scenario = Scenario(make_driver(), username, password)
+        scenario.prepare()
+        return scenario
+
+    results = {}
+    for flow in flows:
+        results[flow] = run_flow(make_scenario, flow, args.iterations, args.concurrency, args.warmup)
+
+    print(f'Цель: {target}, итераций: {args.iterations}, потоков: {args.concurrency}')
+    print_report(results)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': 'http' if args.url else 'test_client',
+        'iterations': args.iterations,
+        'concurrency': args.concurrency,
+        'flows': results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f'Базовая линия сохранена: {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print('\n!!! РЕГРЕССИЯ ПРОИЗВОДИТЕЛЬНОСТИ !!!', file=sys.stderr)
+            for line in regressions:
+                print('  ' + line, file=sys.stderr)
+            sys.exit(1)
+        print('Регрессий относительно базовой линии нет')
+
+
+if __name__ == '__main__':
+    main()
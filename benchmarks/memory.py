@@ -0,0 +1,91 @@
+"""
+Пик памяти списочных эндпоинтов при разных бюджетах памяти запроса.
+
+К одному кредиту кредитодателя добавляются --big-loan платежей и столько
+же событий журнала, затем каждый список запрашивается при каждом значении
+--budgets (МБ, 0 - без ограничения). Пик выделений считает сам сервер
+(MEMORY_TRACKING=tracemalloc), тело ответа клиент читает по кускам и не
+хранит.
+
+Пример:
+    python -m benchmarks.memory --big-loan 100000 --budgets 0 64 16
+"""
+import argparse
+import json
+import os
+import shutil
+
+from benchmarks.harness import prepare_local_app
+
+
+def add_big_loan(conn, lender_id, count):
+    """Добавляет платежи и события журнала самому большому кредиту кредитодателя"""
+    loan_id, borrower_id = conn.execute('''
+        SELECT l.id, l.borrower_id FROM loans l LEFT JOIN payments p ON p.loan_id = l.id
+        WHERE l.lender_id = ? GROUP BY l.id ORDER BY COUNT(p.id) DESC LIMIT 1
+    ''', (lender_id,)).fetchone()
+    conn.executemany('''
+        INSERT INTO payments (loan_id, amount, payment_date, document_path, document_name) VALUES (?, ?, ?, ?, ?)
+    ''', ((loan_id, 1000 + i % 7, f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}',
+           f'static/uploads/receipt_{i}.pdf', f'receipt_{i}.pdf') for i in range(count)))
+    conn.executemany('''
+        INSERT INTO ledger_events (loan_id, lender_id, borrower_id, event_type, payment_id, paid_delta, count_delta)
+        VALUES (?, ?, ?, 'payment_added', ?, 1000, 1)
+    ''', ((loan_id, lender_id, borrower_id, i) for i in range(count)))
+    conn.commit()
+    return loan_id
+
+
+def measure(client, url, memory):
+    """Статус, размер тела, пик памяти на сервере и был ли ответ потоковым"""
+    memory.REQUEST_MEMORY.clear()
+    response = client.get(url, buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    series = list(memory.REQUEST_MEMORY.snapshot().values())
+    peak = series[0][1] if series else 0
+    return {
+        'status': response.status_code,
+        'body_kb': round(size / 1024),
+        'peak_mb': round(peak / 1024 / 1024, 1),
+        'streamed': 'ETag' not in response.headers,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пик памяти списочных эндпоинтов')
+    parser.add_argument('--big-loan', type=int, default=100000, help='Платежей и событий журнала у одного кредита')
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0, 64, 16],
+                        help='MEMORY_REQUEST_BUDGET_MB (0 - без ограничения)')
+    parser.add_argument('--lenders', type=int, default=2)
+    parser.add_argument('--borrowers', type=int, default=20)
+    parser.add_argument('--loans', type=int, default=400)
+    parser.add_argument('--payments', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['MEMORY_TRACKING'] = 'tracemalloc'
+    flask_app, username, password, workdir = prepare_local_app(args)
+    import app as friendly_loan
+    import memory
+
+    conn = friendly_loan.get_db_connection()
+    lender_id = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()[0]
+    loan_id = add_big_loan(conn, lender_id, args.big_loan)
+    conn.close()
+
+    client = flask_app.test_client()
+    client.post('/api/login', json={'username': username, 'password': password})
+    urls = ('/api/loans', f'/api/loans/{loan_id}/payments', f'/api/loans/{loan_id}/ledger',
+            f'/api/loans/{loan_id}/payments?format=columns')
+
+    results = {}
+    for budget in args.budgets:
+        memory._request_budget = int(budget * 1024 * 1024)
+        results[f'budget_{budget:g}mb'] = {url: measure(client, url, memory) for url in urls}
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
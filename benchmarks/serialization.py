@@ -0,0 +1,123 @@
+"""
+Размер и время сериализации ответов списочных эндпоинтов.
+
+Сравнивает формат строк (список словарей, как сейчас отдает /api/loans) и
+?format=columns, стандартный json (как jsonify) и orjson, а также gzip на
+каждый запрос против кэша сжатых ответов.
+
+Пример:
+    python -m benchmarks.serialization --loans 1000 --payments 500
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import time
+from datetime import date, timedelta
+
+import serialization
+from app import LOAN_FIELDS, PAYMENT_FIELDS
+
+
+def synthetic_loans(count, rng):
+    """Строки в форме ответа get_loans"""
+    rows = []
+    for i in range(count):
+        start = date(2023, 1, 1) + timedelta(days=rng.randint(0, 900))
+        term = rng.choice((6, 12, 24, 36, 60))
+        total = rng.randint(50, 5000) * 1000
+        paid = rng.randint(0, total)
+        rows.append({
+            'id': i + 1,
+            'amount': int(total * 0.85),
+            'interest_rate': rng.choice((0.0, 5.5, 10.0, 12.5)),
+            'start_date': start.isoformat(),
+            'term_months': term,
+            'monthly_payment': total // term,
+            'total_payment': total,
+            'created_at': f'{start.isoformat()} 12:{i % 60:02d}:00',
+            'lender_id': 1,
+            'borrower_id': rng.randint(2, 200),
+            'user_name': f'Заемщик {rng.randint(1, 200)}',
+            'user_role_display': 'Закредитованный',
+            'total_paid': paid,
+            'remaining_amount': total - paid,
+            'progress_percent': round(paid / total * 100, 1),
+            'payments_count': rng.randint(0, 60),
+            'last_payment_date': (start + timedelta(days=rng.randint(0, 400))).isoformat(),
+            'planned_last_payment_date': (start + timedelta(days=30 * term)).isoformat(),
+        })
+    return rows
+
+
+def synthetic_payments(count, rng):
+    """Строки в форме ответа get_loan_payments"""
+    return [{
+        'id': i + 1,
+        'amount': rng.randint(1, 100) * 1000,
+        'payment_date': (date(2024, 1, 1) + timedelta(days=i)).isoformat(),
+        'document_path': f'static/uploads/receipt_{i}_20240101_120000.pdf',
+        'document_name': f'receipt_{i}.pdf',
+        'created_at': f'2024-01-01 12:00:{i % 60:02d}',
+    } for i in range(count)]
+
+
+def timed(func, repeat):
+    """Среднее время вызова в миллисекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def stdlib_dumps(payload):
+    # Так сериализует jsonify по умолчанию: sort_keys, ensure_ascii, перевод строки
+    return (json.dumps(payload, sort_keys=True, ensure_ascii=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def measure(name, rows, fields, repeat):
+    columns = serialization.to_columns(rows, fields)
+    result = {'endpoint': name, 'rows': len(rows), 'serializer': 'orjson' if serialization.orjson else 'json'}
+
+    for label, payload in (('rows', rows), ('columns', columns)):
+        body = serialization.dumps(payload)
+        result[f'{label}_bytes'] = len(body)
+        result[f'{label}_gzip_bytes'] = len(gzip.compress(body, compresslevel=6))
+
+    result['jsonify_ms'] = round(timed(lambda: stdlib_dumps(rows), repeat), 3)
+    result['dumps_rows_ms'] = round(timed(lambda: serialization.dumps(rows), repeat), 3)
+    result['dumps_columns_ms'] = round(timed(
+        lambda: serialization.dumps(serialization.to_columns(rows, fields)), repeat), 3)
+
+    body = serialization.dumps(rows)
+    cache = serialization.CompressedCache()
+    result['gzip_ms'] = round(timed(lambda: gzip.compress(body, compresslevel=6), repeat), 3)
+
+    def cached():
+        key = hashlib.blake2b(body, digest_size=16).hexdigest()
+        return cache.get_or_compress(key, body, 6)
+
+    cached()
+    result['gzip_cached_ms'] = round(timed(cached, repeat), 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Размер и время сериализации списочных ответов')
+    parser.add_argument('--loans', type=int, default=1000)
+    parser.add_argument('--payments', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = [
+        measure('/api/loans', synthetic_loans(args.loans, rng), LOAN_FIELDS, args.repeat),
+        measure('/api/loans/<id>/payments', synthetic_payments(args.payments, rng), PAYMENT_FIELDS, args.repeat),
+    ]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
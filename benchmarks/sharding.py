@@ -0,0 +1,90 @@
+"""
+Пропускная способность записи: одна общая база против шардов кредитодателей.
+
+Каждый процесс изображает кредитодателя и вносит платежи отдельными
+транзакциями (как add_payment). В режиме single все пишут в один файл и
+ждут общую блокировку записи, в режиме sharded - каждый в свой шард.
+
+Пример:
+    python -m benchmarks.sharding --lenders 1 2 4 8 --transactions 300
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from app import LOANS_TABLE_SQL, PAYMENTS_TABLE_SQL
+from sharding import ShardRouter
+
+
+def writer(args):
+    mode, workdir, lender_id, transactions, start_event = args
+    if mode == 'sharded':
+        router = ShardRouter(os.path.join(workdir, 'global.db'), os.path.join(workdir, 'shards'),
+                             [LOANS_TABLE_SQL, PAYMENTS_TABLE_SQL])
+        conn = router.connect(lender_id)
+    else:
+        conn = sqlite3.connect(os.path.join(workdir, 'global.db'), timeout=60)
+    conn.execute('PRAGMA busy_timeout = 60000')
+    loan_id = conn.execute('''
+        INSERT INTO loans (lender_id, borrower_id, amount, interest_rate, start_date, term_months, monthly_payment, total_payment)
+        VALUES (?, 1, 100000, 10, '2024-01-01', 12, 9000, 108000)
+    ''', (lender_id,)).lastrowid
+    conn.commit()
+
+    start_event.wait()
+    started = time.perf_counter()
+    for i in range(transactions):
+        conn.execute('INSERT INTO payments (loan_id, amount, payment_date) VALUES (?, ?, ?)',
+                     (loan_id, 1000, '2024-02-01'))
+        conn.execute('SELECT SUM(amount) FROM payments WHERE loan_id = ?', (loan_id,)).fetchone()
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def run(mode, lenders, transactions):
+    with tempfile.TemporaryDirectory(prefix='friendly_loan_shards_') as workdir:
+        conn = sqlite3.connect(os.path.join(workdir, 'global.db'))
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(LOANS_TABLE_SQL)
+        conn.execute(PAYMENTS_TABLE_SQL)
+        conn.commit()
+        conn.close()
+
+        manager = multiprocessing.Manager()
+        start_event = manager.Event()
+        with multiprocessing.Pool(lenders) as pool:
+            result = pool.map_async(writer, [(mode, workdir, lender_id, transactions, start_event)
+                                             for lender_id in range(1, lenders + 1)])
+            time.sleep(0.5)
+            wall_started = time.perf_counter()
+            start_event.set()
+            result.get()
+            wall = time.perf_counter() - wall_started
+        manager.shutdown()
+    return round(lenders * transactions / wall, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запись в общую базу и в шарды кредитодателей')
+    parser.add_argument('--lenders', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--transactions', type=int, default=300, help='Платежей на кредитодателя')
+    args = parser.parse_args()
+
+    results = []
+    for lenders in args.lenders:
+        results.append({
+            'lenders': lenders,
+            'single_tx_per_s': run('single', lenders, args.transactions),
+            'sharded_tx_per_s': run('sharded', lenders, args.transactions),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,19 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///loans.db'
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # Largest JSON request body; bigger bodies are rejected with 413 before parsing
+    MAX_JSON_BODY_KB = int(os.environ.get('MAX_JSON_BODY_KB') or 256)
+    
+    # Receipt archive for paid-off loans (python -m archive run)
+    ARCHIVE_FOLDER = os.environ.get('ARCHIVE_FOLDER') or 'archive'
+    ARCHIVE_MIN_AGE_DAYS = float(os.environ.get('ARCHIVE_MIN_AGE_DAYS') or 30)
+    ARCHIVE_PACK_SIZE_MB = float(os.environ.get('ARCHIVE_PACK_SIZE_MB') or 256)
+    
+    # Backups (python -m backup create): online backup API step size and pause, retention
+    BACKUP_DIR = os.environ.get('BACKUP_DIR') or 'backups'
+    BACKUP_PAGES_PER_STEP = int(os.environ.get('BACKUP_PAGES_PER_STEP') or 256)
+    BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP') or 0.005)
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP') or 14)
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx'}
     
     # Security settings
@@ -15,13 +28,69 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     
-    # Rate limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
+    # Server-side sessions: sqlite:///, redis://, memory:// or cookie (signed cookies, no revocation)
+    SESSION_STORAGE_URL = os.environ.get('SESSION_STORAGE_URL') or 'sqlite:///sessions.db'
+    SESSION_CACHE_SECONDS = float(os.environ.get('SESSION_CACHE_SECONDS') or 5)
+    SESSION_SWEEP_SECONDS = float(os.environ.get('SESSION_SWEEP_SECONDS') or 600)
+    
+    # Per-lender SQLite shards for loans and payments
+    SHARDING_ENABLED = (os.environ.get('SHARDING_ENABLED') or 'false').lower() in ('1', 'true', 'yes')
+    SHARD_DIR = os.environ.get('SHARD_DIR') or 'shards'
+    
+    # Read-only snapshot of the database for list and report endpoints
+    REPLICA_ENABLED = (os.environ.get('REPLICA_ENABLED') or 'false').lower() in ('1', 'true', 'yes')
+    REPLICA_PATH = os.environ.get('REPLICA_PATH') or 'loans.db.replica'
+    REPLICA_MAX_STALENESS = float(os.environ.get('REPLICA_MAX_STALENESS') or 30)
+    REPLICA_REFRESH_SECONDS = float(os.environ.get('REPLICA_REFRESH_SECONDS') or 10)
+    REPLICA_BACKUP_PAGES = int(os.environ.get('REPLICA_BACKUP_PAGES') or 256)
+    REPLICA_AUTO_REFRESH = (os.environ.get('REPLICA_AUTO_REFRESH') or 'true').lower() in ('1', 'true', 'yes')
+    
+    # Append-only ledger: checkpoint of loan state every N events
+    LEDGER_CHECKPOINT_EVERY = int(os.environ.get('LEDGER_CHECKPOINT_EVERY') or 50)
+    
+    # Interest accrual day-count convention: actual/365, actual/360 or 30/360
+    ACCRUAL_DAY_COUNT = os.environ.get('ACCRUAL_DAY_COUNT') or 'actual/365'
+    
+    # Idempotency-Key replay for loan and payment creation
+    IDEMPOTENCY_TTL_HOURS = float(os.environ.get('IDEMPOTENCY_TTL_HOURS') or 24)
+    IDEMPOTENCY_PENDING_TIMEOUT = float(os.environ.get('IDEMPOTENCY_PENDING_TIMEOUT') or 60)
+    
+    # Borrower overview (/api/me/overview): per-process cache lifetime and recent payments per loan
+    OVERVIEW_CACHE_SECONDS = float(os.environ.get('OVERVIEW_CACHE_SECONDS') or 10)
+    OVERVIEW_RECENT_PAYMENTS = int(os.environ.get('OVERVIEW_RECENT_PAYMENTS') or 3)
+    
+    # Rate limiting (sqlite:/// для одного хоста, redis:// для кластера)
+    RATELIMIT_ENABLED = (os.environ.get('RATELIMIT_ENABLED') or 'true').lower() in ('1', 'true', 'yes')
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or os.environ.get('REDIS_URL') or 'sqlite:///ratelimit.db'
+    RATELIMIT_TRUST_PROXY = (os.environ.get('RATELIMIT_TRUST_PROXY') or 'false').lower() in ('1', 'true', 'yes')
     RATELIMIT_DEFAULT = "200 per day, 50 per hour"
     
     # Logging
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
     LOG_FILE = os.environ.get('LOG_FILE') or 'app.log'
+    
+    # Metrics and SQL profiling
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 100)
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS') or 1000)
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    
+    # Per-request memory: tracking mode and sample rate, request budget (lists above it stream), worker RSS budget
+    MEMORY_TRACKING = os.environ.get('MEMORY_TRACKING') or 'off'
+    MEMORY_SAMPLE_RATE = float(os.environ.get('MEMORY_SAMPLE_RATE') or 1.0)
+    MEMORY_REQUEST_BUDGET_MB = float(os.environ.get('MEMORY_REQUEST_BUDGET_MB') or 64)
+    MEMORY_WORKER_BUDGET_MB = float(os.environ.get('MEMORY_WORKER_BUDGET_MB') or 0)
+    
+    # JSON list responses: gzip in the app with a cache of compressed bodies
+    JSON_GZIP_MIN_SIZE = int(os.environ.get('JSON_GZIP_MIN_SIZE') or 1024)
+    JSON_GZIP_LEVEL = int(os.environ.get('JSON_GZIP_LEVEL') or 6)
+    JSON_GZIP_CACHE_SIZE = int(os.environ.get('JSON_GZIP_CACHE_SIZE') or 256)
+    
+    # Push updates (SSE): sqlite, redis or memory bridge between workers
+    EVENTS_ENABLED = (os.environ.get('EVENTS_ENABLED') or 'false').lower() in ('1', 'true', 'yes')
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND') or 'sqlite'
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL') or 1.0)
+    EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS') or 15)
+    EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS') or 300)
 
 class DevelopmentConfig(Config):
     """Конфигурация для разработки"""
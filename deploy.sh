@@ -45,10 +45,13 @@ source venv/bin/activate
 echo -e "${YELLOW}Installing Python dependencies...${NC}"
 pip install --upgrade pip
 pip install -r requirements.txt
+python -m assets build
 
 # Create necessary directories
 echo -e "${YELLOW}Creating necessary directories...${NC}"
 mkdir -p static/uploads
+mkdir -p archive
+mkdir -p backups
 mkdir -p logs
 
 # Set permissions
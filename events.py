@@ -0,0 +1,241 @@
+"""
+Push-уведомления об изменениях кредитов и платежей (Server-Sent Events).
+
+EventBroker раздает события подписчикам внутри процесса. Между воркерами
+gunicorn события передаются через мост:
+    memory - только текущий процесс (один воркер, разработка)
+    sqlite - таблица change_events, каждый воркер опрашивает ее раз в
+             EVENTS_POLL_INTERVAL секунд; поддерживает досылку по Last-Event-ID
+    redis  - канал Redis pub/sub
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Сколько событий может ждать медленный клиент, прежде чем получит resync
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class EventBroker:
+    """Подписки пользователей на события внутри процесса"""
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        bridge.attach(self)
+
+    def subscribe(self, user_id):
+        subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        self.bridge.ensure_listening()
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def subscribed_users(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, user_ids, event_type, data):
+        """Отправляет событие пользователям во всех воркерах"""
+        for user_id in set(user_ids):
+            if user_id is not None:
+                self.bridge.publish(user_id, event_type, data)
+
+    def dispatch(self, user_id, event_id, event_type, data):
+        """Кладет событие в очереди подписчиков этого процесса"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event_id, event_type, data))
+            except queue.Full:
+                # Клиент не успевает читать: сбрасываем очередь и просим перезагрузить данные
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait((event_id, 'resync', {}))
+
+    def replay(self, user_id, last_event_id):
+        """События, пропущенные клиентом при переподключении"""
+        return self.bridge.replay(user_id, last_event_id)
+
+
+class MemoryBridge:
+    """События только внутри текущего процесса"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.broker = None
+
+    def attach(self, broker):
+        self.broker = broker
+
+    def ensure_listening(self):
+        pass
+
+    def publish(self, user_id, event_type, data):
+        self.broker.dispatch(user_id, next(self._ids), event_type, data)
+
+    def replay(self, user_id, last_event_id):
+        return []
+
+
+class SQLiteBridge:
+    """Передача событий между воркерами через таблицу change_events
+
+    Поток-опросчик запускается при первой подписке в процессе и читает
+    новые строки по возрастанию id. Старые события удаляются через
+    retention секунд.
+    """
+
+    def __init__(self, db_path, poll_interval=1.0, retention=3600):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.broker = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def attach(self, broker):
+        self.broker = broker
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def publish(self, user_id, event_type, data):
+        conn = self._connect()
+        try:
+            conn.execute('INSERT INTO change_events (user_id, event_type, payload) VALUES (?, ?, ?)',
+                         (user_id, event_type, json.dumps(data, ensure_ascii=False)))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def replay(self, user_id, last_event_id):
+        if not last_event_id:
+            return []
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT id, event_type, payload FROM change_events
+                WHERE user_id = ? AND id > ? ORDER BY id
+            ''', (user_id, last_event_id)).fetchall()
+        finally:
+            conn.close()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+    def ensure_listening(self):
+        with self._lock:
+            # После fork поток родителя в воркере не существует
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._poll, name='events-poller', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _poll(self):
+        conn = self._connect()
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_events').fetchone()[0]
+        last_cleanup = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                users = self.broker.subscribed_users()
+                if not users:
+                    last_id = conn.execute('SELECT COALESCE(MAX(id), ?) FROM change_events', (last_id,)).fetchone()[0]
+                    continue
+                rows = conn.execute(
+                    'SELECT id, user_id, event_type, payload FROM change_events WHERE id > ? ORDER BY id',
+                    (last_id,)).fetchall()
+                subscribed = set(users)
+                for event_id, user_id, event_type, payload in rows:
+                    last_id = event_id
+                    if user_id in subscribed:
+                        self.broker.dispatch(user_id, event_id, event_type, json.loads(payload))
+
+                if time.monotonic() - last_cleanup > 60:
+                    last_cleanup = time.monotonic()
+                    conn.execute("DELETE FROM change_events WHERE created_at < datetime('now', ?)",
+                                 (f'-{int(self.retention)} seconds',))
+                    conn.commit()
+            except sqlite3.Error as e:
+                logger.warning('Ошибка опроса событий: %s', e)
+
+
+class RedisBridge:
+    """Передача событий между воркерами и хостами через Redis pub/sub"""
+
+    CHANNEL = 'friendly_loan:events'
+
+    def __init__(self, url):
+        import redis  # Необязательная зависимость, нужна только в этом режиме
+        self.client = redis.Redis.from_url(url)
+        self.broker = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def attach(self, broker):
+        self.broker = broker
+
+    def publish(self, user_id, event_type, data):
+        message = json.dumps({'user_id': user_id, 'event_type': event_type, 'data': data}, ensure_ascii=False)
+        self.client.publish(self.CHANNEL, message)
+
+    def replay(self, user_id, last_event_id):
+        return []
+
+    def ensure_listening(self):
+        with self._lock:
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._listen, name='events-redis', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _listen(self):
+        ids = itertools.count(1)
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    event = json.loads(message['data'])
+                    self.broker.dispatch(event['user_id'], next(ids), event['event_type'], event['data'])
+            except Exception as e:
+                logger.warning('Потеряно соединение с Redis для событий: %s', e)
+                time.sleep(1)
+
+
+def create_broker(backend, db_path=None, redis_url=None, poll_interval=1.0):
+    """Создает брокер событий с нужным мостом между воркерами"""
+    if backend == 'sqlite':
+        return EventBroker(SQLiteBridge(db_path, poll_interval))
+    if backend == 'redis':
+        return EventBroker(RedisBridge(redis_url))
+    if backend == 'memory':
+        return EventBroker(MemoryBridge())
+    raise ValueError(f'Неизвестный мост событий: {backend}')
+
+
+def format_sse(event_id, event_type, data):
+    """Сообщение в формате text/event-stream"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
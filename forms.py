@@ -0,0 +1,32 @@
+from wtforms import Form, StringField, IntegerField, FloatField, DateField, validators
+
+
+def strip_filter(value):
+    """Убирает пробелы по краям строки, как раньше делали обработчики"""
+    return value.strip() if isinstance(value, str) else value
+
+# Формы валидации
+class LoginForm(Form):
+    # Вход проверяет только разумные границы: имена и пароли, созданные до появления
+    # CreateBorrowerForm, могут не подходить под правила создания
+    username = StringField('Username', [validators.Length(min=1, max=150, message='Неверное имя пользователя или пароль')])
+    password = StringField('Password', [validators.Length(min=1, max=1024, message='Неверное имя пользователя или пароль')])
+
+class CreateBorrowerForm(Form):
+    username = StringField('Username', [validators.Length(min=3, max=20, message='Имя пользователя от 3 до 20 символов'), validators.Regexp(r'^[a-zA-Z0-9_]+$', message='Только буквы, цифры и подчеркивания')], filters=[strip_filter])
+    password = StringField('Password', [validators.Length(min=4, max=100, message='Пароль от 4 до 100 символов')], filters=[strip_filter])
+    full_name = StringField('Full Name', [validators.Length(min=2, max=100, message='ФИО от 2 до 100 символов'), validators.Regexp(r'^[а-яА-ЯёЁa-zA-Z\s-]+$', message='Только буквы, пробелы и дефис')], filters=[strip_filter])
+
+class CalculateForm(Form):
+    amount = IntegerField('Amount', [validators.NumberRange(min=1000, max=10000000, message='Сумма от 1,000 до 10,000,000')])
+    interest_rate = FloatField('Interest Rate', [validators.NumberRange(min=0, max=50, message='Процентная ставка от 0 до 50')])
+    term_months = IntegerField('Term Months', [validators.NumberRange(min=1, max=600, message='Срок от 1 до 600 месяцев')])
+
+class LoanForm(CalculateForm):
+    start_date = DateField('Start Date', [validators.InputRequired(message='Дата выдачи в формате YYYY-MM-DD')], format='%Y-%m-%d')
+    borrower_id = IntegerField('Borrower ID', [validators.NumberRange(min=1, message='Неверный ID закредитованного')])
+
+class PaymentForm(Form):
+    loan_id = IntegerField('Loan ID', [validators.NumberRange(min=1, message='Неверный ID кредита')])
+    amount = IntegerField('Amount', [validators.NumberRange(min=1, max=1000000000, message='Сумма платежа от 1 до 1,000,000,000')])
+    payment_date = DateField('Payment Date', [validators.InputRequired(message='Дата платежа в формате YYYY-MM-DD')], format='%Y-%m-%d')
@@ -0,0 +1,77 @@
+"""
+Конфигурация gunicorn.
+
+Запуск: gunicorn -c gunicorn.conf.py wsgi:app
+
+Профиль воркеров задается GUNICORN_PROFILE:
+    sync    - синхронные воркеры, один запрос на процесс (по умолчанию)
+    gthread - пул из GUNICORN_THREADS потоков на процесс
+    gevent  - кооперативные гринлеты (нужен пакет gevent)
+    asgi    - uvicorn-воркеры, запуск с asgi:app вместо wsgi:app
+
+По умолчанию приложение загружается в мастер-процессе (preload_app), и
+воркеры получают уже импортированный код и инициализированную базу через
+fork. Время запуска каждого воркера пишется в лог и в метрику
+friendly_loan_worker_boot_seconds.
+
+MEMORY_WORKER_BUDGET_MB ограничивает RSS воркера: превысивший его воркер
+перезапускается после ответа (хук post_request).
+"""
+import os
+import time
+
+bind = os.environ.get('GUNICORN_BIND', f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WORKERS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+
+profile = os.environ.get('GUNICORN_PROFILE', 'sync')
+if profile == 'gthread':
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 8))
+elif profile == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+elif profile == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+elif profile != 'sync':
+    raise RuntimeError(f'Unknown GUNICORN_PROFILE: {profile}')
+
+
+def pre_fork(server, worker):
+    worker.boot_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # Без preload в это время входит импорт приложения внутри воркера
+    started = getattr(worker, 'boot_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    from metrics import WORKER_BOOT
+    WORKER_BOOT.observe(elapsed, 'true' if preload_app else 'false')
+    worker.log.info('Worker %s booted in %.1f ms (preload=%s)', worker.pid, elapsed * 1000, preload_app)
+
+
+def post_request(worker, req, environ, resp):
+    # Воркер с RSS больше MEMORY_WORKER_BUDGET_MB завершается после ответа, как при
+    # max_requests, и мастер запускает новый (uvicorn-воркеры этот хук не вызывают)
+    from memory import worker_over_budget
+    rss = worker_over_budget()
+    if rss is not None and worker.alive:
+        worker.log.warning('Worker %s RSS %.0f MB is over MEMORY_WORKER_BUDGET_MB, restarting',
+                           worker.pid, rss / 1024 / 1024)
+        worker.alive = False
+
+
+def child_exit(server, worker):
+    # Снимок метрик завершившегося воркера больше не суммируется в /metrics
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir:
+        from metrics import remove_worker_snapshot
+        remove_worker_snapshot(metrics_dir, worker.pid)
+
+
+def when_ready(server):
+    server.log.info('Master ready: %s %s workers, preload=%s', workers, profile, preload_app)
@@ -0,0 +1,124 @@
+"""
+Повтор изменяющих запросов по заголовку Idempotency-Key.
+
+Клиент отправляет один и тот же ключ при повторе запроса (двойной клик,
+повтор после обрыва сети). Первый запрос с ключом занимает строку в
+idempotency_keys и выполняется; его ответ сохраняется, и повторы
+получают сохраненный ответ без вставки платежа, записи файла и
+перерасчета.
+
+Ключ действует в пределах пользователя. Повтор с тем же ключом, но
+другими параметрами получает 422, повтор во время выполнения первого
+запроса - 409. Ключ, занятый упавшим запросом, освобождается через
+pending_timeout секунд, сохраненные ответы удаляются через ttl секунд.
+"""
+import hashlib
+import json
+import re
+import time
+
+IDEMPOTENCY_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        status_code INTEGER,
+        mimetype TEXT,
+        body BLOB,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (user_id, idempotency_key)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)',
+]
+
+# Печатные ASCII-символы без пробела, как у UUID и токенов
+KEY_RE = re.compile(r'^[\x21-\x7e]{1,255}$')
+
+# Результаты claim()
+NEW = 'new'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+def fingerprint(request):
+    """Хэш метода, пути и параметров запроса
+
+    Загруженные файлы учитываются по имени и размеру, без чтения
+    содержимого.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{request.method} {request.path}\n'.encode('utf-8'))
+    if request.is_json:
+        digest.update(json.dumps(request.get_json(silent=True), sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    for name, value in sorted(request.form.items(multi=True)):
+        digest.update(f'{name}={value}\n'.encode('utf-8'))
+    for name, upload in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+        upload.stream.seek(0, 2)
+        size = upload.stream.tell()
+        upload.stream.seek(0)
+        digest.update(f'{name}:{upload.filename}:{size}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def claim(conn, user_id, key, request_fingerprint, pending_timeout=60.0, now=None):
+    """Занимает ключ для выполнения запроса
+
+    Возвращает (NEW, None), если запрос нужно выполнить, (REPLAY, (status,
+    mimetype, body)) для сохраненного ответа, (IN_PROGRESS, None) или
+    (MISMATCH, None).
+    """
+    now = time.time() if now is None else now
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO idempotency_keys (user_id, idempotency_key, fingerprint, created_at)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, key, request_fingerprint, now))
+    if cursor.rowcount == 1:
+        conn.commit()
+        return NEW, None
+
+    # Запрос, занявший ключ, не завершился за pending_timeout: считаем его упавшим
+    cursor = conn.execute('''
+        UPDATE idempotency_keys SET fingerprint = ?, created_at = ?
+        WHERE user_id = ? AND idempotency_key = ? AND status_code IS NULL AND created_at < ?
+    ''', (request_fingerprint, now, user_id, key, now - pending_timeout))
+    conn.commit()
+    if cursor.rowcount == 1:
+        return NEW, None
+
+    row = conn.execute('''
+        SELECT fingerprint, status_code, mimetype, body FROM idempotency_keys
+        WHERE user_id = ? AND idempotency_key = ?
+    ''', (user_id, key)).fetchone()
+    if row is None:
+        # Строку удалили между запросами (release или sweep) - пробуем снова
+        return claim(conn, user_id, key, request_fingerprint, pending_timeout, now)
+    if row[0] != request_fingerprint:
+        return MISMATCH, None
+    if row[1] is None:
+        return IN_PROGRESS, None
+    return REPLAY, (row[1], row[2], row[3])
+
+
+def store_response(conn, user_id, key, status_code, mimetype, body):
+    """Сохраняет ответ первого запроса для повторов"""
+    conn.execute('''
+        UPDATE idempotency_keys SET status_code = ?, mimetype = ?, body = ?
+        WHERE user_id = ? AND idempotency_key = ?
+    ''', (status_code, mimetype, body, user_id, key))
+    conn.commit()
+
+
+def release(conn, user_id, key):
+    """Освобождает ключ после ошибки сервера, чтобы повтор выполнился заново"""
+    conn.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?', (user_id, key))
+    conn.commit()
+
+
+def sweep(conn, older_than):
+    """Удаляет ключи старше older_than (unix time), возвращает их число"""
+    cursor = conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (older_than,))
+    conn.commit()
+    return cursor.rowcount
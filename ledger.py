@@ -0,0 +1,179 @@
+"""
+Журнал событий по кредитам и платежам (только добавление).
+
+Каждое изменение (создание и удаление кредита, добавление и удаление
+платежа) пишется в ledger_events в той же транзакции, что и само
+изменение. seq монотонно растет в пределах базы (или шарда), изменять и
+удалять строки журнала запрещают триггеры.
+
+Каждые checkpoint_every событий по кредиту сохраняется контрольная точка
+с накопленным состоянием, поэтому баланс на дату X восстанавливается из
+ближайшей точки до X и не более checkpoint_every последующих событий, а
+не перебором всей истории.
+
+Время событий (recorded_at) - время записи в UTC в формате
+CURRENT_TIMESTAMP ('YYYY-MM-DD HH:MM:SS').
+"""
+import re
+
+EVENT_TYPES = ('loan_created', 'payment_added', 'payment_deleted', 'loan_deleted')
+
+LEDGER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        loan_id INTEGER NOT NULL,
+        lender_id INTEGER NOT NULL,
+        borrower_id INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+        payment_id INTEGER,
+        paid_delta REAL NOT NULL DEFAULT 0,
+        count_delta INTEGER NOT NULL DEFAULT 0,
+        total_payment REAL,
+        effective_date TEXT,
+        recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_ledger_events_loan ON ledger_events (loan_id, seq)',
+    '''
+    CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+        loan_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        recorded_at TIMESTAMP NOT NULL,
+        total_payment REAL NOT NULL,
+        total_paid REAL NOT NULL,
+        payments_count INTEGER NOT NULL,
+        deleted INTEGER NOT NULL,
+        PRIMARY KEY (loan_id, seq)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ledger_events_no_update BEFORE UPDATE ON ledger_events
+    BEGIN SELECT RAISE(ABORT, 'ledger_events is append-only'); END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS ledger_events_no_delete BEFORE DELETE ON ledger_events
+    BEGIN SELECT RAISE(ABORT, 'ledger_events is append-only'); END
+    ''',
+]
+
+AS_OF_RE = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}(:\d{2})?)?$')
+
+
+def normalize_as_of(value):
+    """'2024-05-01' -> '2024-05-01 23:59:59' (конец дня), None если формат неверный"""
+    value = (value or '').strip().replace('T', ' ')
+    if not AS_OF_RE.match(value):
+        return None
+    if len(value) == 10:
+        return value + ' 23:59:59'
+    if len(value) == 16:
+        return value + ':59'
+    return value
+
+
+def append_event(cursor, event_type, loan_id, lender_id, borrower_id, paid_delta=0.0, count_delta=0,
+                 total_payment=None, payment_id=None, effective_date=None, recorded_at=None,
+                 checkpoint_every=50):
+    """Добавляет событие в журнал в текущей транзакции курсора
+
+    После добавления сохраняет контрольную точку, если с предыдущей
+    набралось checkpoint_every событий по этому кредиту.
+    """
+    cursor.execute('''
+        INSERT INTO ledger_events (loan_id, lender_id, borrower_id, event_type, payment_id,
+                                   paid_delta, count_delta, total_payment, effective_date, recorded_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+    ''', (loan_id, lender_id, borrower_id, event_type, payment_id,
+          paid_delta, count_delta, total_payment, effective_date, recorded_at))
+    seq = cursor.lastrowid
+
+    state = replay(cursor, loan_id)
+    if state is not None and state['events_replayed'] >= checkpoint_every:
+        cursor.execute('''
+            INSERT INTO ledger_checkpoints (loan_id, seq, recorded_at, total_payment, total_paid,
+                                            payments_count, deleted)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (loan_id, state['seq'], state['recorded_at'], state['total_payment'], state['total_paid'],
+              state['payments_count'], int(state['deleted'])))
+    return seq
+
+
+def replay(cursor, loan_id, as_of=None):
+    """Состояние кредита по журналу на момент as_of (None - текущее)
+
+    Возвращает None, если до as_of по кредиту не было событий.
+    """
+    as_of = as_of or '9999-12-31 23:59:59'
+    cursor.execute('''
+        SELECT seq, recorded_at, total_payment, total_paid, payments_count, deleted
+        FROM ledger_checkpoints
+        WHERE loan_id = ? AND recorded_at <= ?
+        ORDER BY seq DESC LIMIT 1
+    ''', (loan_id, as_of))
+    checkpoint = cursor.fetchone()
+    if checkpoint:
+        seq, recorded_at, total_payment, total_paid, payments_count, deleted = checkpoint
+        state = {'seq': seq, 'recorded_at': recorded_at, 'total_payment': total_payment,
+                 'total_paid': total_paid, 'payments_count': payments_count, 'deleted': bool(deleted),
+                 'checkpoint_seq': seq}
+    else:
+        state = {'seq': 0, 'recorded_at': None, 'total_payment': 0.0, 'total_paid': 0.0,
+                 'payments_count': 0, 'deleted': False, 'checkpoint_seq': None}
+
+    cursor.execute('''
+        SELECT seq, recorded_at, event_type, paid_delta, count_delta, total_payment
+        FROM ledger_events
+        WHERE loan_id = ? AND seq > ? AND recorded_at <= ?
+        ORDER BY seq
+    ''', (loan_id, state['seq'], as_of))
+    events = cursor.fetchall()
+    if not events and checkpoint is None:
+        return None
+
+    for seq, recorded_at, event_type, paid_delta, count_delta, total_payment in events:
+        state['seq'] = seq
+        state['recorded_at'] = recorded_at
+        state['total_paid'] += paid_delta
+        state['payments_count'] += count_delta
+        if total_payment is not None:
+            state['total_payment'] = total_payment
+        if event_type == 'loan_deleted':
+            state['deleted'] = True
+    state['events_replayed'] = len(events)
+    return state
+
+
+def participants(cursor, loan_id):
+    """(lender_id, borrower_id) кредита по журналу, даже если кредит удален"""
+    cursor.execute('SELECT lender_id, borrower_id FROM ledger_events WHERE loan_id = ? ORDER BY seq LIMIT 1',
+                   (loan_id,))
+    return cursor.fetchone()
+
+
+def backfill(cursor, checkpoint_every=50):
+    """Заполняет журнал для кредитов, созданных до его появления
+
+    Время событий берется из created_at кредитов и платежей. Удаленные
+    ранее платежи восстановить нельзя.
+    """
+    cursor.execute('''
+        SELECT id, lender_id, borrower_id, total_payment, start_date, created_at FROM loans
+        WHERE id NOT IN (SELECT DISTINCT loan_id FROM ledger_events)
+        ORDER BY id
+    ''')
+    loans = cursor.fetchall()
+    for loan_id, lender_id, borrower_id, total_payment, start_date, created_at in loans:
+        append_event(cursor, 'loan_created', loan_id, lender_id, borrower_id,
+                     total_payment=total_payment, effective_date=start_date, recorded_at=created_at,
+                     checkpoint_every=checkpoint_every)
+        cursor.execute('''
+            SELECT id, amount, payment_date, created_at FROM payments
+            WHERE loan_id = ? ORDER BY created_at, id
+        ''', (loan_id,))
+        for payment_id, amount, payment_date, payment_created_at in cursor.fetchall():
+            append_event(cursor, 'payment_added', loan_id, lender_id, borrower_id,
+                         paid_delta=amount, count_delta=1, payment_id=payment_id,
+                         effective_date=payment_date, recorded_at=payment_created_at,
+                         checkpoint_every=checkpoint_every)
+    return len(loans)
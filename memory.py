@@ -0,0 +1,161 @@
+"""
+Память по запросам: замеры, бюджет запроса и бюджет воркера.
+
+MEMORY_TRACKING включает замеры (по умолчанию off):
+    rss         - RSS процесса до и после запроса из /proc/self/statm
+                  (только Linux, единицы микросекунд на запрос); в
+                  гистограмму идет прирост RSS за запрос
+    tracemalloc - пик выделений Python за запрос. Трассировка включается
+                  только на время выбранного запроса и замедляет его в
+                  2-4 раза, поэтому замеряется доля MEMORY_SAMPLE_RATE
+                  запросов и не больше одного запроса процесса за раз.
+                  В потоковых воркерах пик включает выделения соседних
+                  потоков за это время.
+Результат по маршрутам - в гистограмме friendly_loan_request_memory_bytes,
+RSS воркера после запроса - в friendly_loan_worker_rss_bytes.
+
+MEMORY_REQUEST_BUDGET_MB - сколько памяти может занять один запрос.
+Списки, которые по оценке row_budget не помещаются, отдаются потоком
+(serialization.streaming_list_response), ?format=columns для них и JSON,
+который после разбора не поместится, получают 413.
+
+MEMORY_WORKER_BUDGET_MB - RSS воркера, после которого он завершается
+после ответа, как при max_requests (хук post_request в gunicorn.conf.py).
+Python редко возвращает память системе, поэтому перезапуск - единственный
+способ вернуть воркер к исходному размеру.
+"""
+import os
+import random
+import threading
+import tracemalloc
+
+from flask import jsonify, request
+
+from metrics import registry
+
+TRACKING_MODES = ('off', 'rss', 'tracemalloc')
+
+MEMORY_BUCKETS = (64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2,
+                  256 * 1024 ** 2, 1024 ** 3)
+RSS_BUCKETS = (32 * 1024 ** 2, 64 * 1024 ** 2, 128 * 1024 ** 2, 256 * 1024 ** 2, 512 * 1024 ** 2,
+               1024 ** 3, 2 * 1024 ** 3)
+
+# Объекты разобранного JSON занимают примерно во столько раз больше тела запроса
+JSON_EXPANSION = 10
+
+REQUEST_MEMORY = registry.histogram(
+    'friendly_loan_request_memory_bytes', 'Пик выделений Python (tracemalloc) или прирост RSS за запрос',
+    MEMORY_BUCKETS, ('route', 'method', 'mode'))
+WORKER_RSS = registry.histogram(
+    'friendly_loan_worker_rss_bytes', 'RSS воркера после запроса',
+    RSS_BUCKETS, ())
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Задаются в init_memory
+_request_budget = 0
+_worker_budget = 0
+
+
+def current_rss():
+    """RSS текущего процесса в байтах или None, если /proc недоступен"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def row_budget(row_bytes):
+    """Сколько строк списка помещается в бюджет запроса (None - без ограничения)
+
+    row_bytes - память на строку обычного ответа: кортеж из базы, словарь,
+    JSON и сжатая копия.
+    """
+    if not _request_budget:
+        return None
+    return max(_request_budget // row_bytes, 1)
+
+
+def worker_over_budget():
+    """RSS воркера, если он больше MEMORY_WORKER_BUDGET_MB, иначе None"""
+    if not _worker_budget:
+        return None
+    rss = current_rss()
+    return rss if rss is not None and rss > _worker_budget else None
+
+
+class RequestMemoryTracker:
+    """Замер памяти одного запроса: begin() перед обработкой, end() после"""
+
+    def __init__(self, mode='off', sample_rate=1.0):
+        if mode not in TRACKING_MODES:
+            raise ValueError(f'Неизвестный режим MEMORY_TRACKING: {mode}. Допустимо: ' + ', '.join(TRACKING_MODES))
+        if mode == 'rss' and current_rss() is None:
+            raise ValueError('MEMORY_TRACKING=rss требует /proc/self/statm (Linux)')
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self._trace_lock = threading.Lock()
+
+    def begin(self):
+        """Состояние замера или None, если запрос не замеряется"""
+        if self.mode == 'off' or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return None
+        if self.mode == 'rss':
+            return current_rss()
+        # Трассировка общая для процесса: другие запросы в это время не замеряются
+        if tracemalloc.is_tracing() or not self._trace_lock.acquire(blocking=False):
+            return None
+        tracemalloc.start()
+        return 0
+
+    def end(self, state):
+        """Пик выделений или прирост RSS в байтах"""
+        if self.mode == 'rss':
+            return max((current_rss() or state) - state, 0)
+        try:
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+            self._trace_lock.release()
+
+
+def init_memory(app):
+    """Подключает замеры памяти и бюджет запроса к приложению"""
+    global _request_budget, _worker_budget
+    _request_budget = int(app.config.get('MEMORY_REQUEST_BUDGET_MB', 0) * 1024 * 1024)
+    _worker_budget = int(app.config.get('MEMORY_WORKER_BUDGET_MB', 0) * 1024 * 1024)
+    tracker = RequestMemoryTracker(app.config.get('MEMORY_TRACKING', 'off'),
+                                   float(app.config.get('MEMORY_SAMPLE_RATE', 1.0)))
+    states = threading.local()
+
+    @app.before_request
+    def reject_oversized_json():
+        # Тело формы с файлами уходит на диск (SpooledTemporaryFile), JSON разбирается в память целиком
+        if (_request_budget and request.is_json and request.content_length
+                and request.content_length * JSON_EXPANSION > _request_budget):
+            return jsonify({'error': 'Тело запроса не помещается в бюджет памяти запроса'}), 413
+        return None
+
+    if tracker.mode == 'off':
+        return tracker
+
+    @app.before_request
+    def start_memory_tracking():
+        states.token = tracker.begin()
+
+    @app.teardown_request
+    def finish_memory_tracking(exc=None):
+        # teardown выполняется и при исключении, поэтому трассировка не остается включенной
+        token = getattr(states, 'token', None)
+        states.token = None
+        if token is None:
+            return
+        used = tracker.end(token)
+        rule = request.url_rule
+        REQUEST_MEMORY.observe(used, rule.rule if rule is not None else 'unmatched', request.method, tracker.mode)
+        rss = current_rss()
+        if rss is not None:
+            WORKER_RSS.observe(rss)
+
+    return tracker
@@ -0,0 +1,339 @@
+"""
+Инструментирование горячего пути: гистограммы задержек по маршрутам,
+профилирование SQL-запросов и эндпоинт /metrics в формате Prometheus.
+"""
+import bisect
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import structlog
+from flask import Response, g, has_request_context, request
+
+# Границы корзин гистограмм (секунды для задержек, штуки для количества запросов)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+MICRO_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+
+logger = structlog.get_logger('friendly_loan.metrics')
+
+
+class Histogram:
+    """Потокобезопасная гистограмма с метками в стиле Prometheus"""
+
+    def __init__(self, name, help_text, buckets, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [счетчики корзин..., +Inf], сумма
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class MetricsRegistry:
+    """Набор гистограмм процесса с выгрузкой в текстовый формат Prometheus
+
+    Каждый gunicorn-воркер собирает метрики у себя. Если задан METRICS_DIR,
+    воркеры периодически сбрасывают снимки в этот каталог, а /metrics
+    суммирует снимки живых воркеров. Снимок завершившегося воркера
+    (max_requests, перезапуск по памяти) удаляет мастер gunicorn в
+    child_exit, а если воркер был убит - первый collect после этого.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+
+    def histogram(self, name, help_text, buckets, label_names):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help_text, buckets, label_names)
+        return self.histograms[name]
+
+    def snapshot(self):
+        return {
+            name: {'|'.join(labels): series for labels, series in hist.snapshot().items()}
+            for name, hist in self.histograms.items()
+        }
+
+    def dump(self, directory):
+        """Атомарно записывает снимок метрик текущего процесса"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics_{os.getpid()}.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def collect(self, directory=None):
+        """Снимок метрик, объединенный по всем воркерам при наличии каталога"""
+        if not directory:
+            return self.snapshot()
+
+        self.dump(directory)
+        merged = {}
+        for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+            pid = _snapshot_pid(path)
+            if pid is not None and not _pid_alive(pid):
+                remove_worker_snapshot(directory, pid)
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # Воркер как раз перезаписывает свой файл
+            for name, series in data.items():
+                target = merged.setdefault(name, {})
+                for key, (counts, total) in series.items():
+                    if key in target:
+                        target[key][0] = [a + b for a, b in zip(target[key][0], counts)]
+                        target[key][1] += total
+                    else:
+                        target[key] = [list(counts), total]
+        return merged
+
+    def render(self, directory=None):
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        data = self.collect(directory)
+        lines = []
+        for name, hist in self.histograms.items():
+            lines.append(f'# HELP {name} {hist.help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, (counts, total) in sorted(data.get(name, {}).items()):
+                label_values = key.split('|') if key else []
+                labels = ','.join(
+                    f'{label}="{_escape_label(value)}"'
+                    for label, value in zip(hist.label_names, label_values)
+                )
+                cumulative = 0
+                for bound, count in zip(hist.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    bucket_labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                    lines.append(f'{name}_bucket{{{bucket_labels}}} {cumulative}')
+                suffix = f'{{{labels}}}' if labels else ''
+                lines.append(f'{name}_sum{suffix} {total}')
+                lines.append(f'{name}_count{suffix} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _snapshot_pid(path):
+    try:
+        return int(os.path.basename(path)[len('metrics_'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Процесс есть, но принадлежит другому пользователю
+    return True
+
+
+def remove_worker_snapshot(directory, pid):
+    """Удаляет снимок метрик завершившегося воркера"""
+    for path in (os.path.join(directory, f'metrics_{pid}.json'), os.path.join(directory, f'metrics_{pid}.json.tmp')):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    'friendly_loan_request_duration_seconds', 'Время обработки запроса',
+    LATENCY_BUCKETS, ('route', 'method', 'status'))
+REQUEST_QUERIES = registry.histogram(
+    'friendly_loan_request_sql_queries', 'Количество SQL-запросов на HTTP-запрос',
+    QUERY_COUNT_BUCKETS, ('route', 'method'))
+REQUEST_SQL_TIME = registry.histogram(
+    'friendly_loan_request_sql_duration_seconds', 'Суммарное время SQL на HTTP-запрос',
+    LATENCY_BUCKETS, ('route', 'method'))
+RATELIMIT_CHECK = registry.histogram(
+    'friendly_loan_ratelimit_check_seconds', 'Накладные расходы проверки лимита запросов',
+    MICRO_BUCKETS, ('limit', 'allowed'))
+INPUT_VALIDATION = registry.histogram(
+    'friendly_loan_input_validation_seconds', 'Время проверки входных данных запроса по схеме',
+    MICRO_BUCKETS, ('route', 'valid'))
+REPLICA_REFRESH = registry.histogram(
+    'friendly_loan_replica_refresh_seconds', 'Время копирования снимка базы для чтения',
+    LATENCY_BUCKETS, ())
+REPLICA_READ_AGE = registry.histogram(
+    'friendly_loan_replica_age_seconds', 'Возраст снимка базы при чтении списков',
+    (1, 2, 5, 10, 20, 30, 60, 120), ('source',))
+WORKER_BOOT = registry.histogram(
+    'friendly_loan_worker_boot_seconds', 'Время запуска воркера от fork до готовности',
+    LATENCY_BUCKETS, ('preload',))
+
+# Порог медленного запроса, задается в init_metrics
+_slow_query_seconds = 0.1
+
+
+def _record_query(connection, sql, parameters, elapsed):
+    """Учитывает выполненный SQL-запрос в статистике текущего HTTP-запроса"""
+    if has_request_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+
+    if elapsed < _slow_query_seconds:
+        return
+
+    plan = None
+    if sql.lstrip()[:6].upper() == 'SELECT':
+        try:
+            # Обычный курсор, чтобы сам EXPLAIN не попадал в статистику
+            plan = [row[-1] for row in connection.cursor(sqlite3.Cursor).execute(
+                'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()]
+        except sqlite3.Error:
+            plan = None
+    logger.warning('slow_query', sql=' '.join(sql.split()), duration_ms=round(elapsed * 1000, 2),
+                   route=_current_route() if has_request_context() else None, plan=plan)
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время каждого запроса"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_query(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_query(self.connection, sql, (), time.perf_counter() - started)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Соединение SQLite, все курсоры которого профилируются
+
+    Используется как factory для sqlite3.connect().
+    """
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _current_route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def init_metrics(app):
+    """Подключает замеры запросов и эндпоинт /metrics к приложению"""
+    global _slow_query_seconds
+    _slow_query_seconds = float(app.config.get('SLOW_QUERY_MS', 100)) / 1000
+    slow_request_seconds = float(app.config.get('SLOW_REQUEST_MS', 1000)) / 1000
+    metrics_dir = app.config.get('METRICS_DIR')
+    flush_interval = float(app.config.get('METRICS_FLUSH_INTERVAL', 5))
+    last_flush = [0.0]
+
+    structlog.configure(
+        processors=[
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt='iso'),
+            structlog.processors.JSONRenderer(ensure_ascii=False),
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_time = 0.0
+
+    def observe_request(state, route, method, status, elapsed):
+        queries = state.get('sql_queries', 0)
+        sql_time = state.get('sql_time', 0.0)
+
+        REQUEST_LATENCY.observe(elapsed, route, method, str(status))
+        REQUEST_QUERIES.observe(queries, route, method)
+        REQUEST_SQL_TIME.observe(sql_time, route, method)
+
+        log = logger.warning if elapsed >= slow_request_seconds else logger.debug
+        log('request', route=route, method=method, status=status,
+            duration_ms=round(elapsed * 1000, 2), sql_queries=queries,
+            sql_ms=round(sql_time * 1000, 2))
+
+        if metrics_dir and time.perf_counter() - last_flush[0] >= flush_interval:
+            last_flush[0] = time.perf_counter()
+            try:
+                registry.dump(metrics_dir)
+            except OSError as e:
+                logging.getLogger(__name__).warning('Не удалось сохранить метрики: %s', e)
+        return queries, sql_time
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+
+        route = _current_route()
+        method = request.method
+        status = response.status_code
+
+        if response.is_streamed:
+            # Тело потокового ответа (stream_with_context) еще не выполнено: его SQL-запросы
+            # попадут в g позже, поэтому замер - при закрытии ответа, без Server-Timing
+            state = g._get_current_object()
+            response.call_on_close(
+                lambda: observe_request(state, route, method, status, time.perf_counter() - started))
+            return response
+
+        elapsed = time.perf_counter() - started
+        queries, sql_time = observe_request(g, route, method, status, elapsed)
+        response.headers['Server-Timing'] = (
+            f'app;dur={elapsed * 1000:.1f}, sql;dur={sql_time * 1000:.1f};desc="{queries} queries"'
+        )
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(registry.render(metrics_dir),
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    return registry
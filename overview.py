@@ -0,0 +1,212 @@
+"""
+Сводка закредитованного по всем его кредитам одним вызовом.
+
+Для каждой базы с кредитами закредитованного (общая база или шарды его
+кредитодателей) выполняются ровно два запроса: кредиты с итогами платежей
+(GROUP BY) и последние платежи каждого кредита. Число запросов не
+зависит от числа кредитов и платежей.
+
+Ближайший платеж считается по графику равных ежемесячных платежей с
+периодом 30 дней от даты выдачи, как и planned_last_payment_date в
+списке кредитов: внесенная сумма закрывает платежи графика по порядку.
+
+Готовая сводка хранится в кэше процесса ttl секунд вместе с версиями
+закредитованного из таблицы overview_versions каждой базы, где лежат его
+кредиты. Запись платежа или кредита увеличивает версию в той же
+транзакции и той же базе (bump_version), поэтому шарды не ждут общую
+базу, а каждый воркер при следующем запросе видит, что его сводка
+устарела: чтение версии - один запрос по первичному ключу на базу.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from accrual import parse_date
+
+# Период графика платежей в днях (см. calculate_last_payment_date)
+SCHEDULE_PERIOD_DAYS = 30
+
+# Копейки, оставшиеся от округления, не считаются долгом
+EPSILON = 0.005
+
+VERSIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS overview_versions (
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+'''
+
+LOANS_SQL = '''
+    SELECT l.id, l.lender_id, COALESCE(u.full_name, u.username), l.amount, l.interest_rate, l.start_date,
+           l.term_months, l.monthly_payment, l.total_payment, l.created_at,
+           COALESCE(SUM(p.amount), 0), COUNT(p.id), MAX(p.payment_date)
+    FROM loans l
+    JOIN users u ON l.lender_id = u.id
+    LEFT JOIN payments p ON p.loan_id = l.id
+    WHERE l.borrower_id = ?
+    GROUP BY l.id
+'''
+
+# Последние платежи каждого кредита: подзапрос с LIMIT читает по индексу
+# idx_payments_loan_date в обратном порядке только нужные строки, а не все
+# платежи кредита, как ROW_NUMBER() OVER (PARTITION BY loan_id)
+RECENT_PAYMENTS_SQL = '''
+    SELECT p.loan_id, p.id, p.amount, p.payment_date, p.document_path, p.document_name
+    FROM loans l
+    JOIN payments p ON p.id IN (
+        SELECT id FROM payments WHERE loan_id = l.id ORDER BY payment_date DESC, id DESC LIMIT ?
+    )
+    WHERE l.borrower_id = ?
+    ORDER BY p.loan_id, p.payment_date DESC, p.id DESC
+'''
+
+
+def schedule_status(start_date, term_months, monthly_payment, total_payment, total_paid, today):
+    """Ближайший платеж по графику и просрочка
+
+    Возвращает словарь next_due_date, next_due_amount, overdue,
+    overdue_amount, days_overdue. Для погашенного кредита и кредита с
+    неверной датой выдачи next_due_date - None.
+    """
+    status = {'next_due_date': None, 'next_due_amount': 0, 'overdue': False,
+              'overdue_amount': 0, 'days_overdue': 0}
+    start = parse_date(start_date)
+    remaining = total_payment - total_paid
+    if start is None or remaining <= EPSILON or monthly_payment <= 0 or term_months <= 0:
+        return status
+
+    # Платежи графика, полностью закрытые внесенной суммой; остаток от
+    # округления ежемесячного платежа доплачивается в последнюю дату
+    covered = min(int((total_paid + EPSILON) // monthly_payment), term_months)
+    installment = min(covered + 1, term_months)
+    due_date = start + timedelta(days=SCHEDULE_PERIOD_DAYS * installment)
+    if installment == term_months:
+        due_amount = remaining
+    else:
+        due_amount = min(monthly_payment * installment - total_paid, remaining)
+
+    # Сколько платежей графика уже должно быть внесено на сегодня
+    due_count = min(max((today - start).days // SCHEDULE_PERIOD_DAYS, 0), term_months)
+    expected = total_payment if due_count == term_months else monthly_payment * due_count
+    overdue_amount = max(expected - total_paid, 0)
+
+    status.update({
+        'next_due_date': due_date.isoformat(),
+        'next_due_amount': round(due_amount),
+        'overdue': due_date < today and overdue_amount > EPSILON,
+    })
+    if status['overdue']:
+        status['overdue_amount'] = round(overdue_amount)
+        status['days_overdue'] = (today - due_date).days
+    return status
+
+
+def build_overview(connections, borrower_id, today, recent_limit=3):
+    """Сводка по кредитам закредитованного из всех его баз
+
+    connections - открытые соединения (закрывает вызывающий). Кредиты
+    отсортированы по дате ближайшего платежа, погашенные - в конце.
+    """
+    loans = []
+    for conn in connections:
+        recent = {}
+        for row in conn.execute(RECENT_PAYMENTS_SQL, (recent_limit, borrower_id)):
+            recent.setdefault(row[0], []).append({
+                'id': row[1],
+                'amount': round(row[2] or 0),
+                'payment_date': row[3],
+                'document_path': row[4],
+                'document_name': row[5],
+            })
+
+        for row in conn.execute(LOANS_SQL, (borrower_id,)):
+            (loan_id, lender_id, lender_name, amount, interest_rate, start_date, term_months,
+             monthly_payment, total_payment, created_at, total_paid, payments_count, last_payment_date) = row
+            amount = amount or 0
+            monthly_payment = monthly_payment or 0
+            total_payment = total_payment or 0
+            loan = {
+                'id': loan_id,
+                'lender_id': lender_id,
+                'lender_name': lender_name,
+                'amount': round(amount),
+                'interest_rate': interest_rate,
+                'start_date': start_date,
+                'term_months': term_months,
+                'monthly_payment': round(monthly_payment),
+                'total_payment': round(total_payment),
+                'created_at': created_at,
+                'total_paid': round(total_paid),
+                'remaining_amount': round(max(total_payment - total_paid, 0)),
+                'progress_percent': round(total_paid / total_payment * 100, 1) if total_payment > 0 else 0,
+                'payments_count': payments_count,
+                'last_payment_date': last_payment_date,
+            }
+            loan.update(schedule_status(start_date, term_months or 0, monthly_payment, total_payment,
+                                        total_paid, today))
+            loan['recent_payments'] = recent.get(loan_id, [])
+            loans.append(loan)
+
+    loans.sort(key=lambda loan: (loan['next_due_date'] is None, loan['next_due_date'] or '', loan['id']))
+    upcoming = [loan['next_due_date'] for loan in loans if loan['next_due_date']]
+    return {
+        'as_of': today.isoformat(),
+        'loans_count': len(loans),
+        'total_remaining': sum(loan['remaining_amount'] for loan in loans),
+        'overdue_count': sum(1 for loan in loans if loan['overdue']),
+        'overdue_amount': sum(loan['overdue_amount'] for loan in loans),
+        'next_due_date': min(upcoming) if upcoming else None,
+        'loans': loans,
+    }
+
+
+def read_version(conn, user_id):
+    """Текущая версия сводки закредитованного (0, если записей еще не было)"""
+    row = conn.execute('SELECT version FROM overview_versions WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(conn, user_id):
+    """Сбрасывает сводку закредитованного во всех воркерах (до commit транзакции изменения)"""
+    conn.execute('''
+        INSERT INTO overview_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1
+    ''', (user_id,))
+
+
+class OverviewCache:
+    """Готовые сводки по user_id на ttl секунд, действительные для своей версии
+
+    put получает версии баз, прочитанные до построения сводки: если во время
+    построения версия выросла, следующий get с новой версией запись не
+    вернет.
+    """
+
+    def __init__(self, ttl=10.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] != version or now - entry[2] >= self.ttl:
+                del self._entries[user_id]
+                return None
+            return entry[0]
+
+    def put(self, user_id, overview, version):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (overview, version, time.time())
+            # Истекшие записи удаляются, когда кэш разрастается
+            if len(self._entries) > 1024:
+                self._expire(time.time())
+
+    def _expire(self, now):
+        for key in [key for key, entry in self._entries.items() if now - entry[2] >= self.ttl]:
+            del self._entries[key]
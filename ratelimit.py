@@ -0,0 +1,257 @@
+"""
+Ограничение частоты запросов по алгоритму token bucket.
+
+Состояние корзин хранится в общем для всех воркеров gunicorn хранилище:
+    sqlite:///ratelimit.db   - файл SQLite (WAL + mmap) для одного хоста
+    redis://host:6379/0      - Redis для нескольких хостов
+    memory://                - словарь в памяти процесса (разработка, тесты)
+
+Лимиты задаются строками вида "5/minute", "100/hour", "10/second":
+емкость корзины равна числу запросов, скорость пополнения - числу
+запросов за период. Лимит "0/..." не поддерживается: чтобы отключить
+проверку области, оставьте значение пустым.
+
+Корзина, не использованная дольше своего периода, снова полна и ничем не
+отличается от отсутствующей, поэтому RateLimiter раз в sweep_seconds
+удаляет такие корзины из хранилища. Корзины в памяти процесса
+дополнительно ограничены числом max_keys.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+LIMIT_RE = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(second|minute|hour|day)s?\s*$')
+
+
+class RateLimit:
+    """Параметры корзины: емкость и скорость пополнения в токенах в секунду"""
+
+    __slots__ = ('capacity', 'rate', 'period', 'text')
+
+    def __init__(self, text):
+        match = LIMIT_RE.match(text)
+        if not match:
+            raise ValueError(f'Неверный формат лимита: {text!r}')
+        count, period = int(match.group(1)), match.group(2)
+        if count < 1:
+            raise ValueError(f'Лимит должен разрешать хотя бы один запрос: {text!r}')
+        self.capacity = count
+        self.rate = count / PERIODS[period]
+        self.period = PERIODS[period]
+        self.text = text
+
+    def __repr__(self):
+        return f'RateLimit({self.text!r})'
+
+
+def take_token(tokens, updated, now, limit):
+    """Пополняет корзину и пытается взять токен
+
+    Возвращает (разрешено, новое число токенов, секунд до следующего токена).
+    """
+    tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / limit.rate
+
+
+class MemoryStore:
+    """Корзины в памяти процесса, каждый воркер считает отдельно
+
+    Словарь упорядочен по последнему обращению: при превышении max_keys
+    удаляются самые давно использованные корзины.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+            allowed, tokens, retry_after = take_token(tokens, updated, now, limit)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                del self._buckets[next(iter(self._buckets))]
+        return allowed, tokens, retry_after
+
+    def sweep(self, older_than):
+        """Удаляет давно не использованные корзины"""
+        with self._lock:
+            for key in [key for key, (_, updated) in self._buckets.items() if updated < older_than]:
+                del self._buckets[key]
+
+
+class SQLiteStore:
+    """Корзины в отдельном файле SQLite, общем для воркеров одного хоста
+
+    Состояние одноразовое, поэтому запись идет без fsync (synchronous=OFF),
+    а чтение - через mmap. Соединение открывается на поток.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # После fork соединение родителя использовать нельзя
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('PRAGMA mmap_size=8388608')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, limit, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (limit.capacity, now)
+            allowed, tokens, retry_after = take_token(tokens, updated, now, limit)
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens, retry_after
+
+    def sweep(self, older_than):
+        """Удаляет давно не использованные корзины"""
+        self._connect().execute('DELETE FROM rate_buckets WHERE updated < ?', (older_than,))
+
+
+# Атомарная версия take_token для Redis
+REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisStore:
+    """Корзины в Redis: одна атомарная Lua-операция на проверку"""
+
+    def __init__(self, url):
+        import redis  # Необязательная зависимость, нужна только в этом режиме
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+
+    def hit(self, key, limit, now):
+        allowed, tokens = self.script(keys=['ratelimit:' + key], args=[limit.capacity, limit.rate, now])
+        tokens = float(tokens)
+        retry_after = 0.0 if allowed else (1 - tokens) / limit.rate
+        return bool(allowed), tokens, retry_after
+
+    def sweep(self, older_than):
+        """Корзины удаляет сам Redis по EXPIRE"""
+
+
+def parse_limits(limits):
+    """{имя: {область: RateLimit}} из строк; пустые значения отключают область"""
+    return {
+        name: {scope: RateLimit(text) for scope, text in scopes.items() if text}
+        for name, scopes in limits.items()
+    }
+
+
+def create_store(url):
+    """Создает хранилище корзин по URL"""
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    if url.startswith('memory://'):
+        return MemoryStore()
+    raise ValueError(f'Неизвестное хранилище лимитов: {url}')
+
+
+class RateLimiter:
+    """Набор именованных лимитов поверх общего хранилища
+
+    limits - словарь {имя: {'ip': '10/minute', 'user': '5/minute'}}.
+    При недоступности хранилища запрос пропускается (fail open),
+    чтобы сбой Redis не останавливал приложение.
+    """
+
+    def __init__(self, store, limits, sweep_seconds=600):
+        self.store = store
+        self.limits = parse_limits(limits)
+        self.sweep_seconds = sweep_seconds
+        # Корзина старше самого длинного периода уже снова полна
+        self.idle_seconds = max((limit.period for scopes in self.limits.values() for limit in scopes.values()),
+                                default=0)
+        self._swept_at = time.time()
+
+    def sweep(self, now):
+        """Удаляет корзины, которые успели полностью пополниться"""
+        self._swept_at = now
+        try:
+            self.store.sweep(now - self.idle_seconds)
+        except Exception as e:
+            logger.warning('Не удалось очистить хранилище лимитов: %s', e)
+
+    def check(self, name, identities):
+        """Проверяет все корзины лимита
+
+        identities - словарь {область: идентификатор}, например
+        {'ip': '10.0.0.1', 'user': '42'}. Возвращает (разрешено,
+        секунд до повтора, минимальный остаток токенов).
+        """
+        scopes = self.limits.get(name)
+        if not scopes:
+            return True, 0.0, None
+
+        now = time.time()
+        allowed = True
+        retry_after = 0.0
+        remaining = None
+        for scope, limit in scopes.items():
+            identity = identities.get(scope)
+            if identity is None:
+                continue
+            try:
+                ok, tokens, wait = self.store.hit(f'{name}:{scope}:{identity}', limit, now)
+            except Exception as e:
+                logger.warning('Хранилище лимитов недоступно, запрос пропущен: %s', e)
+                return True, 0.0, None
+            if not ok:
+                allowed = False
+                retry_after = max(retry_after, wait)
+            remaining = int(tokens) if remaining is None else min(remaining, int(tokens))
+        
+        # Ключи включают IP и имя пользователя при входе: без очистки хранилище растет бесконечно
+        if now - self._swept_at > self.sweep_seconds:
+            self.sweep(now)
+        return allowed, retry_after, remaining
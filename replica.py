@@ -0,0 +1,153 @@
+"""
+Снимок базы только для чтения для списков и отчетов.
+
+Снимок периодически копируется из основной базы через online backup API
+SQLite порциями по pages страниц с паузой между ними, поэтому запись в
+основную базу не ждет окончания копирования. Запись в базу с журналом
+отката перезапускает копию; после max_restarts перезапусков копия
+делается за один шаг (backup.backup_database), так что под постоянной
+записью обновление все равно завершается. Готовый файл подменяется
+атомарно (os.replace), открытые на чтение соединения продолжают читать
+предыдущий снимок.
+
+Время снимка - момент начала копирования, оно записывается в mtime
+файла и одинаково видно всем воркерам. Чтение идет из снимка, только
+если он не старше max_staleness секунд и не старше последней записи
+пользователя (read-your-writes), иначе из основной базы.
+
+Обновить снимок вручную или отдельным процессом:
+    python -m replica refresh
+    python -m replica refresh --loop
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from backup import backup_database
+
+try:
+    import fcntl  # Блокировка, чтобы снимок обновлял один воркер (только POSIX)
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotReplica:
+    """Снимок основной базы и его периодическое обновление"""
+
+    def __init__(self, source_path, replica_path, max_staleness=30.0, refresh_interval=10.0,
+                 pages_per_step=256, step_sleep=0.005, max_restarts=3, factory=sqlite3.Connection,
+                 on_refresh=None):
+        self.source_path = source_path
+        self.replica_path = replica_path
+        self.max_staleness = max_staleness
+        self.refresh_interval = refresh_interval
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.factory = factory
+        self.on_refresh = on_refresh
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def snapshot_at(self):
+        """Время снимка (unix time) или None, если снимка еще нет"""
+        try:
+            return os.stat(self.replica_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def age(self):
+        snapshot_at = self.snapshot_at()
+        return None if snapshot_at is None else time.time() - snapshot_at
+
+    def connect(self, min_snapshot_at=0.0):
+        """Соединение только для чтения со снимком или None
+
+        None возвращается, если снимка нет, он старше max_staleness или
+        сделан раньше min_snapshot_at (последней записи пользователя).
+        """
+        snapshot_at = self.snapshot_at()
+        if snapshot_at is None:
+            return None
+        if time.time() - snapshot_at > self.max_staleness or snapshot_at < min_snapshot_at:
+            return None
+        return sqlite3.connect(f'file:{self.replica_path}?mode=ro', uri=True, factory=self.factory)
+
+    def refresh(self):
+        """Копирует основную базу в снимок, возвращает длительность в секундах"""
+        started_at = time.time()
+        started = time.perf_counter()
+        tmp_path = f'{self.replica_path}.{os.getpid()}.tmp'
+        backup_database(self.source_path, tmp_path, self.pages_per_step, self.step_sleep, self.max_restarts)
+        # Время начала копирования: снимок не содержит записей позже этого момента
+        os.utime(tmp_path, (started_at, started_at))
+        os.replace(tmp_path, self.replica_path)
+        duration = time.perf_counter() - started
+        if self.on_refresh is not None:
+            self.on_refresh(duration)
+        return duration
+
+    def refresh_if_due(self):
+        """Обновляет снимок, если он устарел и его не обновляет другой процесс"""
+        with open(self.replica_path + '.lock', 'w') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            try:
+                age = self.age()
+                if age is not None and age < self.refresh_interval:
+                    return None
+                return self.refresh()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def ensure_refreshing(self):
+        """Запускает фоновое обновление снимка в текущем процессе"""
+        with self._lock:
+            # После fork поток родителя в воркере не существует
+            if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._refresh_loop, name='replica-refresh', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.refresh_if_due()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning('Не удалось обновить снимок базы: %s', e)
+            time.sleep(max(self.refresh_interval / 2, 0.5))
+
+
+def main():
+    from app import app, get_replica
+
+    parser = argparse.ArgumentParser(description='Снимок базы только для чтения')
+    sub = parser.add_subparsers(dest='command', required=True)
+    refresh = sub.add_parser('refresh', help='Обновить снимок')
+    refresh.add_argument('--loop', action='store_true', help='Обновлять каждые REPLICA_REFRESH_SECONDS')
+    args = parser.parse_args()
+
+    replica = get_replica(start_refresh=False)
+    if replica is None:
+        parser.error('Снимок отключен: REPLICA_ENABLED=false или включено шардирование')
+    while True:
+        duration = replica.refresh()
+        print(f'Снимок {replica.replica_path} обновлен за {duration * 1000:.1f} мс')
+        if not args.loop:
+            break
+        time.sleep(app.config['REPLICA_REFRESH_SECONDS'])
+
+
+if __name__ == '__main__':
+    main()
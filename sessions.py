@@ -0,0 +1,320 @@
+"""
+Серверные сессии вместо подписанных cookie.
+
+В cookie хранится только случайный идентификатор сессии и номер версии
+("<sid>.<версия>"), данные сессии - в хранилище:
+    sqlite:///sessions.db   - таблица sessions в файле SQLite (по умолчанию)
+    redis://host:6379/0     - Redis для нескольких хостов
+    memory://               - словарь в памяти процесса (разработка, тесты)
+    cookie                  - прежние подписанные cookie Flask (без отзыва)
+
+В хранилище идентификатор записывается хэшем, поэтому копия базы не дает
+доступа к сессиям. Прочитанные сессии кэшируются в процессе; версия из
+cookie увеличивается при каждом изменении сессии, и кэш другого воркера
+с устаревшей версией не используется. Отзыв сессий пользователя
+(revoke_user) виден в текущем процессе сразу, в остальных - не позже
+cache_seconds.
+"""
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Сессия, данные которой лежат в хранилище"""
+
+    def __init__(self, initial=None, sid=None, version=0, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.expires_at = expires_at
+        self.loaded_user_id = self.get('user_id')
+        self.modified = False
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class MemorySessionStore:
+    """Сессии в памяти процесса, каждый воркер видит только свои"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def set(self, key, user_id, data, version, expires_at):
+        with self._lock:
+            self._sessions[key] = (user_id, data, version, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            keys = [key for key, row in self._sessions.items() if row[0] == user_id]
+            for key in keys:
+                del self._sessions[key]
+        return len(keys)
+
+    def sweep(self, now):
+        with self._lock:
+            keys = [key for key, row in self._sessions.items() if row[3] < now]
+            for key in keys:
+                del self._sessions[key]
+        return len(keys)
+
+
+class SQLiteSessionStore:
+    """Сессии в отдельном файле SQLite, общем для воркеров одного хоста
+
+    Индекс по user_id нужен для отзыва всех сессий пользователя, по
+    expires_at - для удаления истекших. Соединение открывается на поток.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # После fork соединение родителя использовать нельзя.
+            # Файл и таблица создаются при первом обращении, а не при импорте приложения
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA mmap_size=8388608')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_key TEXT PRIMARY KEY,
+                    user_id INTEGER,
+                    data TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    expires_at REAL NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT user_id, data, version, expires_at FROM sessions WHERE session_key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2], row[3]
+
+    def set(self, key, user_id, data, version, expires_at):
+        self._connect().execute('''
+            INSERT OR REPLACE INTO sessions (session_key, user_id, data, version, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (key, user_id, json.dumps(data, ensure_ascii=False), version, expires_at))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM sessions WHERE session_key = ?', (key,))
+
+    def revoke_user(self, user_id):
+        return self._connect().execute('DELETE FROM sessions WHERE user_id = ?', (user_id,)).rowcount
+
+    def sweep(self, now):
+        return self._connect().execute('DELETE FROM sessions WHERE expires_at < ?', (now,)).rowcount
+
+
+class RedisSessionStore:
+    """Сессии в Redis: истекают по TTL ключа, сессии пользователя - в отдельном множестве"""
+
+    PREFIX = 'friendly_loan:session:'
+    USER_PREFIX = 'friendly_loan:user_sessions:'
+
+    def __init__(self, url):
+        import redis  # Необязательная зависимость, нужна только в этом режиме
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        value = self.client.get(self.PREFIX + key)
+        if value is None:
+            return None
+        row = json.loads(value)
+        return row['user_id'], row['data'], row['version'], row['expires_at']
+
+    def set(self, key, user_id, data, version, expires_at):
+        ttl = max(1, int(expires_at - time.time()) + 1)
+        value = json.dumps({'user_id': user_id, 'data': data, 'version': version, 'expires_at': expires_at},
+                           ensure_ascii=False)
+        pipe = self.client.pipeline()
+        pipe.set(self.PREFIX + key, value, ex=ttl)
+        if user_id is not None:
+            pipe.sadd(self.USER_PREFIX + str(user_id), key)
+            pipe.expire(self.USER_PREFIX + str(user_id), ttl)
+        pipe.execute()
+
+    def delete(self, key):
+        self.client.delete(self.PREFIX + key)
+
+    def revoke_user(self, user_id):
+        user_key = self.USER_PREFIX + str(user_id)
+        keys = self.client.smembers(user_key)
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.delete(self.PREFIX + key.decode('ascii'))
+        pipe.delete(user_key)
+        pipe.execute()
+        return len(keys)
+
+    def sweep(self, now):
+        return 0
+
+
+def create_session_store(url):
+    """Создает хранилище сессий по URL"""
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisSessionStore(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):])
+    if url.startswith('memory://'):
+        return MemorySessionStore()
+    raise ValueError(f'Неизвестное хранилище сессий: {url}')
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask SessionInterface поверх хранилища сессий с кэшем в процессе
+
+    Сессия записывается в хранилище только при изменении и при продлении
+    (не чаще раза в touch_seconds), обычный запрос обходится чтением из
+    кэша.
+    """
+
+    def __init__(self, store, cache_seconds=5.0, sweep_seconds=600.0, touch_seconds=3600.0):
+        self.store = store
+        self.cache_seconds = cache_seconds
+        self.sweep_seconds = sweep_seconds
+        self.touch_seconds = touch_seconds
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._swept_at = time.time()
+
+    @staticmethod
+    def _key(sid):
+        return hashlib.blake2b(sid.encode('ascii'), digest_size=20).hexdigest()
+
+    def _load(self, key, version, now):
+        with self._cache_lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            user_id, data, cached_version, expires_at, cached_at = cached
+            if cached_version == version and now - cached_at < self.cache_seconds:
+                return data, cached_version, expires_at
+        row = self.store.get(key)
+        if row is None:
+            with self._cache_lock:
+                self._cache.pop(key, None)
+            return None
+        user_id, data, stored_version, expires_at = row
+        with self._cache_lock:
+            self._cache[key] = (user_id, data, stored_version, expires_at, now)
+        return data, stored_version, expires_at
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value:
+            return ServerSession()
+        sid, _, version = value.partition('.')
+        try:
+            version = int(version)
+        except ValueError:
+            return ServerSession()
+        now = time.time()
+        loaded = self._load(self._key(sid), version, now)
+        if loaded is None or loaded[2] < now:
+            return ServerSession()
+        data, stored_version, expires_at = loaded
+        return ServerSession(dict(data), sid=sid, version=stored_version, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                self._forget(self._key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        now = time.time()
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        user_id = session.get('user_id')
+        if session.sid is None or user_id != session.loaded_user_id:
+            # Новый идентификатор при входе: защита от фиксации сессии
+            if session.sid is not None:
+                self._forget(self._key(session.sid))
+            session.sid = secrets.token_urlsafe(32)
+            session.version = 0
+        elif not session.modified and session.expires_at - now > lifetime - self.touch_seconds:
+            return
+
+        if session.modified:
+            session.version += 1
+        expires_at = now + lifetime
+        key = self._key(session.sid)
+        data = dict(session)
+        self.store.set(key, user_id, data, session.version, expires_at)
+        with self._cache_lock:
+            self._cache[key] = (user_id, data, session.version, expires_at, now)
+
+        response.set_cookie(name, f'{session.sid}.{session.version}',
+                            expires=expires_at if session.permanent else None,
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+        if now - self._swept_at > self.sweep_seconds:
+            self._swept_at = now
+            self.store.sweep(now)
+            with self._cache_lock:
+                for key in [key for key, entry in self._cache.items() if entry[3] < now]:
+                    del self._cache[key]
+
+    def _forget(self, key):
+        self.store.delete(key)
+        with self._cache_lock:
+            self._cache.pop(key, None)
+
+    def revoke_user(self, user_id):
+        """Удаляет все сессии пользователя, возвращает их число"""
+        with self._cache_lock:
+            for key in [key for key, entry in self._cache.items() if entry[0] == user_id]:
+                del self._cache[key]
+        return self.store.revoke_user(user_id)
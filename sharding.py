@@ -0,0 +1,225 @@
+"""
+Хранение кредитов и платежей в отдельном файле SQLite на каждого кредитодателя.
+
+Глобальная база (DATABASE_URL) хранит пользователей, журнал событий и
+таблицу borrower_lenders (у каких кредитодателей есть кредиты
+закредитованного). Кредиты и платежи кредитодателя лежат в
+SHARD_DIR/lender_<id>.db, поэтому запись одного кредитодателя не
+блокирует остальных.
+
+Маршрутизация не требует обращений к глобальной базе: id кредитов и
+платежей в шарде начинаются с lender_id << SHARD_ID_BITS, и шард
+определяется сдвигом id. Глобальная база подключается к шарду через
+ATTACH, поэтому запросы с JOIN users работают без изменений.
+
+Перенос существующих данных и запросы ко всем шардам:
+    python -m sharding migrate
+    python -m sharding stats
+    python -m sharding query "SELECT COUNT(*) FROM payments"
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+
+# Младшие биты id - локальный номер в шарде, старшие - id кредитодателя
+SHARD_ID_BITS = 32
+
+SHARD_FILE_RE = re.compile(r'^lender_(\d+)\.db$')
+
+# Колонки переносятся по именам: в старых базах порядок колонок другой из-за ALTER TABLE
+LOAN_COLUMNS = ('id', 'lender_id', 'borrower_id', 'amount', 'interest_rate', 'start_date',
+                'term_months', 'monthly_payment', 'total_payment', 'created_at')
+PAYMENT_COLUMNS = ('id', 'loan_id', 'amount', 'payment_date', 'document_path', 'document_name', 'created_at')
+LEDGER_COLUMNS = ('seq', 'loan_id', 'lender_id', 'borrower_id', 'event_type', 'payment_id', 'paid_delta',
+                  'count_delta', 'total_payment', 'effective_date', 'recorded_at')
+CHECKPOINT_COLUMNS = ('loan_id', 'seq', 'recorded_at', 'total_payment', 'total_paid', 'payments_count', 'deleted')
+
+
+def id_base(lender_id):
+    """Первое значение id кредитов и платежей в шарде кредитодателя"""
+    return lender_id << SHARD_ID_BITS
+
+
+def lender_for_id(record_id):
+    """Кредитодатель, в шарде которого хранится кредит или платеж"""
+    return record_id >> SHARD_ID_BITS
+
+
+class ShardRouter:
+    """Открывает соединения с шардами кредитодателей
+
+    schema - список CREATE TABLE для таблиц шарда (loans, payments).
+    """
+
+    def __init__(self, global_path, shard_dir, schema, factory=sqlite3.Connection):
+        self.global_path = os.path.abspath(global_path)
+        self.shard_dir = shard_dir
+        self.schema = schema
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._schema_checked = set()
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def shard_path(self, lender_id):
+        return os.path.join(self.shard_dir, f'lender_{int(lender_id)}.db')
+
+    def shard_ids(self):
+        """id кредитодателей, у которых уже есть шард"""
+        ids = []
+        for name in os.listdir(self.shard_dir):
+            match = SHARD_FILE_RE.match(name)
+            if match:
+                ids.append(int(match.group(1)))
+        return sorted(ids)
+
+    def connect(self, lender_id, create=True):
+        """Соединение с шардом и подключенной глобальной базой
+
+        При create=False для несуществующего шарда возвращает None: так
+        произвольный id из URL не создает новых файлов.
+        """
+        path = self.shard_path(lender_id)
+        if not os.path.exists(path):
+            if not create:
+                return None
+            self._create(lender_id, path)
+        conn = sqlite3.connect(path, factory=self.factory)
+        if lender_id not in self._schema_checked:
+            # Шарды, созданные старой версией, получают новые таблицы схемы
+            for statement in self.schema:
+                conn.execute(statement)
+            conn.commit()
+            self._schema_checked.add(lender_id)
+        conn.execute('ATTACH DATABASE ? AS global_db', (self.global_path,))
+        return conn
+
+    def _create(self, lender_id, path):
+        """Создает шард во временном файле и атомарно публикует его
+
+        os.link не перезаписывает существующий файл, поэтому при гонке
+        воркеров побеждает первый, а остальные используют его шард.
+        """
+        with self._lock:
+            if os.path.exists(path):
+                return
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            conn = sqlite3.connect(tmp_path)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                for statement in self.schema:
+                    conn.execute(statement)
+                base = id_base(lender_id)
+                conn.executemany('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)',
+                                 [('loans', base), ('payments', base)])
+                conn.commit()
+            finally:
+                conn.close()
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.unlink(tmp_path)
+
+    def fan_out(self, sql, params=(), lender_ids=None):
+        """Выполняет запрос в каждом шарде, возвращает [(lender_id, строки)]"""
+        results = []
+        for lender_id in (self.shard_ids() if lender_ids is None else lender_ids):
+            conn = self.connect(lender_id, create=False)
+            if conn is None:
+                continue
+            try:
+                results.append((lender_id, conn.execute(sql, params).fetchall()))
+            finally:
+                conn.close()
+        return results
+
+
+def migrate(router, global_conn):
+    """Переносит кредиты и платежи из глобальной базы в шарды
+
+    id получают префикс шарда (id_base(lender_id) + старый id), ссылки
+    платежей на кредиты переписываются. Журнал изменений копируется в шард
+    с теми же новыми id; в глобальной базе его копия остается (журнал
+    только дополняется). Выполнять при остановленном приложении.
+    """
+    lenders = [row[0] for row in global_conn.execute('SELECT DISTINCT lender_id FROM loans WHERE lender_id IS NOT NULL')]
+    loan_columns = ', '.join(LOAN_COLUMNS)
+    payment_columns = ', '.join(PAYMENT_COLUMNS)
+    moved = {}
+    for lender_id in lenders:
+        base = id_base(lender_id)
+        loans = global_conn.execute(f'SELECT {loan_columns} FROM loans WHERE lender_id = ?', (lender_id,)).fetchall()
+        payments = global_conn.execute(f'''
+            SELECT {', '.join('p.' + column for column in PAYMENT_COLUMNS)}
+            FROM payments p JOIN loans l ON p.loan_id = l.id WHERE l.lender_id = ?
+        ''', (lender_id,)).fetchall()
+
+        shard = router.connect(lender_id)
+        try:
+            # Старые id меньше 2**SHARD_ID_BITS, поэтому сумма с базой шарда не пересекается с другими шардами
+            shard.executemany(f'INSERT INTO main.loans ({loan_columns}) VALUES ({",".join("?" * len(LOAN_COLUMNS))})',
+                              [(base + loan[0],) + tuple(loan[1:]) for loan in loans])
+            shard.executemany(f'INSERT INTO main.payments ({payment_columns}) VALUES ({",".join("?" * len(PAYMENT_COLUMNS))})',
+                              [(base + p[0], base + p[1]) + tuple(p[2:]) for p in payments])
+
+            events = global_conn.execute(f'SELECT {", ".join(LEDGER_COLUMNS)} FROM ledger_events WHERE lender_id = ?',
+                                         (lender_id,)).fetchall()
+            shard.executemany(f'INSERT INTO main.ledger_events ({", ".join(LEDGER_COLUMNS)}) VALUES ({",".join("?" * len(LEDGER_COLUMNS))})',
+                              [(base + e[0], base + e[1]) + tuple(e[2:5]) + (None if e[5] is None else base + e[5],) + tuple(e[6:])
+                               for e in events])
+            checkpoints = global_conn.execute(f'''
+                SELECT {", ".join(CHECKPOINT_COLUMNS)} FROM ledger_checkpoints
+                WHERE loan_id IN (SELECT DISTINCT loan_id FROM ledger_events WHERE lender_id = ?)
+            ''', (lender_id,)).fetchall()
+            shard.executemany(f'INSERT INTO main.ledger_checkpoints ({", ".join(CHECKPOINT_COLUMNS)}) VALUES ({",".join("?" * len(CHECKPOINT_COLUMNS))})',
+                              [(base + c[0], base + c[1]) + tuple(c[2:]) for c in checkpoints])
+            shard.commit()
+        finally:
+            shard.close()
+
+        global_conn.executemany('INSERT OR IGNORE INTO borrower_lenders (borrower_id, lender_id) VALUES (?, ?)',
+                                {(loan[2], lender_id) for loan in loans})
+        global_conn.execute('DELETE FROM payments WHERE loan_id IN (SELECT id FROM loans WHERE lender_id = ?)',
+                            (lender_id,))
+        global_conn.execute('DELETE FROM loans WHERE lender_id = ?', (lender_id,))
+        global_conn.commit()
+        moved[lender_id] = {'loans': len(loans), 'payments': len(payments)}
+    return moved
+
+
+def main():
+    from app import app, get_db_connection, get_shard_router
+
+    parser = argparse.ArgumentParser(description='Шарды кредитодателей')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('migrate', help='Перенести кредиты из глобальной базы в шарды')
+    sub.add_parser('stats', help='Число кредитов, платежей и сумма платежей по шардам')
+    query = sub.add_parser('query', help='Выполнить запрос во всех шардах')
+    query.add_argument('sql')
+    args = parser.parse_args()
+
+    router = get_shard_router()
+    if args.command == 'migrate':
+        conn = get_db_connection()
+        try:
+            result = migrate(router, conn)
+        finally:
+            conn.close()
+        if not app.config['SHARDING_ENABLED']:
+            print('Внимание: SHARDING_ENABLED=false, приложение не будет читать шарды')
+    elif args.command == 'stats':
+        rows = router.fan_out('''
+            SELECT (SELECT COUNT(*) FROM loans), COUNT(*), COALESCE(SUM(amount), 0) FROM payments
+        ''')
+        result = {lender_id: {'loans': r[0][0], 'payments': r[0][1], 'paid_total': r[0][2]} for lender_id, r in rows}
+    else:
+        result = {lender_id: rows for lender_id, rows in router.fan_out(args.sql)}
+    print(json.dumps(result, indent=2, ensure_ascii=False, default=str))
+
+
+if __name__ == '__main__':
+    main()
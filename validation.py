@@ -0,0 +1,203 @@
+"""
+Проверка входных данных запросов по формам из forms.py.
+
+Формы WTForms описывают поля и ограничения, но создание формы на каждый
+запрос (привязка полей, обход цепочек валидаторов, MultiDict) стоит
+десятки микросекунд. compile_form один раз при импорте превращает класс
+формы в Schema: для каждого поля - функция приведения типа и готовые
+проверки (границы чисел, длина строк, скомпилированные регулярные
+выражения). Schema.validate проверяет словарь из JSON или request.form
+за единицы микросекунд и возвращает (значения, None) или
+(None, (поле, сообщение)).
+
+Поддерживаются поля StringField, IntegerField, FloatField, DateField и
+валидаторы Length, NumberRange, Regexp, DataRequired, InputRequired,
+Optional. Неизвестный тип поля или валидатор - ошибка при компиляции, а
+не тихий пропуск проверки.
+
+LazySchema компилирует форму при первой проверке: WTForms (около 20 мс
+импорта) не загружается при импорте app.py, а только в процессе,
+который действительно проверяет запрос.
+"""
+import math
+import re
+from datetime import date, datetime
+
+# Строка длиннее не разбирается как число: float() для нее не вызывается
+MAX_NUMBER_LENGTH = 32
+
+# Разделители разрядов в отформатированных суммах ("1 000 000", неразрывный пробел)
+NUMBER_SPACE_RE = re.compile(r'\s')
+
+
+def parse_number(value):
+    """Число из JSON или строки формы; None для нечисел, bool, NaN и бесконечности"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if not isinstance(value, str) or len(value) > MAX_NUMBER_LENGTH:
+        return None
+    try:
+        number = float(NUMBER_SPACE_RE.sub('', value).replace(',', '.'))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def coerce_int(value):
+    """Целое число; дробное округляется, как в clean_amount"""
+    number = parse_number(value)
+    if number is None or isinstance(number, int):
+        return number
+    return int(round(number))
+
+
+def coerce_float(value):
+    number = parse_number(value)
+    return None if number is None else float(number)
+
+
+def coerce_str(value):
+    return value if isinstance(value, str) else None
+
+
+def date_coercer(formats):
+    """Дата по форматам поля, возвращается строкой YYYY-MM-DD для базы"""
+    iso = '%Y-%m-%d' in formats
+    def coerce(value):
+        if not isinstance(value, str) or len(value) > MAX_NUMBER_LENGTH:
+            return None
+        value = value.strip()
+        if iso:
+            # Быстрый путь: date.fromisoformat в разы быстрее strptime
+            try:
+                return date.fromisoformat(value).isoformat()
+            except ValueError:
+                pass
+        for date_format in formats:
+            try:
+                return datetime.strptime(value, date_format).date().isoformat()
+            except ValueError:
+                continue
+        return None
+    return coerce
+
+
+def range_check(minimum, maximum):
+    if minimum is None:
+        return lambda value: value <= maximum
+    if maximum is None:
+        return lambda value: value >= minimum
+    return lambda value: minimum <= value <= maximum
+
+
+def length_check(minimum, maximum):
+    minimum = max(minimum, 0)
+    if maximum < 0:
+        return lambda value: len(value) >= minimum
+    return lambda value: minimum <= len(value) <= maximum
+
+
+class Schema:
+    """Скомпилированная форма: кортеж полей (имя, обязательное, приведение, фильтры, проверки, сообщение)"""
+
+    __slots__ = ('form_class', 'fields')
+
+    def __init__(self, form_class, fields):
+        self.form_class = form_class
+        self.fields = fields
+
+    def validate(self, data):
+        """Проверяет словарь data: (значения, None) или (None, (поле, сообщение))"""
+        values = {}
+        for name, required, coerce, filters, checks, message in self.fields:
+            value = data.get(name)
+            if value is None or value == '':
+                if required:
+                    return None, (name, message)
+                values[name] = None
+                continue
+            value = coerce(value)
+            if value is None:
+                return None, (name, message)
+            for apply_filter in filters:
+                value = apply_filter(value)
+            for check, check_message in checks:
+                if not check(value):
+                    return None, (name, check_message)
+            values[name] = value
+        return values, None
+
+
+def compile_field(name, unbound):
+    from wtforms import DateField, FloatField, IntegerField, StringField, validators
+
+    field_class = unbound.field_class
+    field_validators = unbound.kwargs.get('validators', unbound.args[1] if len(unbound.args) > 1 else ())
+    if issubclass(field_class, IntegerField):
+        coerce = coerce_int
+    elif issubclass(field_class, FloatField):
+        coerce = coerce_float
+    elif issubclass(field_class, DateField):
+        date_format = unbound.kwargs.get('format', '%Y-%m-%d')
+        coerce = date_coercer([date_format] if isinstance(date_format, str) else list(date_format))
+    elif issubclass(field_class, StringField):
+        coerce = coerce_str
+    else:
+        raise TypeError(f'{name}: тип поля {field_class.__name__} не поддерживается')
+
+    required = True
+    checks = []
+    message = None
+    for validator in field_validators:
+        if isinstance(validator, validators.Optional):
+            required = False
+        elif isinstance(validator, (validators.DataRequired, validators.InputRequired)):
+            pass
+        elif isinstance(validator, validators.NumberRange):
+            checks.append((range_check(validator.min, validator.max), validator.message))
+        elif isinstance(validator, validators.Length):
+            checks.append((length_check(validator.min, validator.max), validator.message))
+        elif isinstance(validator, validators.Regexp):
+            checks.append((validator.regex.match, validator.message))
+        else:
+            raise TypeError(f'{name}: валидатор {type(validator).__name__} не поддерживается')
+        # Первое сообщение поля описывает допустимые значения: оно же для пустого и нечислового ввода
+        message = message or validator.message
+
+    message = message or f'Неверное значение поля {name}'
+    checks = tuple((check, check_message or message) for check, check_message in checks)
+    filters = tuple(unbound.kwargs.get('filters', ()))
+    return name, required, coerce, filters, checks, message
+
+
+def compile_form(form_class):
+    """Schema по классу формы WTForms"""
+    unbound_fields = []
+    for name in dir(form_class):
+        value = getattr(form_class, name)
+        if not name.startswith('_') and getattr(value, '_formfield', False):
+            unbound_fields.append((value.creation_counter, name, value))
+    unbound_fields.sort()
+    return Schema(form_class, tuple(compile_field(name, unbound) for _, name, unbound in unbound_fields))
+
+
+class LazySchema:
+    """Schema формы forms.<form_name>, скомпилированная при первой проверке"""
+
+    __slots__ = ('form_name', '_schema')
+
+    def __init__(self, form_name):
+        self.form_name = form_name
+        self._schema = None
+
+    def validate(self, data):
+        schema = self._schema
+        if schema is None:
+            # Повторная компиляция в соседнем потоке безвредна: результат тот же
+            import forms
+            schema = self._schema = compile_form(getattr(forms, self.form_name))
+        return schema.validate(data)
@@ -3,6 +3,10 @@
 WSGI entry point for production deployment
 """
 import os
+import time
+
+BOOT_STARTED = time.perf_counter()
+
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -11,10 +15,14 @@ load_dotenv()
 # Set environment
 os.environ.setdefault('FLASK_ENV', 'production')
 
-from app import app, init_db
+from app import create_app
+
+# Initialize database once (safe with gunicorn --preload)
+app = create_app()
 
-# Initialize database on startup
-init_db()
+# Time spent importing and initializing the application in this process
+BOOT_SECONDS = time.perf_counter() - BOOT_STARTED
+app.logger.info('WSGI app loaded in %.1f ms', BOOT_SECONDS * 1000)
 
 if __name__ == "__main__":
     app.run()